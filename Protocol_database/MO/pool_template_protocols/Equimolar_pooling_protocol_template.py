@@ -11,8 +11,8 @@ import sys
 sys.path.append("O:/")
 sys.path.append("/mnt/c/Program files/Opentrons")
 #### Import mollab protocol module
-from data.user_storage.mollab_modules import Pipetting_Modules_V1_2 as PM
-from data.user_storage.mollab_modules import LabWare as LW
+from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
+from data.user_storage.mollab_modules import LabWare_v2 as LW
 # =============================================================================
 
 # TEMPLATE DATA================================================================
@@ -61,7 +61,7 @@ def add_parameters(parameters: protocol_api.Parameters):
                            {"display_name": "G", "value": "G"},
                            {"display_name": "H", "value": "H"}
                            ],
-                       default="H")
+                       default="A")
     parameters.add_int(variable_name="starting_tip_p20_column",    
                        display_name="starting tip p20 column",
                        choices=[
@@ -78,7 +78,7 @@ def add_parameters(parameters: protocol_api.Parameters):
                            {"display_name": "11", "value": 11},
                            {"display_name": "12", "value": 12}
                            ],
-                       default=12)
+                       default=1)
     
     parameters.add_str(variable_name="starting_tip_p300_row",    
                        display_name="starting tip p300 row",
@@ -92,7 +92,7 @@ def add_parameters(parameters: protocol_api.Parameters):
                            {"display_name": "G", "value": "G"},
                            {"display_name": "H", "value": "H"}
                            ],
-                       default="H")
+                       default="A")
     parameters.add_int(variable_name="starting_tip_p300_column",    
                        display_name="starting tip p300 column",
                        choices=[
@@ -109,7 +109,7 @@ def add_parameters(parameters: protocol_api.Parameters):
                            {"display_name": "11", "value": 11},
                            {"display_name": "12", "value": 12}
                            ],
-                       default=12)
+                       default=1)
     
     #### Lights/Pause
     parameters.add_bool(variable_name="lights_on",
@@ -158,14 +158,16 @@ def run(protocol: protocol_api.ProtocolContext):
     pool_tube_type, number_of_tubes, max_volume = LW.which_tube_type(total_volume = total_cleanup_volume,
                                                                      tube_type = False)
     
-    # For very large quantities, determine volume to pool per tube
+    # For very large quantities, determine volume to pool per tube. Only the
+    # samples are pooled, they are 1 of the 6 parts of the clean-up volume
+    # (1 part samples, 5 parts PB buffer that is already in the tubes)
     pool_volume_per_tube = total_cleanup_volume / number_of_tubes / 6
     
     #### Calculates how many tips are needed for pipetting all the DNA volumes
     p20_tips_needed, p300_tips_needed = LW.amount_of_tips(volumes = DNA_µL_list,
                                                           number_of_transfers = False,
                                                           tip_change = 1,
-                                                          max_p20_volume = 15)
+                                                          action = 'transferring')
     
     # Calculates how many pipette boxes you need by using the function 'number_of_tipracks'
     tip_racks_p20, P20 = LW.number_of_tipracks(starting_tip = starting_tip_p20,
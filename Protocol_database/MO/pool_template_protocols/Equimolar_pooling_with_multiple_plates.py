@@ -11,8 +11,9 @@ import sys
 sys.path.append("O:/")
 sys.path.append("C:/Program files/Opentrons")
 #### Import mollab protocol module
-from data.user_storage.mollab_modules import Pipetting_Modules_V1_2 as PM
-from data.user_storage.mollab_modules import LabWare as LW
+from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
+from data.user_storage.mollab_modules import LabWare_v2 as LW
+from data.user_storage.mollab_modules import DeckLayout as DL
 # =============================================================================
 
 # TEMPLATE DATA================================================================
@@ -141,14 +142,16 @@ def run(protocol: protocol_api.ProtocolContext):
     pool_tube_type, number_of_tubes, max_volume = LW.which_tube_type(total_volume = total_cleanup_volume,
                                                                      tube_type = False)
     
-    # For very large quantities, determine volume to pool per tube
+    # For very large quantities, determine volume to pool per tube. Only the
+    # samples are pooled, they are 1 of the 6 parts of the clean-up volume
+    # (1 part samples, 5 parts PB buffer that is already in the tubes)
     pool_volume_per_tube = total_cleanup_volume / number_of_tubes / 6
     
     #### Calculates how many tips are needed for pipetting all the DNA volumes
     p20_tips_needed, p300_tips_needed = LW.amount_of_tips(volumes = DNA_µL_list_total,
                                                           number_of_transfers = False,
                                                           tip_change = 1,
-                                                          max_p20_volume = 19)
+                                                          action = 'transferring')
     
     # Calculates how many pipette boxes you need by using the function 'number_of_tipracks'
     tip_racks_p20, P20 = LW.number_of_tipracks(starting_tip = starting_tip_p20,
@@ -206,7 +209,19 @@ def run(protocol: protocol_api.ProtocolContext):
     
     total_sources = []
     plate_number = 0
-    possible_deck_positions = [1,3,4,5,6,9]
+    # Slots of the source plates: the plates with the most samples closest to
+    # the pool tube and the tip racks
+    plate_names = [f'plate_{number + 1}' for number in range(len(DNA_µL_lists))]
+    traffic = {}
+    for name, plate in zip(plate_names, DNA_µL_lists):
+        traffic[(name, 'pool_tube')] = len(plate)
+        traffic[(name, 'tips')] = len(plate)
+    layout = DL.solving_deck_layout(labware = {name: 1 for name in plate_names},
+                                    traffic = traffic,
+                                    fixed_slots = {'pool_tube': [2],
+                                                   'tips': [7, 8, 10, 11]},
+                                    available_slots = [1, 3, 4, 5, 6, 9],
+                                    protocol = protocol)
     # Loading source plates
     for plate in DNA_µL_lists:
         plate_number += 1
@@ -214,7 +229,7 @@ def run(protocol: protocol_api.ProtocolContext):
                                              tube_type = 'plate_96_NIOZholder', 
                                              reagent_type = f'plate_{plate_number}', 
                                              amount = 1, 
-                                             deck_positions = [possible_deck_positions[plate_number-1]], 
+                                             deck_positions = layout[f'plate_{plate_number}'], 
                                              protocol = protocol)
     
         # Loading source wells on plate 1
@@ -11,8 +11,8 @@ import sys
 sys.path.append("O:/")
 sys.path.append("/mnt/c/Program files/Opentrons")
 #### Import mollab protocol module
-from data.user_storage.mollab_modules import Pipetting_Modules_V1_2 as PM
-from data.user_storage.mollab_modules import LabWare as LW
+from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
+from data.user_storage.mollab_modules import LabWare_v2 as LW
 # =============================================================================
 
 # TEMPLATE DATA================================================================
@@ -66,7 +66,7 @@ def add_parameters(parameters: protocol_api.Parameters):
                            {"display_name": "G", "value": "G"},
                            {"display_name": "H", "value": "H"}
                            ],
-                       default="H")
+                       default="A")
     parameters.add_int(variable_name="starting_tip_p20_column",    
                        display_name="starting tip p20 column",
                        choices=[
@@ -83,7 +83,7 @@ def add_parameters(parameters: protocol_api.Parameters):
                            {"display_name": "11", "value": 11},
                            {"display_name": "12", "value": 12}
                            ],
-                       default=12)
+                       default=1)
     
     parameters.add_str(variable_name="starting_tip_p300_row",    
                        display_name="starting tip p300 row",
@@ -97,7 +97,7 @@ def add_parameters(parameters: protocol_api.Parameters):
                            {"display_name": "G", "value": "G"},
                            {"display_name": "H", "value": "H"}
                            ],
-                       default="H")
+                       default="A")
     parameters.add_int(variable_name="starting_tip_p300_column",    
                        display_name="starting tip p300 column",
                        choices=[
@@ -114,7 +114,7 @@ def add_parameters(parameters: protocol_api.Parameters):
                            {"display_name": "11", "value": 11},
                            {"display_name": "12", "value": 12}
                            ],
-                       default=12)
+                       default=1)
     
     #### Lights/Pause
     parameters.add_bool(variable_name="lights_on",
@@ -143,25 +143,26 @@ def run(protocol: protocol_api.ProtocolContext):
     starting_tip_p20 = starting_tip_p20_row + str(plankton.starting_tip_p20_column)
     starting_tip_p300 = starting_tip_p300_row + str(plankton.starting_tip_p300_column)
     
-    #### What tube type should be used for the dilution water?
-    total_water = sum(water_volume) * 1.2 # +20%
-    reagent_tube_type, number_of_tubes, max_volume = LW.which_tube_type(total_volume = total_water,
-                                                                        tube_type = False)
-    
-    total_water = total_water / number_of_tubes
-    
+    #### What tubes should be used for the dilution water? 1 tube type (1 rack)
+    #### with the dead volume of every tube and 20% extra water
+    tube_types, fill_volumes = LW.packing_tubes(total_volume = sum(water_volume),
+                                                mixing_types = False,
+                                                extra = 0.2)
+    reagent_tube_type = tube_types[0]
+    number_of_tubes = len(tube_types)
+
     #### How many tip racks should be loaded?
     # Calculates how many tips you need for pipetting all the sample volumes
     p20_tips_sample, p300_tips_sample = LW.amount_of_tips(volumes = sample_volume,
                                                           number_of_transfers = False,
                                                           tip_change = 1,
-                                                          max_p20_volume = 15)
+                                                          action = 'transferring')
     
     # Calculates how many tips you need for pipetting all the water volumes
     p20_tips_water, p300_tips_water = LW.amount_of_tips(volumes = water_volume,
                                                         number_of_transfers = False,
                                                         tip_change = 16,
-                                                        max_p20_volume = 19)
+                                                        action = 'aliquoting')
     
     # Calculates how many tips you need by adding the sample tips with the water tips
     p20_tips_needed = p20_tips_sample + p20_tips_water
@@ -175,7 +176,7 @@ def run(protocol: protocol_api.ProtocolContext):
 # =============================================================================
 ## LIGHTS & COMMENT------------------------------------------------------------
     protocol.set_rail_lights(plankton.lights_on)
-    protocol.comment(f"You need {number_of_tubes} {reagent_tube_type}(s) filled to {math.ceil(total_water)} μL with PCR grade water")
+    protocol.comment(f"You need {number_of_tubes} {reagent_tube_type}(s) filled to {' / '.join(str(volume) for volume in fill_volumes)} μL with PCR grade water")
 # =============================================================================
 
 # LOADING LABWARE AND PIPETTES=================================================
@@ -219,7 +220,7 @@ def run(protocol: protocol_api.ProtocolContext):
                                     skip_wells = False,
                                     number_of_tubes = number_of_tubes,
                                     reagent_type = 'water',
-                                    volume = total_water,
+                                    volume = fill_volumes[0],
                                     protocol = protocol)
 
     # Loading source plate
@@ -244,12 +245,11 @@ def run(protocol: protocol_api.ProtocolContext):
     # Settings for aliquoting of the water volumes in the destination plate
     PM.aliquoting_varying_volumes(reagent_source = water_tubes, 
                                   reagent_tube_type = reagent_tube_type, 
-                                  reagent_startvolume = total_water,
+                                  reagent_startvolume = fill_volumes,
                                   aliquot_volumes = water_volume,
                                   destination_wells = destination_plate[0].wells(),
                                   p20 = p20,
                                   p300 = p300,
-                                  tip_change = 16,
                                   action_at_bottom = 'next_tube',
                                   pause = False,
                                   protocol = protocol)
@@ -0,0 +1,118 @@
+# IMPORT STATEMENTS============================================================
+# This region contains basic python/opentrons stuff
+# =============================================================================
+simulate = False
+#### Import opentrons protocol API v2
+from opentrons import protocol_api
+#### For simulating in the app, set pathway to modules
+import sys
+sys.path.append("O:/")
+sys.path.append("/mnt/c/Program files/Opentrons")
+#### Import mollab protocol module
+from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
+from data.user_storage.mollab_modules import LabWare_v2 as LW
+from data.user_storage.mollab_modules import PipettingPlan as PP
+# =============================================================================
+
+# METADATA=====================================================================
+# This region contains metadata that will be used by the app while running
+# =============================================================================
+metadata = {'author': 'NIOZ Molecular Ecology',
+            'protocolName': 'PipettingPlan module test',
+            'description': 'Transfers from a plate on the magnetic module to '
+                           'a plate on an aluminum block on the temperature '
+                           'module. The recorded plan has the deck slots of '
+                           'the modules and its tips are the tips that are '
+                           'used, otherwise the protocol raises.'
+            }
+requirements = {'apiLevel': '2.20', 'robotType': 'OT-2'}
+# =============================================================================
+
+def run(protocol: protocol_api.ProtocolContext):
+# LOADING LABWARE AND PIPETTES=================================================
+# =============================================================================
+    #### Pipette tips
+    tips_20 = LW.loading_tips(simulate = simulate,
+                              tip_type = 'opentrons_20uL',
+                              amount = 1,
+                              deck_positions = [8],
+                              protocol = protocol)
+    tips_300 = LW.loading_tips(simulate = simulate,
+                               tip_type = 'opentrons_200uL',
+                               amount = 1,
+                               deck_positions = [9],
+                               protocol = protocol)
+
+    #### Loading pipettes
+    p20, p300 = LW.loading_pipettes(P20 = True,
+                                    tips_20 = tips_20,
+                                    starting_tip_p20 = 'A1',
+                                    P300 = True,
+                                    tips_300 = tips_300,
+                                    starting_tip_p300 = 'A1',
+                                    protocol = protocol)
+
+    #### HARDWARE MODULES
+    mag_mod = protocol.load_module(module_name="magnetic module gen2",
+                                   location="4")
+    temp_mod = protocol.load_module(module_name="temperature module gen2",
+                                    location="7")
+    ### Loading adapter on temparature module
+    temp_adapter = temp_mod.load_adapter("opentrons_96_well_aluminum_block")
+    ## Loading plate on hardware modules
+    magnetic_plate = mag_mod.load_labware("biorad_96_wellplate_200ul_pcr")
+    temperature_plate = temp_adapter.load_labware(
+        "biorad_96_wellplate_200ul_pcr")
+## ============================================================================
+
+## PIPETTING===================================================================
+## ============================================================================
+    #### Record both steps in 1 plan, to check it before it is performed
+    plan = PP.Plan()
+    
+    #### From the magnetic module to the aluminum block, p20 and p300
+    PM.transferring_varying_volumes(
+        source_wells = magnetic_plate.wells()[:4],
+        destination_wells = temperature_plate.wells()[8:12],
+        transfer_volumes = [5, 10, 50, 100],
+        airgap = True,
+        mix = True,
+        p20 = p20,
+        p300 = p300,
+        protocol = protocol,
+        plan = plan)
+
+    #### And back, from the aluminum block to the magnetic module
+    PM.transferring_reagents(source_wells = temperature_plate.wells()[8:10],
+                             destination_wells = magnetic_plate.wells()[4:6],
+                             transfer_volume = 10,
+                             airgap = True,
+                             mix = False,
+                             p20 = p20,
+                             p300 = p300,
+                             protocol = protocol,
+                             plan = plan)
+    
+    PP.executing_plan(plan, protocol)
+## ============================================================================
+
+## CHECKS======================================================================
+## ============================================================================
+    #### The plates are recorded with the deck slots of the modules
+    slots = {str(operation.slot) for operation in plan 
+             if operation.action in ['aspirate', 'dispense']}
+    if slots != {'4', '7'}:
+        raise Exception(f"The plan pipettes in deck slots {sorted(slots)}, "
+                        f"instead of the module slots 4 and 7")
+    
+    #### Every tip of the plan is picked up in the simulation
+    for pipette, tips in [(p20, tips_20), (p300, tips_300)]:
+        planned_tips = plan.count('pick_up_tip', pipette.mount)
+        used_tips = len([tip for tip_rack in tips for tip in tip_rack.wells()
+                         if not tip.has_tip])
+        if planned_tips != used_tips:
+            raise Exception(f"The plan picks up {planned_tips} tips with the "
+                            f"{pipette.mount} pipette, {used_tips} tips are "
+                            f"used")
+    protocol.comment("The plan has the module slots and the tips used")
+## ============================================================================
@@ -0,0 +1,160 @@
+# IMPORT STATEMENTS============================================================
+# This region contains basic python/opentrons stuff
+# =============================================================================
+simulate = False
+#### Import opentrons protocol API v2
+from opentrons import protocol_api
+#### For simulating in the app, set pathway to modules
+import sys
+sys.path.append("O:/")
+sys.path.append("/mnt/c/Program files/Opentrons")
+#### Import mollab protocol module
+from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
+from data.user_storage.mollab_modules import LabWare_v2 as LW
+from data.user_storage.mollab_modules import PipettingPlan as PP
+from data.user_storage.mollab_modules import VolumeTracking as VT
+# =============================================================================
+
+# METADATA=====================================================================
+# This region contains metadata that will be used by the app while running
+# =============================================================================
+metadata = {'author': 'NIOZ Molecular Ecology',
+            'protocolName': 'VolumeTracker start volume test',
+            'description': 'Pools in empty tubes (start_volume 0), the first '
+                           'dispenses are just above the bottom of the tube. '
+                           'A tube without a next tube is filled above its '
+                           'max_fill_height, which gives a comment. The '
+                           'dispense heights are checked against the height '
+                           'tables, otherwise the protocol raises.'
+            }
+requirements = {'apiLevel': '2.20', 'robotType': 'OT-2'}
+# =============================================================================
+
+def run(protocol: protocol_api.ProtocolContext):
+# LOADING LABWARE AND PIPETTES=================================================
+# =============================================================================
+    #### Pipette tips
+    tips_20 = LW.loading_tips(simulate = simulate,
+                              tip_type = 'opentrons_20uL',
+                              amount = 1,
+                              deck_positions = [7],
+                              protocol = protocol)
+    tips_300 = LW.loading_tips(simulate = simulate,
+                               tip_type = 'opentrons_200uL',
+                               amount = 1,
+                               deck_positions = [8],
+                               protocol = protocol)
+
+    #### Loading pipettes
+    p20, p300 = LW.loading_pipettes(P20 = True,
+                                    tips_20 = tips_20,
+                                    starting_tip_p20 = 'A1',
+                                    P300 = True,
+                                    tips_300 = tips_300,
+                                    starting_tip_p300 = 'A1',
+                                    protocol = protocol)
+
+    #### Loading labware
+    source_plate = LW.loading_tube_racks(simulate = simulate,
+                                         tube_type = 'skirted_plate_96',
+                                         reagent_type = 'samples',
+                                         amount = 1,
+                                         deck_positions = [1],
+                                         protocol = protocol)
+    pool_rack = LW.loading_tube_racks(simulate = simulate,
+                                      tube_type = '1.5mL_tubes',
+                                      reagent_type = 'destination',
+                                      amount = 1,
+                                      deck_positions = [2],
+                                      protocol = protocol)
+    pool_tubes = LW.tube_locations(source_racks = pool_rack,
+                                   specific_columns = False,
+                                   skip_wells = False,
+                                   number_of_tubes = 3,
+                                   reagent_type = 'destination',
+                                   volume = 1,
+                                   protocol = protocol)
+## ============================================================================
+
+## PIPETTING===================================================================
+## ============================================================================
+    #### Record both steps in 1 plan, to check its dispense heights
+    plan = PP.Plan()
+    
+    #### Empty 1.5mL tubes, a next tube after 100 µL
+    PM.pooling_varying_volumes(source_wells = source_plate[0].wells()[:12],
+                               pool_volumes = [2, 5, 10, 15, 19, 25,
+                                               2, 5, 10, 15, 19, 25],
+                               pool_tube = pool_tubes[:2],
+                               pool_tube_type = '1.5mL_tubes',
+                               start_volume = 0,
+                               pool_volume_per_tube = 100,
+                               airgap = True,
+                               mix = True,
+                               p20 = p20,
+                               p300 = p300,
+                               protocol = protocol,
+                               plan = plan)
+
+    #### 1 empty tube that is filled until it overflows
+    PM.pooling_varying_volumes(source_wells = source_plate[0].wells()[12:22],
+                               pool_volumes = [190] * 10,
+                               pool_tube = pool_tubes[2:],
+                               pool_tube_type = '1.5mL_tubes',
+                               start_volume = 0,
+                               pool_volume_per_tube = False,
+                               airgap = True,
+                               mix = True,
+                               p20 = p20,
+                               p300 = p300,
+                               protocol = protocol,
+                               plan = plan)
+## ============================================================================
+    
+    PP.executing_plan(plan, protocol)
+## ============================================================================
+
+## CHECKS======================================================================
+## ============================================================================
+    #### The height tables give back the volume of a height
+    volumes = list(range(0, 1500, 50))
+    round_trip = VT.height_to_volume('1.5mL_tubes', 
+                                     VT.volume_to_height('1.5mL_tubes', 
+                                                         volumes))
+    if max(abs(round_trip - volumes)) > 0.01:
+        raise Exception("height_to_volume does not give back the volumes of "
+                        "volume_to_height")
+    
+    #### Empty tubes start at the bottom
+    pool_tracker = VT.VolumeTracker(pool_tubes, '1.5mL_tubes', 0)
+    if pool_tracker.heights != [VT.cal_start_height('1.5mL_tubes', 0)] * 3:
+        raise Exception(f"The start heights of the empty tubes are "
+                        f"{pool_tracker.heights}")
+    
+    #### Every dispense is just below the surface after dispensing, and 
+    #### never below MIN_PIPETTING_HEIGHT. The pooled volume is the 
+    #### dispensed volume without the airgap of the pipette.
+    airgaps = {p20.mount: 1, p300.mount: 5}
+    pooled_volumes = {}
+    for operation in plan:
+        if operation.action != 'dispense' or str(operation.slot) != '2':
+            continue
+        pooled_volumes[operation.well] = (pooled_volumes.get(operation.well, 0)
+                                          + operation.volume 
+                                          - airgaps[operation.pipette])
+        height = float(VT.volume_to_height('1.5mL_tubes', 
+                                           pooled_volumes[operation.well]))
+        expected_height = max(height - VT.IMMERSION_DEPTH, 
+                              VT.MIN_PIPETTING_HEIGHT)
+        if abs(operation.height - expected_height) > 0.01:
+            raise Exception(f"Dispensed at {operation.height:.2f} mm in tube "
+                            f"{operation.well + 1}, instead of at "
+                            f"{expected_height:.2f} mm")
+    
+    #### The overflowing tube is commented
+    if not any(operation.action == 'comment' and 
+               'max_fill_height' in operation.argument for operation in plan):
+        raise Exception("Filling a tube above its max_fill_height is not "
+                        "commented")
+    protocol.comment("The dispense heights match the height tables")
+## ============================================================================
@@ -0,0 +1,197 @@
+"""
+version: Jan_2024
+Module to decide on which deck slots the labware of a protocol is placed,
+instead of hard-coding a list of deck_positions per labware type. Every
+labware gets its own slots, and labware that the pipettes often move between
+(e.g. the mastermix tube and the qPCR plate) is placed close together.
+
+Example, with the numbers from the CALCULATED VARIABLES of a protocol:
+    from data.user_storage.mollab_modules import DeckLayout as DL
+    layout = DL.solving_deck_layout(
+        labware = {'tips_p20': 2, 'tips_p300': 1, 'mastermix': 1,
+                   'samples': number_of_sample_racks, 'qPCR_plate': 1},
+        traffic = {('mastermix', 'qPCR_plate'): total_reactions,
+                   ('samples', 'qPCR_plate'): total_reactions,
+                   ('tips_p20', 'samples'): total_reactions,
+                   ('tips_p20', 'trash'): total_reactions},
+        protocol = protocol)
+    tips_20 = LW.loading_tips(simulate, 'opentrons_20uL', 2,
+                              layout['tips_p20'], protocol)
+"""
+#### Slots that can hold labware, slot 12 holds the fixed trash
+DECK = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
+TRASH_SLOT = 12
+
+def slot_distance(slot_a, slot_b):
+    """
+    Distance in mm between the centres of 2 deck slots.
+    """
+    from data.user_storage.mollab_modules import TransferOrdering as TO
+    return TO.distance(TO.slot_position(slot_a), TO.slot_position(slot_b))
+
+def layout_cost(placement, traffic):
+    """
+    Predicted gantry travel of a layout: for every pair of labware the
+    number of moves between them times the mean distance between their
+    slots.
+
+    Parameters
+    ----------
+    placement : dict
+        List of slots per labware name
+    traffic : dict
+        Number of moves per pair of labware names
+
+    Returns
+    -------
+    cost : float
+    """
+    cost = 0
+    for (name_a, name_b), moves in traffic.items():
+        slots_a = placement.get(name_a)
+        slots_b = placement.get(name_b)
+        if not slots_a or not slots_b:
+            continue
+        cost += moves * (sum(slot_distance(slot_a, slot_b)
+                             for slot_a in slots_a for slot_b in slots_b)
+                         / (len(slots_a) * len(slots_b)))
+    return cost
+
+def commenting_deck_layout(placement, protocol):
+    """
+    Shows the layout as a protocol comment, with the deck as seen from the
+    front of the robot (slot 10 at the top left).
+    """
+    names = {TRASH_SLOT: 'trash'}
+    for name, slots in placement.items():
+        for i, slot in enumerate(slots):
+            if len(slots) > 1:
+                names[slot] = f"{name}_{i + 1}"
+            else:
+                names[slot] = name
+    width = max(len(name) for name in names.values()) + 4
+    rows = []
+    for first_slot in [10, 7, 4, 1]:
+        rows.append("| " + " | ".join(
+            f"{slot:>2} {names.get(slot, ''):<{width - 3}}"
+            for slot in range(first_slot, first_slot + 3)) + " |")
+    protocol.comment("Deck layout:\n" + "\n".join(rows))
+
+    return
+
+def solving_deck_layout(labware,
+                        traffic,
+                        fixed_slots = False,
+                        available_slots = False,
+                        protocol = False):
+    """
+    Assigns deck slots to all labware, so that no slot is used twice and the
+    predicted gantry travel between labware is as small as possible. First
+    every rack gets the free slot that is closest to the labware it has most
+    traffic with, then pairs of slots are swapped as long as that saves
+    travel.
+
+    Parameters
+    ----------
+    labware : dict
+        Number of racks/plates per labware name, e.g. {'tips_p20': 2}
+    traffic : dict
+        Number of moves between 2 labware per pair of names, e.g.
+        {('mastermix', 'qPCR_plate'): 96}. Use 'trash' for the fixed trash.
+    fixed_slots : Boolean False or dict
+        Optional, default False. Slots per labware name that cannot move,
+        e.g. {'thermocycler': [7, 8, 10, 11]}
+    available_slots : Boolean False or list
+        Optional, default False. Slots that may be used, default all slots
+    protocol : Boolean False or def run(protocol: protocol_api.ProtocolContext)
+        Optional, default False. If given, the layout is shown as a comment
+
+    Raises
+    ------
+    Exception
+        If there are not enough slots for all labware, or if a fixed slot is
+        used twice
+
+    Returns
+    -------
+    placement : dict
+        List of slots per labware name, in the order in which to load them
+    """
+    if not available_slots:
+        available_slots = DECK
+    fixed_slots = fixed_slots or {}
+
+    #### Fixed labware, also the trash
+    placement = {'trash': [TRASH_SLOT]}
+    taken = {TRASH_SLOT}
+    for name, slots in fixed_slots.items():
+        if taken & set(slots):
+            raise Exception(f"Slot(s) {sorted(taken & set(slots))} of {name} "
+                            f"are already used")
+        placement[name] = list(slots)
+        taken.update(slots)
+
+    #### Check whether everything fits
+    free_slots = [slot for slot in available_slots if slot not in taken]
+    racks = [(name, i) for name, amount in labware.items()
+             if name not in fixed_slots for i in range(amount)]
+    if len(racks) > len(free_slots):
+        raise Exception(f"{len(racks)} racks/plates need a slot, but only "
+                        f"{len(free_slots)} slots are available")
+
+    def total_traffic(name):
+        return sum(amount for pair, amount in traffic.items() if name in pair)
+
+    #### Greedy: busiest labware first, every rack on the best free slot
+    racks.sort(key = lambda rack: (-total_traffic(rack[0]), rack))
+    for name, i in racks:
+        best_slot = min(free_slots, key = lambda slot: (layout_cost(
+            {**placement, name: placement.get(name, []) + [slot]}, traffic),
+            slot))
+        placement.setdefault(name, []).append(best_slot)
+        free_slots.remove(best_slot)
+
+    #### Swap 2 racks, or a rack and a free slot, if that saves travel
+    cost = layout_cost(placement, traffic)
+    improved = True
+    while improved:
+        improved = False
+        positions = ([(name, i) for name in labware if name not in fixed_slots
+                      for i in range(len(placement.get(name, [])))] +
+                     [(None, slot) for slot in free_slots])
+        for a in range(len(positions)):
+            for b in range(a + 1, len(positions)):
+                (name_a, i_a), (name_b, i_b) = positions[a], positions[b]
+                if name_a == name_b:
+                    continue
+                slot_a = placement[name_a][i_a]
+                if name_b is None:
+                    slot_b = i_b
+                else:
+                    slot_b = placement[name_b][i_b]
+                placement[name_a][i_a] = slot_b
+                if name_b is not None:
+                    placement[name_b][i_b] = slot_a
+                new_cost = layout_cost(placement, traffic)
+                if new_cost < cost - 1e-6:
+                    cost = new_cost
+                    improved = True
+                    if name_b is None:
+                        free_slots.remove(slot_b)
+                        free_slots.append(slot_a)
+                        positions[b] = (None, slot_a)
+                else:
+                    placement[name_a][i_a] = slot_a
+                    if name_b is not None:
+                        placement[name_b][i_b] = slot_b
+
+    #### Racks of 1 labware are loaded in the order of their slot numbers
+    del placement['trash']
+    for name in placement:
+        placement[name] = sorted(placement[name])
+
+    #### Show the layout
+    if protocol:
+        commenting_deck_layout(placement, protocol)
+
+    return placement
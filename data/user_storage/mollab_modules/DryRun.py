@@ -0,0 +1,209 @@
+"""
+version: Jan_2024
+Module to count exactly how many tips a protocol uses, before the labware is
+loaded. The functions of the Pipetting_Modules are run with dry-run pipettes
+and wells, that only have what these functions use, and all their steps are
+recorded in a PipettingPlan.Plan. Every pick_up_tip in that plan is a tip
+that the robot will pick up, so the same tip changes, passes and tip_policy.
+
+Example, with the variables of a protocol:
+    from data.user_storage.mollab_modules import DryRun as DR
+    from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
+    tips_p20, tips_p300 = DR.counting_plan_tips([
+        (PM.aliquoting_varying_volumes,
+         {'reagent_source': DR.dry_run_wells(1, rows = 4, columns = 6),
+          'reagent_tube_type': '1.5mL_tubes',
+          'reagent_startvolume': 1500,
+          'aliquot_volumes': mastermix_volumes,
+          'destination_wells': DR.dry_run_wells(len(mastermix_volumes)),
+          'action_at_bottom': 'next_tube',
+          'pause': False}),
+        (PM.transferring_reagents,
+         {'source_wells': DR.dry_run_wells(number_of_samples),
+          'destination_wells': DR.dry_run_wells(number_of_samples),
+          'transfer_volume': sample_volume,
+          'airgap': True,
+          'mix': True})])
+"""
+import itertools
+from collections import namedtuple
+
+#### x, y, z in mm, like opentrons.types.Point
+Point = namedtuple('Point', ['x', 'y', 'z'])
+#### Distance in mm between the wells of a dry-run labware
+WELL_SPACING = 9
+#### Height in mm of the wells of a dry-run labware
+WELL_DEPTH = 40
+#### Mounts of the pipettes, the same as in LabWare_v2.loading_pipettes
+MOUNTS = {'p20': 'left', 'p300': 'right'}
+
+class DryRunLocation:
+    """
+    Stands in for an opentrons Location: a point in or above a well.
+    """
+    def __init__(self, point, well):
+        self.point = point
+        self.labware = well
+
+class DryRunWell:
+    """
+    Stands in for an opentrons Well.
+    """
+    def __init__(self, labware, well_name, position, max_volume):
+        self.parent = labware
+        self.well_name = well_name
+        self.position = position
+        self.max_volume = max_volume
+
+    def as_well(self):
+        return self
+
+    def bottom(self, z = 0):
+        return DryRunLocation(Point(self.position[0], self.position[1], z),
+                              self)
+
+    def top(self, z = 0):
+        return DryRunLocation(Point(self.position[0], self.position[1],
+                                    WELL_DEPTH + z), self)
+
+class DryRunLabware:
+    """
+    Stands in for a loaded rack/plate with rows x columns wells, A1 at the
+    back left like the opentrons labware.
+    """
+    def __init__(self, name, rows = 8, columns = 12, max_volume = 200):
+        self.parent = name
+        self._columns = [
+            [DryRunWell(self, f"{chr(65 + row)}{column + 1}",
+                        (column * WELL_SPACING, (rows - row) * WELL_SPACING),
+                        max_volume)
+             for row in range(rows)]
+            for column in range(columns)]
+
+    def __str__(self):
+        return str(self.parent)
+
+    def wells(self):
+        return [well for column in self._columns for well in column]
+
+    def columns(self):
+        return [list(column) for column in self._columns]
+
+    def columns_by_name(self):
+        return {str(i + 1): list(column)
+                for i, column in enumerate(self._columns)}
+
+    def well(self, well_name):
+        return next(well for well in self.wells()
+                    if well.well_name == well_name)
+
+class DryRunPipette:
+    """
+    Stands in for a loaded pipette, with 1 dry-run tip rack so that the tip
+    volume is known.
+    """
+    def __init__(self, pipette, channels = 1, tip_volume = False):
+        self.mount = MOUNTS[pipette]
+        self.max_volume = {'p20': 20, 'p300': 300}[pipette]
+        self.channels = channels
+        self.tip_racks = [DryRunLabware(f"tips_{pipette}",
+                                        max_volume = (tip_volume or
+                                                      self.max_volume))]
+
+#### Numbers that give every dry-run labware its own name
+LABWARE_NUMBERS = itertools.count(1)
+
+def dry_run_wells(number, rows = 8, columns = 12):
+    """
+    Returns a list of dry-run wells, on as many dry-run racks/plates as
+    needed. Use it in the steps of dry_running instead of the tube/well
+    locations of the protocol.
+
+    Parameters
+    ----------
+    number : int
+        How many tubes/wells
+    rows : int
+        Optional, default 8. Rows per rack/plate, e.g. 4 for 1.5mL_tubes
+    columns : int
+        Optional, default 12. Columns per rack/plate, e.g. 6 for 1.5mL_tubes
+
+    Returns
+    -------
+    wells : list
+    """
+    wells = []
+    while len(wells) < number:
+        wells += DryRunLabware(f"dry_run_{next(LABWARE_NUMBERS)}",
+                               rows, columns).wells()
+    return wells[:number]
+
+def dry_running(steps,
+                p20 = True,
+                p300 = True,
+                multi_channel = False,
+                tip_volumes = (20, 200)):
+    """
+    Runs Pipetting_Modules functions with dry-run pipettes and records all
+    their steps in 1 plan, nothing is performed.
+
+    Parameters
+    ----------
+    steps : list
+        A (function, arguments) tuple per function call, in the order of the
+        protocol. The arguments are a dict with all arguments except p20,
+        p300, protocol and plan, with dry-run wells instead of the wells.
+    p20 : boolean True or False
+        Optional, default True. Is the p20 used in the protocol or not
+    p300 : boolean True or False
+        Optional, default True. Is the p300 used in the protocol or not
+    multi_channel : Boolean False or string
+        Optional, default False. 'p20' or 'p300' if that pipette is an
+        8-channel pipette, see LabWare_v2.loading_pipettes
+    tip_volumes : tuple
+        Optional, default (20, 200). Max volume in µL of the p20 and p300 tips
+
+    Returns
+    -------
+    plan : PipettingPlan.Plan
+    """
+    from data.user_storage.mollab_modules import PipettingPlan as PP
+
+    pipettes = {}
+    for name, used, tip_volume in zip(['p20', 'p300'], [p20, p300],
+                                      tip_volumes):
+        if used:
+            pipettes[name] = DryRunPipette(
+                name, 8 if multi_channel == name else 1, tip_volume)
+        else:
+            pipettes[name] = False
+
+    plan = PP.Plan()
+    for function, arguments in steps:
+        function(**arguments, p20 = pipettes['p20'], p300 = pipettes['p300'],
+                 protocol = None, plan = plan)
+
+    return plan
+
+def counting_plan_tips(steps,
+                       p20 = True,
+                       p300 = True,
+                       multi_channel = False,
+                       tip_volumes = (20, 200)):
+    """
+    Counts the tips that the steps use, see dry_running for the parameters.
+    An 8-channel pipette uses 8 tips per pick up.
+
+    Returns
+    -------
+    p20_tips_needed : int
+    p300_tips_needed : int
+    """
+    plan = dry_running(steps, p20, p300, multi_channel, tip_volumes)
+
+    tips_needed = []
+    for name in ['p20', 'p300']:
+        channels = 8 if multi_channel == name else 1
+        tips_needed.append(plan.count('pick_up_tip', MOUNTS[name]) * channels)
+
+    return tips_needed[0], tips_needed[1]
@@ -0,0 +1,351 @@
+"""
+version: Jan_2024
+Module to calculate equimolar pooling from the TapeStation exports, instead
+of in a spreadsheet. The exports (.csv with a row per sample, as exported by
+the TapeStation software) are read with the csv module and all samples are
+calculated at once as numpy columns. The results are written in the layout of
+equimolar_pooling_results.csv, and give the volume lists of the
+pool_template_protocols (<DNA_volumes>, <Sample_volumes>, <Water_volumes>).
+
+Every FileName of the exports is 1 plate, in the order of the exports.
+Samples that would be pooled with less than MIN_POOL_VOLUME are diluted to
+TARGET_CONCENTRATION first, samples with a low concentration are pooled with
+at most MAX_SAMPLE_VOLUME. optimizing_equimolar instead chooses the pool
+volumes with the fewest dilutions and p300 steps, within a tolerance of the
+target ng (see pooling_steps for what both cost).
+
+Example, from the root of the repository:
+    python -m data.user_storage.mollab_modules.EquimolarPooling results.csv export_1.csv export_2.csv
+or in python:
+    from data.user_storage.mollab_modules import EquimolarPooling as EP
+    results = EP.pooling_results(['export_1.csv', 'export_2.csv'])
+    EP.writing_results(results, 'results.csv')
+    EP.template_volumes(results)
+"""
+import csv
+import numpy as np
+
+#### Columns of a TapeStation export, in the order of the export
+EXPORT_COLUMNS = ['FileName', 'WellId', 'Sample Description', 'From [bp]',
+                  'To [bp]', 'Average Size [bp]', 'Conc. [ng/µl]',
+                  'Region Molarity [nmol/l]', '% of Total', 'Region Comment']
+CONCENTRATION_COLUMN = 'Conc. [ng/µl]'
+#### Columns that are calculated, after the export columns
+RESULT_COLUMNS = ['dilution_ratio', 'DNA_volume', 'water_volume',
+                  'final_concentration', 'µL_pooled', 'ng_pooled',
+                  'diluted_before_pooling']
+POOL_INFORMATION = ['total µl pooled', 'total ng pooled',
+                    'total pb buffer needed (µl)',
+                    'total ph indicator needed (µl)']
+
+#### Concentration (ng/µL) that samples are diluted to
+TARGET_CONCENTRATION = 400 / 33
+#### Smallest volume (µL) that is pooled, samples that need less are diluted
+MIN_POOL_VOLUME = 10
+#### DNA from every sample that is pooled: MIN_POOL_VOLUME at
+#### TARGET_CONCENTRATION
+TARGET_NG = MIN_POOL_VOLUME * TARGET_CONCENTRATION
+#### Largest volume (µL) that is pooled of a sample, also the volume that is
+#### taken of a sample that is not diluted
+MAX_SAMPLE_VOLUME = 45
+#### Volume (µL) of a sample that is diluted
+DILUTION_SAMPLE_VOLUME = 40
+#### PB buffer per µL pool and pH indicator per µL PB buffer, for the clean up
+PB_BUFFER_RATIO = 5
+PH_INDICATOR_RATIO = 1 / 250
+#### optimizing_equimolar: how much the ng of a sample may differ from
+#### TARGET_NG (0.1 = 10%), and the smallest volume (µL) that is pooled
+#### without diluting the sample first
+TOLERANCE = 0.1
+MIN_OPTIMIZED_VOLUME = 5
+#### Water aliquots per tip in the sample dilution template
+WATER_TIP_CHANGE = 16
+
+def reading_tapestation(paths):
+    """
+    Reads TapeStation exports row by row into columns. Rows without a
+    FileName/WellId and the ladder are left out, an empty concentration is 0.
+
+    Parameters
+    ----------
+    paths : list
+        Paths of the TapeStation exports (.csv)
+
+    Returns
+    -------
+    columns : dict
+        Per export column a list of strings, and 'plate': a numpy array
+        with the plate number (from 0) of every sample
+    """
+    columns = {column: [] for column in EXPORT_COLUMNS}
+    plates = {}
+    plate = []
+    for path in paths:
+        with open(path, newline = '', encoding = 'utf-8-sig',
+                  errors = 'replace') as export_file:
+            reader = csv.reader(export_file)
+            header = [name.strip() for name in next(reader)]
+            ## Old exports have µ as a single byte (latin-1)
+            header = [name.replace('\ufffd', 'µ') for name in header]
+            missing = set(EXPORT_COLUMNS) - set(header)
+            if missing:
+                raise Exception(f"{path} is not a TapeStation export, "
+                                f"there is no {sorted(missing)}")
+            positions = [header.index(column) for column in EXPORT_COLUMNS]
+            for row in reader:
+                if len(row) < len(header):
+                    continue
+                values = [row[position].strip() for position in positions]
+                if not values[0] or not values[1]:
+                    continue
+                if values[2].lower() == 'ladder':
+                    continue
+                for column, value in zip(EXPORT_COLUMNS, values):
+                    columns[column].append(value)
+                plate.append(plates.setdefault(values[0], len(plates)))
+    columns['plate'] = np.array(plate, dtype = int)
+    return columns
+
+def calculating_equimolar(concentrations):
+    """
+    Calculates the pooling of all samples at once.
+
+    Parameters
+    ----------
+    concentrations : numpy array
+        Concentration of every sample in ng/µL
+
+    Returns
+    -------
+    results : dict
+        Per column of RESULT_COLUMNS a numpy array, dilution_ratio is nan
+        for samples that are not diluted
+    """
+    concentrations = np.asarray(concentrations, dtype = float)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        pool_volume = np.minimum(np.round(TARGET_NG / concentrations, 2),
+                                 MAX_SAMPLE_VOLUME)
+        diluted = pool_volume < MIN_POOL_VOLUME
+        dilution_ratio = np.where(diluted,
+                                  concentrations / TARGET_CONCENTRATION,
+                                  np.nan)
+        final_concentration = np.where(diluted,
+                                       concentrations / dilution_ratio,
+                                       concentrations)
+    pool_volume = np.where(diluted, MIN_POOL_VOLUME, pool_volume)
+
+    return {'dilution_ratio': dilution_ratio,
+            'DNA_volume': np.where(diluted, DILUTION_SAMPLE_VOLUME,
+                                   MAX_SAMPLE_VOLUME),
+            'water_volume': np.where(diluted, np.round(
+                DILUTION_SAMPLE_VOLUME * (dilution_ratio - 1), 2), 0.0),
+            'final_concentration': final_concentration,
+            'µL_pooled': pool_volume,
+            'ng_pooled': pool_volume * final_concentration,
+            'diluted_before_pooling': diluted}
+
+def optimizing_equimolar(concentrations,
+                         tolerance = TOLERANCE,
+                         min_volume = MIN_OPTIMIZED_VOLUME):
+    """
+    Calculates the pooling of all samples at once with the fewest pipetting
+    steps, instead of the fixed rules of calculating_equimolar. Every sample
+    gets the pool volume closest to TARGET_NG within the tolerance, where
+    possible a volume that the p20 pools in 1 go (no p300). Only samples
+    that would need less than min_volume are diluted, just enough to pool
+    min_volume. Samples with a low concentration are pooled with at most
+    MAX_SAMPLE_VOLUME, like in calculating_equimolar.
+
+    Parameters
+    ----------
+    concentrations : numpy array
+        Concentration of every sample in ng/µL
+    tolerance : float
+        Optional, default TOLERANCE. How much the ng of a sample may differ
+        from TARGET_NG, e.g. 0.1 for 10%
+    min_volume : float
+        Optional, default MIN_OPTIMIZED_VOLUME. Smallest volume in µL that
+        is pooled of a sample
+
+    Returns
+    -------
+    results : dict
+        Per column of RESULT_COLUMNS a numpy array, see calculating_equimolar
+    """
+    from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
+    p20_volume = PM.MAX_VOLUMES['pooling'][0]
+
+    concentrations = np.asarray(concentrations, dtype = float)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        ideal_volume = TARGET_NG / concentrations
+        ## Pool volumes that give TARGET_NG within the tolerance
+        lowest = np.maximum(ideal_volume * (1 - tolerance), min_volume)
+        highest = np.minimum(ideal_volume * (1 + tolerance),
+                             MAX_SAMPLE_VOLUME)
+        pool_volume = np.minimum(np.maximum(ideal_volume, lowest), highest)
+        ## The p20 instead of the p300 if the tolerance allows it
+        pool_volume = np.where((pool_volume > p20_volume) &
+                               (lowest <= p20_volume),
+                               p20_volume, pool_volume)
+        ## Too low concentration to get within the tolerance
+        pool_volume = np.where(lowest > highest, MAX_SAMPLE_VOLUME,
+                               pool_volume)
+        ## Too high concentration to pool min_volume
+        diluted = ideal_volume * (1 + tolerance) < min_volume
+        dilution_ratio = np.where(diluted,
+                                  concentrations * min_volume / TARGET_NG,
+                                  np.nan)
+        final_concentration = np.where(diluted,
+                                       concentrations / dilution_ratio,
+                                       concentrations)
+    pool_volume = np.round(np.where(diluted, min_volume, pool_volume), 2)
+
+    return {'dilution_ratio': dilution_ratio,
+            'DNA_volume': np.where(diluted, DILUTION_SAMPLE_VOLUME,
+                                   MAX_SAMPLE_VOLUME),
+            'water_volume': np.where(diluted, np.round(
+                DILUTION_SAMPLE_VOLUME * (dilution_ratio - 1), 2), 0.0),
+            'final_concentration': final_concentration,
+            'µL_pooled': pool_volume,
+            'ng_pooled': pool_volume * final_concentration,
+            'diluted_before_pooling': diluted}
+
+def reading_concentrations(results):
+    """
+    Returns the concentrations (ng/µL) of the samples of the results, an
+    empty concentration is 0.
+    """
+    return np.array([float(value.replace(',', '.') or 0)
+                     for value in results[CONCENTRATION_COLUMN]])
+
+def pooling_results(paths, optimize = False):
+    """
+    Reads the TapeStation exports and calculates the pooling, see
+    reading_tapestation and calculating_equimolar.
+
+    Parameters
+    ----------
+    paths : list
+        Paths of the TapeStation exports (.csv)
+    optimize : Boolean False, True or dict
+        Optional, default False. If True, the pooling is calculated with
+        optimizing_equimolar, a dict has its tolerance and/or min_volume
+
+    Returns
+    -------
+    results : dict
+        The export columns, 'plate' and the RESULT_COLUMNS
+    """
+    results = reading_tapestation(paths)
+    if optimize:
+        results.update(optimizing_equimolar(
+            reading_concentrations(results),
+            **(optimize if isinstance(optimize, dict) else {})))
+    else:
+        results.update(calculating_equimolar(reading_concentrations(results)))
+    return results
+
+def pooling_steps(results):
+    """
+    Counts what the dilution and pooling of the results cost.
+
+    Returns
+    -------
+    steps : dict
+        'dilution_runs': plates with diluted samples, 'diluted_samples',
+        'pipetting_steps': water, sample and pool transfers, 'p300_pooling':
+        samples that are pooled with the p300, 'tips': tips of the dilution
+        (sample transfers and water, WATER_TIP_CHANGE aliquots per tip) and
+        of the pooling
+    """
+    from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
+
+    diluted = np.asarray(results['diluted_before_pooling'], dtype = bool)
+    diluted_per_plate = np.bincount(results['plate'], weights = diluted,
+                                    minlength = 1)
+    return {'dilution_runs': int(np.count_nonzero(diluted_per_plate)),
+            'diluted_samples': int(diluted.sum()),
+            'pipetting_steps': int(len(diluted) + 2 * diluted.sum()),
+            'p300_pooling': int(np.count_nonzero(
+                results['µL_pooled'] > PM.MAX_VOLUMES['pooling'][0])),
+            'tips': int(len(diluted) + diluted.sum() + np.ceil(
+                diluted_per_plate / WATER_TIP_CHANGE).sum())}
+
+def pool_information(results):
+    """
+    Returns the totals of the pool, per name of POOL_INFORMATION.
+    """
+    total_volume = float(np.sum(results['µL_pooled']))
+    pb_buffer = total_volume * PB_BUFFER_RATIO
+    return dict(zip(POOL_INFORMATION,
+                    [total_volume,
+                     float(np.sum(results['ng_pooled'])),
+                     pb_buffer,
+                     pb_buffer * PH_INDICATOR_RATIO]))
+
+def writing_results(results, path):
+    """
+    Writes the results like equimolar_pooling_results.csv: the export
+    columns, the RESULT_COLUMNS, an empty column and the pool information.
+    """
+    calculated = [results[column].tolist() for column in RESULT_COLUMNS]
+    ## No dilution ratio for samples that are not diluted
+    calculated[0] = ['' if ratio != ratio else ratio
+                     for ratio in calculated[0]]
+    information = list(pool_information(results).items())
+
+    with open(path, 'w', newline = '', encoding = 'utf-8') as results_file:
+        writer = csv.writer(results_file)
+        writer.writerow(EXPORT_COLUMNS + RESULT_COLUMNS +
+                        ['', 'pool_information', 'values'])
+        for i, row in enumerate(zip(*[results[column]
+                                      for column in EXPORT_COLUMNS],
+                                    *calculated)):
+            pool = list(information[i]) if i < len(information) else ['', '']
+            writer.writerow(list(row) + [''] + pool)
+
+def reading_results(path):
+    """
+    Reads a results file of writing_results back into results, with the
+    calculated columns as numpy arrays.
+    """
+    columns = reading_tapestation([path])
+    with open(path, newline = '', encoding = 'utf-8-sig') as results_file:
+        rows = [row for row in csv.DictReader(results_file)
+                if row['FileName'] and row['WellId'] and
+                row['Sample Description'].lower() != 'ladder']
+    for column in RESULT_COLUMNS:
+        values = [row[column] for row in rows]
+        if column == 'diluted_before_pooling':
+            columns[column] = np.array([value == 'True' for value in values])
+        else:
+            columns[column] = np.array([float(value) if value else np.nan
+                                        for value in values])
+    return columns
+
+def template_volumes(results):
+    """
+    Returns the volume lists of the pool_template_protocols per plate.
+
+    Returns
+    -------
+    volumes : list
+        Per plate a dict with 'DNA_volumes' (µL pooled per sample),
+        'Sample_volumes' (µL of every sample in the dilution, also of the
+        samples that are not diluted) and 'Water_volumes' (µL water)
+    """
+    volumes = []
+    for plate in range(int(results['plate'].max(initial = -1)) + 1):
+        on_plate = results['plate'] == plate
+        volumes.append({
+            'DNA_volumes': results['µL_pooled'][on_plate].tolist(),
+            'Sample_volumes': results['DNA_volume'][on_plate].tolist(),
+            'Water_volumes': results['water_volume'][on_plate].tolist()})
+    return volumes
+
+if __name__ == '__main__':
+    import sys
+    results = pooling_results(sys.argv[2:])
+    writing_results(results, sys.argv[1])
+    for name, value in pool_information(results).items():
+        print(f"{name}: {round(value, 2)}")
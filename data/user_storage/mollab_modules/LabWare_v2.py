@@ -1,6 +1,261 @@
 """
 version: Jan_2024
 """
+import weakref
+
+#### Labware per tip_type: [load name, 'custom' / 'noncustom']
+TIP_TYPES = {
+        'opentrons_20uL':
+            ['opentrons_96_filtertiprack_20ul',
+             'noncustom'],
+        'tipone_20uL': 
+            ['tipone_96_tiprack_20ul',
+             'custom'],
+        'opentrons_200uL': 
+            ['opentrons_96_filtertiprack_200ul', 
+             'noncustom'],
+        'tipone_300uL': 
+            ['tipone_96_tiprack_300ul',
+             'custom'],
+        }
+
+#### Labware per tube_type: [load name, 'custom' / 'noncustom']
+TUBE_TYPES = {
+        'skirted_plate_96':
+            ['biorad_96_wellplate_200ul_pcr',
+             'noncustom'],
+        'plate_96_NIOZholder': 
+            ['biorad_qpcr_plate_nioz_plateholder',
+             'custom'],
+        'non_skirted_plate_96': 
+            ['thermononskirtedinbioradskirted_96_wellplate_200ul',
+             'custom'],
+        'PCR_strips': 
+            ['pcrstrips_96_wellplate_200ul',
+             'custom'],
+        '1.5mL_tubes': 
+            ['opentrons_24_tuberack_eppendorf_1.5ml_safelock_snapcap', 
+             'noncustom'],
+        '5mL_screwcap_tubes': 
+            ['eppendorfscrewcap_15_tuberack_5000ul',
+             'custom'],
+        '5mL_snapcap_tubes': 
+            ['eppendorf_15_tuberack_5000ul',
+             'custom'],
+        '15mL_tubes': 
+            ['opentrons_15_tuberack_falcon_15ml_conical',
+             'noncustom'],
+        '50mL_tubes': 
+            ['opentrons_6_tuberack_falcon_50ml_conical',
+             'noncustom'],
+        '12_Well_Reservoir': 
+            ['nest_12_reservoir_15ml',
+             'noncustom'],
+        'tipone_box_250ml_reservoir':
+            ['tipone_box_250ml_reservoir',
+             'custom']
+        }
+
+class LabwareRegistry:
+    """
+    Index of all custom labware definitions in a folder (and its subfolders),
+    by load name. The folder is indexed at the first lookup, definitions are 
+    kept in memory and are only read again if their file has changed.
+    """
+    def __init__(self, labware_folder):
+        self.labware_folder = labware_folder
+        self.paths = None
+        self.definitions = {}
+
+    def indexing(self):
+        """
+        Reads every labware definition in the folder. If 2 files have the 
+        same load name, the file that is named after the load name is used.
+        """
+        import json
+        import os
+        
+        self.paths = {}
+        self.definitions = {}
+        for folder, subfolders, files in os.walk(self.labware_folder):
+            for file in sorted(files):
+                if not file.endswith('.json'):
+                    continue
+                path = os.path.join(folder, file)
+                with open(path, encoding = 'utf-8') as labware_file:
+                    labware = json.load(labware_file)
+                if 'parameters' not in labware:
+                    continue
+                load_name = labware['parameters']['loadName']
+                if (load_name in self.paths and 
+                    file != f"{load_name}.json"):
+                    continue
+                self.paths[load_name] = path
+                self.definitions[load_name] = (os.path.getmtime(path), 
+                                               labware)
+
+    def get(self, load_name):
+        """
+        Returns the labware definition with this load name.
+        """
+        import json
+        import os
+        
+        if self.paths is None or load_name not in self.paths:
+            self.indexing()
+        if load_name not in self.paths:
+            raise Exception(f"There is no labware definition of {load_name} "
+                            f"in {self.labware_folder}")
+        
+        #### Read the file again if it has changed since it was read
+        path = self.paths[load_name]
+        mtime = os.path.getmtime(path)
+        if self.definitions[load_name][0] != mtime:
+            with open(path, encoding = 'utf-8') as labware_file:
+                self.definitions[load_name] = (mtime, json.load(labware_file))
+        
+        return self.definitions[load_name][1]
+
+    def all_definitions(self):
+        """
+        Returns a dict with the definition of every labware per load name.
+        """
+        if self.paths is None:
+            self.indexing()
+        return {load_name: self.get(load_name) for load_name in self.paths}
+
+#### 1 registry per labware folder, for the whole python process
+REGISTRIES = {}
+
+def labware_registry(labware_folder = 'labware'):
+    """
+    Returns the LabwareRegistry of a labware folder, the same one every time.
+    """
+    if labware_folder not in REGISTRIES:
+        REGISTRIES[labware_folder] = LabwareRegistry(labware_folder)
+    return REGISTRIES[labware_folder]
+
+#### File in data/user_storage with the partly used tip racks per robot
+TIP_LEDGER = 'tip_ledger.json'
+#### The order in which tips are picked up from a rack (A1, B1 ... H12)
+RACK_ORDER = [f"{chr(65 + i)}{j}" for j in range(1, 13) for i in range(8)]
+
+def tip_ledger_path():
+    """
+    Returns the path of the tip ledger, next to the mollab_modules folder.
+    """
+    import os
+    return os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), TIP_LEDGER)
+
+def reading_tip_ledger():
+    """
+    Returns the tip ledger: per robot, per tip rack load name a list with 
+    the number of used tips of every partly used rack, most used first.
+    E.g. {'EVE': {'opentrons_96_filtertiprack_20ul': [80, 37]}}
+    """
+    import json
+    try:
+        with open(tip_ledger_path()) as ledger_file:
+            return json.load(ledger_file)
+    except FileNotFoundError:
+        return {}
+
+def ledger_starting_tip(robot, tip_type, channels = 1):
+    """
+    Parameters
+    ----------
+    robot : string
+        Name of the robot, e.g. 'EVE' / 'WALL_E' / 'MO'
+    tip_type : brand / size or load name
+        opentrons_20uL / tipone_20uL / opentrons_200uL / tipone_300uL
+    channels : int
+        Optional, default 1. 8 for a multichannel pipette, that starts at the
+        next full column
+
+    Returns
+    -------
+    starting_tip : string
+        The first unused tip of the partly used rack with the most tips used,
+        or 'A1' if there is no partly used rack. Use it to calculate the 
+        number_of_tipracks, loading_pipettes with the same robot uses it.
+        Only this 1 rack is used per pipette, because only the first tip 
+        rack of a pipette can start at another tip than A1. The other partly
+        used racks stay in the ledger for later runs.
+    """
+    #### Imports math
+    import math
+    
+    if tip_type in TIP_TYPES:
+        tip_type = TIP_TYPES[tip_type][0]
+    partly_used = reading_tip_ledger().get(robot, {}).get(tip_type, [])
+    if not partly_used:
+        return 'A1'
+    
+    used = max(partly_used)
+    if channels == 8:
+        used = math.ceil(used / 8) * 8
+    if used >= 96:
+        return 'A1'
+    
+    return RACK_ORDER[used]
+
+def recording_tips(robot, pipettes, protocol):
+    """
+    Writes the partly used tip racks of this run in the tip ledger, so the
+    next run on this robot starts with the most used one of them (see 
+    ledger_starting_tip). Call it at the end of the protocol. Nothing is 
+    written while simulating.
+
+    Parameters
+    ----------
+    robot : string
+        Name of the robot, e.g. 'EVE' / 'WALL_E' / 'MO'
+    pipettes : list
+        The loaded pipettes, e.g. [p20, p300], False is skipped
+    protocol : def run(protocol: protocol_api.ProtocolContext):
+
+    Returns
+    -------
+    None.
+    """
+    import json
+    
+    if protocol.is_simulating():
+        return
+    
+    ledger = reading_tip_ledger()
+    robot_ledger = ledger.setdefault(robot, {})
+    
+    for pipette in pipettes:
+        if not pipette or not pipette.tip_racks:
+            continue
+        tip_racks = pipette.tip_racks
+        load_name = tip_racks[0].load_name
+        partly_used = robot_ledger.get(load_name, [])
+        
+        #### Tips that were already used before this run, in the first rack
+        used_before = 0
+        if (pipette.starting_tip is not None and 
+            pipette.starting_tip.parent is tip_racks[0]):
+            used_before = RACK_ORDER.index(pipette.starting_tip.well_name)
+        ## That rack was taken from the ledger
+        if used_before > 0 and partly_used:
+            partly_used.remove(max(partly_used))
+        
+        #### Racks that are partly used after this run
+        for i, tip_rack in enumerate(tip_racks):
+            used = sum(1 for well in tip_rack.wells() if not well.has_tip)
+            if i == 0:
+                used += used_before
+            if 0 < used < 96:
+                partly_used.append(used)
+        robot_ledger[load_name] = sorted(partly_used, reverse = True)
+    
+    with open(tip_ledger_path(), 'w') as ledger_file:
+        json.dump(ledger, ledger_file, indent = 4)
+    
+    return
 
 def loading_pipettes(P20, 
                      tips_20,
@@ -8,7 +263,9 @@ def loading_pipettes(P20,
                      P300, 
                      tips_300,
                      starting_tip_p300,
-                     protocol):
+                     protocol,
+                     multi_channel = False,
+                     robot = False):
     """    
     Parameters
     ----------
@@ -21,6 +278,20 @@ def loading_pipettes(P20,
     tips_300 : labware, a list with loaded tip racks
         Pass the result of loading_tips()
     protocol : def run(protocol: protocol_api.ProtocolContext):
+    multi_channel : Boolean False or string
+        Optional, default False. 'p20' or 'p300' to load the 8-channel 
+        version of that pipette (p20_multi_gen2 / p300_multi_gen2). Only 
+        transferring_reagents and transferring_varying_volumes (Pipetting 
+        Modules v2) use it, for transfers from a full column to a full 
+        column. Everything else is pipetted with the single channel pipette
+        on the other mount, so load that one too. The starting tip of a 
+        multichannel pipette should be in row A.
+    robot : Boolean False or string
+        Optional, default False. Name of the robot, e.g. 'EVE'. If given, the
+        starting tips are read from the tip ledger (see ledger_starting_tip)
+        instead of starting_tip_p20 / starting_tip_p300, and the operator is
+        asked to place the most used partly used rack per pipette first. Call recording_tips at 
+        the end of the protocol to update the ledger.
 
     Returns
     -------
@@ -29,18 +300,42 @@ def loading_pipettes(P20,
     """
 
     if P20:
-        p20 = protocol.load_instrument('p20_single_gen2',
+        if multi_channel == 'p20':
+            pipette_name = 'p20_multi_gen2'
+        else:
+            pipette_name = 'p20_single_gen2'
+        p20 = protocol.load_instrument(pipette_name,
                                        'left',
                                        tip_racks=tips_20)
+        if robot:
+            starting_tip_p20 = ledger_starting_tip(robot, 
+                                                  tips_20[0].load_name,
+                                                  p20.channels)
+            if starting_tip_p20 != 'A1':
+                protocol.comment(f"Place the partly used p20 tip rack "
+                                 f"(starting at {starting_tip_p20}) in "
+                                 f"slot {tips_20[0].parent}")
         p20.starting_tip = tips_20[0].well(starting_tip_p20)
     
     else: 
         p20 = False
     
     if P300:
-        p300 = protocol.load_instrument('p300_single_gen2',
+        if multi_channel == 'p300':
+            pipette_name = 'p300_multi_gen2'
+        else:
+            pipette_name = 'p300_single_gen2'
+        p300 = protocol.load_instrument(pipette_name,
                                         'right',
                                         tip_racks=tips_300)
+        if robot:
+            starting_tip_p300 = ledger_starting_tip(robot, 
+                                                   tips_300[0].load_name,
+                                                   p300.channels)
+            if starting_tip_p300 != 'A1':
+                protocol.comment(f"Place the partly used p300 tip rack "
+                                 f"(starting at {starting_tip_p300}) in "
+                                 f"slot {tips_300[0].parent}")
         p300.starting_tip = tips_300[0].well(starting_tip_p300)
         
     else:
@@ -54,7 +349,8 @@ def loading_tips(simulate,
                  tip_type, 
                  amount, 
                  deck_positions, 
-                 protocol):
+                 protocol,
+                 robot = False):
     """   
     Parameters
     ----------
@@ -67,26 +363,17 @@ def loading_tips(simulate,
     deck_positions : list
         Where do you want the tip_racks to be located on the deck
     protocol : def run(protocol: protocol_api.ProtocolContext):
+    robot : Boolean False or string
+        Optional, default False. Name of the robot, e.g. 'EVE'. If given and
+        not simulating, the labware offsets of this robot are set, see
+        LabwareOffsets. Raises if there are no offsets for this labware
 
     Returns
     -------
     tip_racks : list of labware
         List with all tip racks for one of the pipettes
     """
-    labware_dict = {
-            'opentrons_20uL':
-                ['opentrons_96_filtertiprack_20ul',
-                 'noncustom'],
-            'tipone_20uL': 
-                ['tipone_96_tiprack_20ul',
-                 'custom'],
-            'opentrons_200uL': 
-                ['opentrons_96_filtertiprack_200ul', 
-                 'noncustom'],
-            'tipone_300uL': 
-                ['tipone_96_tiprack_300ul',
-                 'custom'],
-            }
+    labware_dict = TIP_TYPES
     
     tip_racks = []
     
@@ -94,12 +381,7 @@ def loading_tips(simulate,
         rack_name = f"{tip_type}_{i + 1}"
         
         if simulate and labware_dict[tip_type][1] == 'custom':
-            import json
-            with open(
-                    f"labware/"
-                    f"{labware_dict[tip_type][0]}/"
-                    f"{labware_dict[tip_type][0]}.json") as labware_file:
-                labware = json.load(labware_file)
+            labware = labware_registry().get(labware_dict[tip_type][0])
             tip_rack = protocol.load_labware_from_definition( 
                 labware, 
                 deck_positions[i],                    
@@ -113,6 +395,11 @@ def loading_tips(simulate,
     
         tip_racks.append(tip_rack)
 
+    #### Labware offsets of the robot
+    if robot and not simulate:
+        from data.user_storage.mollab_modules import LabwareOffsets as LO
+        LO.setting_offsets(tip_racks, robot)
+
     return tip_racks
         
 #==============================================================================
@@ -122,7 +409,8 @@ def loading_tube_racks(simulate,
                        reagent_type, 
                        amount, 
                        deck_positions, 
-                       protocol):
+                       protocol,
+                       robot = False):
     """
     Parameters
     ----------
@@ -139,6 +427,10 @@ def loading_tube_racks(simulate,
     deck_positions : list
         Where do you want these racks located on the deck
     protocol : def run(protocol: protocol_api.ProtocolContext):
+    robot : Boolean False or string
+        Optional, default False. Name of the robot, e.g. 'EVE'. If given and
+        not simulating, the labware offsets of this robot are set, see
+        LabwareOffsets. Raises if there are no offsets for this labware
 
     Returns
     -------
@@ -147,53 +439,14 @@ def loading_tube_racks(simulate,
 
     """
       
-    labware_dict = {
-            'skirted_plate_96':
-                ['biorad_96_wellplate_200ul_pcr',
-                 'noncustom'],
-            'plate_96_NIOZholder': 
-                ['biorad_qpcr_plate_nioz_plateholder',
-                 'custom'],
-            'non_skirted_plate_96': 
-                ['thermononskirtedinbioradskirted_96_wellplate_200ul',
-                 'custom'],
-            'PCR_strips': 
-                ['pcrstrips_96_wellplate_200ul',
-                 'custom'],
-            '1.5mL_tubes': 
-                ['opentrons_24_tuberack_eppendorf_1.5ml_safelock_snapcap', 
-                 'noncustom'],
-            '5mL_screwcap_tubes': 
-                ['eppendorfscrewcap_15_tuberack_5000ul',
-                 'custom'],
-            '5mL_snapcap_tubes': 
-                ['eppendorf_15_tuberack_5000ul',
-                 'custom'],
-            '15mL_tubes': 
-                ['opentrons_15_tuberack_falcon_15ml_conical',
-                 'noncustom'],
-            '50mL_tubes': 
-                ['opentrons_6_tuberack_falcon_50ml_conical',
-                 'noncustom'],
-            '12_Well_Reservoir': 
-                ['nest_12_reservoir_15ml',
-                 'noncustom'],
-            'tipone_box_250ml_reservoir':
-                ['tipone_box_250ml_reservoir',
-                 'custom']
-            }
+    labware_dict = TUBE_TYPES
     tube_racks = []
     
     for i in range(amount):
         rack_name = f"{i + 1}_{reagent_type}_{tube_type}"
         
         if simulate and labware_dict[tube_type][1] == 'custom':
-            import json
-            with open(
-                    f"labware/"
-                    f"{labware_dict[tube_type][0]}/"
-                    f"{labware_dict[tube_type][0]}.json") as labware_file:
-                labware = json.load(labware_file)
+            labware = labware_registry().get(labware_dict[tube_type][0])
             tube_rack = protocol.load_labware_from_definition( 
                 labware, 
                 deck_positions[i],                    
@@ -206,30 +459,16 @@ def loading_tube_racks(simulate,
          
     
         tube_racks.append(tube_rack)
+    
+    #### Labware offsets of the robot
+    if robot and not simulate:
+        from data.user_storage.mollab_modules import LabwareOffsets as LO
+        LO.setting_offsets(tube_racks, robot)
         
     return tube_racks
 
-def defining_liquids(reagent_type, 
-                     protocol):
-    """
-    Parameters
-    ----------
-    reagent_type: 
-        Discribe the reagent type. See reagent_dict in defining_liquids for the
-        options.
-    volume: int
-        What is the volume that is present in the tube? If this is not clear,
-        put in '1'
-     protocol : def run(protocol: protocol_api.ProtocolContext):
-         
-    Returns
-    -------
-    liquid: 
-        A defined liquid with a certain color from the dictonary.
-    
-    """
-    
-    reagent_dict = {
+#### Name, description and display color per reagent_type
+LIQUID_TYPES = {
         'mastermix': ['Mastermix', 'Mastermix tube', '#FF0000'],
         'forward_primer': ['Forward Primers', 'Forward primer strips', '#00FF00'],
         'reverse_primer': ['Reverse Primers', 'Revers primer strips', '#00F3FF'],
@@ -256,14 +495,73 @@ def defining_liquids(reagent_type,
         'Qbitstd1': ['Qubit standard 1', 'Qubit standard 1','#00FFEE'],
         'other': ['Other', 'remaining liquids','#000000'],
         }
+
+#### Liquids that are already defined, per protocol and reagent_type. The
+#### protocols are weak references, so the liquids go with the protocol.
+LIQUIDS = weakref.WeakKeyDictionary()
+
+def defining_liquids(reagent_type, 
+                     protocol):
+    """
+    Defines the liquid of a reagent type once per protocol, every next call
+    returns the same liquid.
+
+    Parameters
+    ----------
+    reagent_type: 
+        Discribe the reagent type. See LIQUID_TYPES for the options.
+     protocol : def run(protocol: protocol_api.ProtocolContext):
+         
+    Returns
+    -------
+    liquid: 
+        A defined liquid with a certain color from LIQUID_TYPES.
     
-    liquid = protocol.define_liquid(
-               name= reagent_dict[reagent_type][0],
-               description= reagent_dict[reagent_type][1],
-               display_color= reagent_dict[reagent_type][2],
-               )
-    
-    return liquid
+    """
+    liquids = LIQUIDS.setdefault(protocol, {})
+    if reagent_type not in liquids:
+        name, description, display_color = LIQUID_TYPES[reagent_type]
+        liquids[reagent_type] = protocol.define_liquid(
+            name = name,
+            description = description,
+            display_color = display_color,
+            )
+
+    return liquids[reagent_type]
+
+def loading_liquid(wells, 
+                   liquid, 
+                   volume, 
+                   protocol):
+    """
+    Loads a liquid in a group of wells. From apiLevel 2.22 on, this is done
+    with 1 call per labware, before that 1 call per well.
+
+    Parameters
+    ----------
+    wells : list
+        List with the tubes/wells that contain the liquid
+    liquid : 
+        A liquid from defining_liquids
+    volume: int
+        What is the volume that is present in the tube? If this is not clear,
+        put in '1'
+     protocol : def run(protocol: protocol_api.ProtocolContext):
+
+    """
+    if protocol.api_version < (2, 22):
+        for well in wells:
+            well.load_liquid(liquid, volume)
+        return
+
+    #### Group the wells per labware
+    labware_wells = {}
+    for well in wells:
+        labware_wells.setdefault(well.parent, []).append(well)
+    for labware, group in labware_wells.items():
+        labware.load_liquid(group, volume, liquid)
+
+    return
 
 def tube_locations(source_racks,
                    specific_columns,
@@ -284,8 +582,7 @@ def tube_locations(source_racks,
     number_of_tubes : int
         How many tubes/wells are used for this specific type
     reagent_type: 
-        Discribe the reagent type. See reagent_dict in defining_liquids for the
-        options.
+        Discribe the reagent type. See LIQUID_TYPES for the options.
     volume: int
         What is the volume that is present in the tube? If this is not clear,
         put in '1'
@@ -299,39 +596,15 @@ def tube_locations(source_racks,
         the function defining_liquids
 
     """
-    #### Make an empty list to append tubes/wells to
-    tubes = []
-    
-    #### Append all wells from all racks to the list
-    if not specific_columns:
-        for rack in source_racks:
-            for tube in rack.wells():
-                tubes.append(tube)
-    
-    else: # if specific_columns
-        ## Separate racks into specified columns
-        for rack in source_racks:
-            rack_columns = (
-                [rack.columns_by_name()[column]
-                for column in specific_columns])
-            ## Separate columns into wells and add wells to list
-            for column in rack_columns:
-                for well in column:
-                    tubes.append(well)
+    from data.user_storage.mollab_modules import WellSelection as WS
 
-    #### Remove tubes/wells to skip
-    if skip_wells:
-        for index in sorted(skip_wells, reverse=True):
-            del tubes[index]
-            # In reverse order, so that the index does not shift
+    #### Index all (specific columns of the) wells and select the tubes
+    selector = WS.WellSelector(source_racks, specific_columns)
+    tubes = list(selector.wells(selector.selecting(number_of_tubes,
+                                                   skip_wells)))
 
-    #### Cut off the list, after a specified number of tubes/wells    
-    tubes = tubes[:number_of_tubes]                       
-    
     liquid = defining_liquids(reagent_type, protocol)
-    
-    for well in tubes:
-        well.load_liquid(liquid, volume)
+    loading_liquid(tubes, liquid, volume, protocol)
         
     return tubes
 
@@ -351,8 +624,8 @@ def multiple_tube_locations(source_racks,
     skip_wells : False or list with indexes
         List with indexes of wells to skip
     amount_dict: dict
-        Dict containing the names of the liquids, see reagent_dict in 
-        defining_liquids for the options and the numbers of how many times it 
+        Dict containing the names of the liquids, see LIQUID_TYPES for the 
+        options and the numbers of how many times it 
         is present in the rack.
     volume: int
         What is the volume that is present in the tube? If this is not clear,
@@ -368,40 +641,18 @@ def multiple_tube_locations(source_racks,
 
     """
 
-    #### Make an empty list to append tubes/wells to
-    total_tubes = []
-    
-    #### Append all wells from all racks to the list
-    if not specific_columns:
-        for rack in source_racks:
-            for tube in rack.wells():
-                total_tubes.append(tube)
-    
-    else: # if specific_columns
-        ## Separate racks into specified columns
-        for rack in source_racks:
-            rack_columns = (
-                [rack.columns_by_name()[column]
-                for column in specific_columns])
-            ## Separate columns into wells and add wells to list
-            for column in rack_columns:
-                for well in column:
-                    total_tubes.append(well)
-    
-    #### Remove total_tubes/wells to skip
-    if skip_wells:
-        for index in sorted(skip_wells, reverse=True):
-            del total_tubes[index]
-            # In reverse order, so that the index does not shift
+    from data.user_storage.mollab_modules import WellSelection as WS
+
+    #### Index all (specific columns of the) wells and divide them over the
+    #### reagents, in the order of amount_dict
+    selector = WS.WellSelector(source_racks, specific_columns)
+    selections = selector.allocating(list(amount_dict.values()), skip_wells)
 
-                   
     # Creates a new list. This will be the variable that is used for the return value
     return_list = []    
 
-    # For-loop to iterate through the dict. In the loop the following will happen
-    for reagent, number in amount_dict.items():
-        # Creates a variable depending on the amount of reactions
-        tubes_reagent = (total_tubes[slice(number)])
+    for reagent, selection in zip(amount_dict, selections):
+        tubes_reagent = list(selector.wells(selection))
         return_list.append(tubes_reagent)
         
         # Calls function definging_liquids depending on the reagent in the dict
@@ -409,18 +660,22 @@ def multiple_tube_locations(source_racks,
         liquid = defining_liquids(reagent, protocol)
         
         # Paints every liquid the right color
-        for well in tubes_reagent:
-            well.load_liquid(liquid, volume)
-        
-        # Deletes the used wells from the list
-        total_tubes = total_tubes[number:]
+        loading_liquid(tubes_reagent, liquid, volume, protocol)
     
     return return_list
 
 
+#### How much volume can a tube hold? In the order of size.
+TUBE_VOLUMES = {'1.5mL_tubes'          : 1500,
+                '5mL_screwcap_tubes'   : 5000,
+                '15mL_tubes'           : 15000,
+                '50mL_tubes'           : 50000
+                }
+
 def which_tube_type(total_volume, tube_type):
     """
-    depending on total_volume a specific tube is necesarry  
+    depending on total_volume a specific tube is necesarry. See packing_tubes
+    to take the dead volume into account and to combine tube types.
 
     Parameters
     ----------
@@ -441,26 +696,114 @@ def which_tube_type(total_volume, tube_type):
     #### Import math module to allow rounding up
     import math
 
-    #### How much volume can a tube hold?
-    tube_dict = {'1.5mL_tubes'          : 1500,
-                 '5mL_screwcap_tubes'   : 5000,
-                 '15mL_tubes'           : 15000,
-                 '50mL_tubes'           : 50000
-                 }    
-    
     if not tube_type:
-        for key, value in tube_dict.items():
+        for key, value in TUBE_VOLUMES.items():
             if value >= total_volume:
                 tube_type = key
                 break
             tube_type = '50mL_tubes'
     
-    max_volume = tube_dict[tube_type]
+    max_volume = TUBE_VOLUMES[tube_type]
     number_of_tubes = math.ceil((total_volume)/max_volume)
 
                     
     return tube_type, number_of_tubes, max_volume
 
+def tube_capacity(tube_type):
+    """
+    Returns the dead volume and the usable volume of a tube in µL. The dead 
+    volume is the volume below the lowest liquid height that can be 
+    aspirated from (see VolumeTracking), the usable volume is the rest of the 
+    volume up to the max_fill_height or the volume of the tube.
+    """
+    from data.user_storage.mollab_modules import VolumeTracking as VT
+
+    dead_volume = float(VT.height_to_volume(
+        tube_type, VT.MIN_PIPETTING_HEIGHT + VT.IMMERSION_DEPTH))
+    max_volume = min(TUBE_VOLUMES[tube_type], float(VT.height_to_volume(
+        tube_type, VT.TUBE_DIMENSIONS[tube_type]['max_fill_height'])))
+
+    return dead_volume, max_volume - dead_volume
+
+def packing_tubes(total_volume, 
+                  tube_types = False, 
+                  mixing_types = True,
+                  extra = 0):
+    """
+    Chooses the tubes for a reagent: as few tubes as possible (so also as 
+    few 'Continue with tube' switches), then as few different tube types 
+    (racks) as possible, then the smallest tubes. Tube types can be combined, 
+    e.g. 1 x 15mL_tubes for 5.2 mL instead of 2 x 5mL_screwcap_tubes. 
+    Every tube gets its dead volume on top of the volume it supplies.
+
+    Parameters
+    ----------
+    total_volume : float
+        volume in µL that has to be pipetted from the tubes
+    tube_types : Boolean False or list
+        Optional, default False. The tube types that can be used, default all
+        tube types of TUBE_VOLUMES
+    mixing_types : Boolean True or False
+        Optional, default True. If False, all tubes are of 1 tube type, e.g.
+        for a protocol that loads 1 tube rack
+    extra : float
+        Optional, default 0. Fraction of total_volume that is put in the 
+        tubes on top of it, as a margin for pipetting errors, e.g. 0.2 for
+        20% extra
+
+    Raises
+    ------
+    Exception
+        If total_volume is not positive
+
+    Returns
+    -------
+    tube_types : list
+        tube_type per tube, in the order of use (largest first)
+    fill_volumes : list
+        volume in µL to put in every tube, e.g. the start_volume of a 
+        VolumeTracker.VolumeTracker
+    """
+    import math
+    import itertools
+
+    if total_volume <= 0:
+        raise Exception("The total volume has to be more than 0 µL")
+    total_volume = total_volume * (1 + extra)
+    if not tube_types:
+        tube_types = list(TUBE_VOLUMES)
+    capacities = {tube_type: tube_capacity(tube_type) 
+                  for tube_type in tube_types}
+
+    #### The fewest tubes that hold the total volume, tried for 1, 2 ... 
+    #### tubes. With only the largest tube type it always fits.
+    largest = max(capacities[tube_type][1] for tube_type in tube_types)
+    for number_of_tubes in range(1, math.ceil(total_volume / largest) + 1):
+        options = [combination for combination in 
+                   itertools.combinations_with_replacement(tube_types, 
+                                                           number_of_tubes)
+                   if sum(capacities[tube_type][1] 
+                          for tube_type in combination) >= total_volume
+                   and (mixing_types or len(set(combination)) == 1)]
+        if options:
+            break
+    combination = min(options, key = lambda combination: (
+        len(set(combination)),
+        sum(capacities[tube_type][1] for tube_type in combination)))
+
+    #### Fill the largest tubes first, the last tube gets the rest
+    combination = sorted(combination, key = lambda tube_type: 
+                         -capacities[tube_type][1])
+    fill_volumes = []
+    remaining = total_volume
+    for tube_type in combination:
+        dead_volume, usable_volume = capacities[tube_type]
+        volume = min(usable_volume, remaining)
+        remaining -= volume
+        fill_volumes.append(math.ceil(volume + dead_volume))
+
+    return combination, fill_volumes
+
 #=============================================================================
 
 # def number_of_racks(number_of_tubes, tube_type, strip_columns):
@@ -523,60 +866,131 @@ def number_of_tipracks(starting_tip,
 
 #=============================================================================
 
+#### Pipetting actions of amount_of_tips
+TIP_ACTIONS = ['transferring', 'aliquoting']
+
 def amount_of_tips(volumes,
                    number_of_transfers,
                    tip_change,
-                   max_p20_volume):
+                   max_p20_volume = False,
+                   sources = False,
+                   tip_policy = 'always_new',
+                   max_tip_uses = 8,
+                   action = False):
     """
+    Counts the tips that the Pipetting_Modules_v2 use for these volumes, by
+    dry-running them, see DryRun. The volumes are transferred 
+    (transferring_reagents / transferring_varying_volumes) or aliquoted from
+    1 reagent (aliquoting_reagent / aliquoting_varying_volumes), see action.
+
     Parameters
     ----------
    volumes : float or list of floats
-        The volume(s) to be aliquoted or transfered
+        The volume(s) to be aliquoted or transfered, 0 is skipped
     number_of_transfers : int
-        How many pipetting actions will be performed will be made
+        How many pipetting actions will be performed will be made, only used
+        for a single volume
     tip_change : int
-        After how many transfers do you want to change the tip?
-    max_p20_volume: float
-        What is the maximum volume that the p20 can handle? This depends on 
-        optional airgap and mix_volume
+        After how many aliquots do you want to change the tip? Only used for
+        aliquoting a single volume, see Pipetting_Modules_v2.aliquoting_reagent
+    max_p20_volume: Boolean False or float
+        Deprecated, gives a DeprecationWarning. The pipette is chosen like in
+        the Pipetting_Modules_v2, see Pipetting_Modules_v2.selecting_pipette
+    sources : Boolean False or list
+        Optional, default False. The source well of every transfer, needed
+        to count the tips that are used again with a tip_policy
+    tip_policy : string
+        Optional, default 'always_new'. The tip_policy of 
+        Pipetting_Modules_v2.transferring_reagents, for a single volume
+    max_tip_uses : int
+        Optional, default 8. Maximum number of transfers per tip for 
+        'per_source_until_n'
+    action : Boolean False or string
+        'transferring' / 'aliquoting', see TIP_ACTIONS. If False (deprecated),
+        the volumes are transferred with tip_change 1 and aliquoted 
+        otherwise, with a DeprecationWarning
+    
+    Raises
+    ------
+    Exception
+        If the action is unknown
     
     Returns
     -------
     p20_tips_needed : number of single p20 pipette tips used
     p300_tips_needed : number of single p300 pipette tips used
     """
-    #### Imports math
-    import math
+    import warnings
+    from data.user_storage.mollab_modules import DryRun as DR
+    from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
     
-    ### Make 2 counters
-    p20_tips_needed = 0
-    p300_tips_needed = 0
+    if max_p20_volume is not False:
+        warnings.warn("max_p20_volume of amount_of_tips is not used, the "
+                      "pipette is chosen by Pipetting_Modules_v2."
+                      "selecting_pipette", DeprecationWarning, stacklevel = 2)
+    if not action:
+        warnings.warn("Give the action of amount_of_tips ('transferring' / "
+                      "'aliquoting'), it is no longer derived from "
+                      "tip_change", DeprecationWarning, stacklevel = 2)
+        action = 'transferring' if tip_change == 1 else 'aliquoting'
+    if action not in TIP_ACTIONS:
+        raise Exception(f"Unknown action {action}, choose from {TIP_ACTIONS}")
     
-    ### Check whether it's a list or a single int
-    if isinstance(volumes,list):
-        ## Make 2 counters
-
-        # Creates a for loop to go through the list of volumes
-        # Count up specific pipette use
-        for value in volumes: 
-            if 0 < value <= max_p20_volume:
-                p20_tips_needed += 1
-            elif value > max_p20_volume:
-                p300_tips_needed += 1
-
+    #### The volume of every pipetting action, the modules skip 0 µL
+    if isinstance(volumes, list):
+        varying = True
     else:
-        if 0 < volumes <= max_p20_volume: # Checks if the desired volume is between 0.001 and 19
-            p20_tips_needed = number_of_transfers 
-
-        elif volumes > max_p20_volume: # Checks if the desired volume is bigger than 19
-            p300_tips_needed = number_of_transfers
+        varying = False
+        volumes = [volumes] * number_of_transfers
+    destination_wells = DR.dry_run_wells(len(volumes))
     
-
-    # Calculates the tips needed by deviding the number of tips needed for the reagents by 16 (and rounding up) + the tips needed for the transfering of the samples.
-    p20_tips_needed = math.ceil(p20_tips_needed/tip_change)
-    p300_tips_needed = math.ceil(p300_tips_needed/tip_change)
+    #### Transfers, with a dry-run well per source
+    if action == 'transferring':
+        if sources:
+            source_wells = {}
+            for source in sources:
+                if source not in source_wells:
+                    source_wells[source] = len(source_wells)
+            wells = DR.dry_run_wells(len(source_wells))
+            source_wells = [wells[source_wells[source]] for source in sources]
+        else:
+            source_wells = DR.dry_run_wells(len(volumes))
+        if varying:
+            step = (PM.transferring_varying_volumes, {
+                'source_wells': source_wells,
+                'destination_wells': destination_wells,
+                'transfer_volumes': volumes,
+                'airgap': True,
+                'mix': False})
+        else:
+            step = (PM.transferring_reagents, {
+                'source_wells': source_wells,
+                'destination_wells': destination_wells,
+                'transfer_volume': volumes[0],
+                'airgap': True,
+                'mix': False,
+                'tip_policy': tip_policy,
+                'max_tip_uses': max_tip_uses})
     
-    return p20_tips_needed , p300_tips_needed
+    #### Aliquots, from 1 reagent tube that never runs empty
+    else:
+        reagent = {'reagent_source': DR.dry_run_wells(1),
+                   'reagent_tube_type': '50mL_tubes',
+                   'reagent_startvolume': 50000,
+                   'destination_wells': destination_wells,
+                   'action_at_bottom': 'continue_at_bottom',
+                   'pause': False}
+        if varying:
+            step = (PM.aliquoting_varying_volumes, {
+                **reagent,
+                'aliquot_volumes': volumes})
+        else:
+            step = (PM.aliquoting_reagent, {
+                **reagent,
+                'aliquot_volume': volumes[0],
+                'tip_change': tip_change})
+    
+    return DR.counting_plan_tips([step])
 
 #=============================================================================
 
@@ -620,7 +1034,7 @@ def number_of_tip_racks_2_0(volumes_aliquoting,
         tips_aliquoting = amount_of_tips(volumes = volumes_aliquoting,
                                          number_of_transfers = number_of_aliquotes,
                                          tip_change = 16,
-                                         max_p20_volume = 19)
+                                         action = 'aliquoting')
                 
     else:
         tips_aliquoting = (0,0)
@@ -629,7 +1043,7 @@ def number_of_tip_racks_2_0(volumes_aliquoting,
         tips_transfering = amount_of_tips(volumes = volumes_transfering,
                                           number_of_transfers = number_of_transfers,
                                           tip_change = 1,
-                                          max_p20_volume = 15)
+                                          action = 'transferring')
     else:
         tips_transfering = (0,0)
 
@@ -641,4 +1055,55 @@ def number_of_tip_racks_2_0(volumes_aliquoting,
     tip_racks_p300, P300 = number_of_tipracks(starting_tip_p300,
                                               amount_tips_300)
     
-    return tip_racks_p20, tip_racks_p300, P20, P300
\ No newline at end of file
+    return tip_racks_p20, tip_racks_p300, P20, P300
+
+def number_of_tip_racks_dry_run(steps,
+                                starting_tip_p20,
+                                starting_tip_p300,
+                                multi_channel = False,
+                                tip_volumes = (20, 200)):
+    """
+    Number of tip racks from the exact number of tips that the pipetting 
+    steps use, for protocols with other steps than number_of_tip_racks_2_0 
+    (aliquoting, then transferring). The steps are dry-run before any 
+    labware is loaded, see DryRun.dry_running.
+
+    Parameters
+    ----------
+    steps : list
+        A (function, arguments) tuple per Pipetting_Modules_v2 function call,
+        see DryRun.dry_running
+    starting_tip_p20 : string
+        Well coordinate of the starting tip for the p20 pipette, e.g, 'A1'
+    starting_tip_p300 : string
+        Well coordinate of the starting tip for the p300 pipette, e.g, 'A1'
+    multi_channel : Boolean False or string
+        Optional, default False. 'p20' or 'p300' if that pipette is an
+        8-channel pipette
+    tip_volumes : tuple
+        Optional, default (20, 200). Max volume in µL of the p20 and p300 tips
+
+    Returns
+    -------
+    tip_racks_p20 : int
+        Number of tip racks for the p20 tips
+    tip_racks_p300 : int
+        Number of tip racks for the p300 tips
+    P20 : Boolean
+        True if any p20 tips are needed
+    P300 : Boolean
+        True if any p300 tips are needed
+    """
+    from data.user_storage.mollab_modules import DryRun as DR
+
+    amount_tips_20, amount_tips_300 = DR.counting_plan_tips(
+        steps, 
+        multi_channel = multi_channel, 
+        tip_volumes = tip_volumes)
+    
+    tip_racks_p20, P20 = number_of_tipracks(starting_tip_p20,
+                                            amount_tips_20)
+    tip_racks_p300, P300 = number_of_tipracks(starting_tip_p300,
+                                              amount_tips_300)
+    
+    return tip_racks_p20, tip_racks_p300, P20, P300
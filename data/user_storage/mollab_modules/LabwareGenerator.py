@@ -0,0 +1,313 @@
+"""
+version: Jan_2024
+Module to generate custom labware from a compact spec, instead of editing
+the well entries of a definition by hand. A spec describes a regular grid of
+wells (see generating_definition), all specs are in labware/labware_specs.json.
+From a spec the definition json, the test protocol with the definition in it
+(test_<load name>.py) and the stored geometry (see LabwareGeometry) are made.
+
+Regenerate all labware of labware_specs.json, from the root of the repository:
+    python -m data.user_storage.mollab_modules.LabwareGenerator
+or only some of them:
+    python -m data.user_storage.mollab_modules.LabwareGenerator pcrstrips_96_wellplate_200ul
+Files whose content does not change are not written again.
+"""
+import json
+import os
+import re
+
+SPEC_FILE = 'labware_specs.json'
+#### Test protocols that new labware gets a copy of, with its own definition
+TEST_TEMPLATES = {
+    'labware': os.path.join('eppendorf_15_tuberack_5000ul',
+                            'test_eppendorf_15_tuberack_5000ul.py'),
+    'tiprack': os.path.join('tipone_96_tiprack_20ul',
+                            'test_tipone_96_tiprack_20ul.py')}
+#### The line of a test protocol with the definition in it
+DEFINITION_LINE = re.compile(r'^(\w+_DEF_JSON = """).*(""")$', re.MULTILINE)
+PIPETTE_LINE = re.compile(r"^PIPETTE_NAME = '.*'$", re.MULTILINE)
+
+def number(value):
+    """
+    Rounds a coordinate to µm, whole numbers as int like in the definitions
+    of the Opentrons Labware Creator.
+    """
+    value = round(value, 3)
+    if value == int(value):
+        return int(value)
+    return value
+
+def generating_definition(spec):
+    """
+    Makes a labware definition (schema 2) from a spec.
+
+    Parameters
+    ----------
+    spec : dict
+        'load_name', 'display_name', 'display_category', 'brand',
+        'dimensions': [x, y, z] of the labware in mm,
+        'grid': [rows, columns],
+        'pitch': [x, y] in mm between the columns and between the rows,
+        'offset': [x, y, z] in mm of the centre of the bottom of well A1,
+        'well': {'depth': mm, 'volume': µL, 'shape': 'circular' with
+                 'diameter', or 'rectangular' with 'size': [x, y]}
+        Optional: 'volume_units' (µL), 'brand_id' ([]), 'links',
+        'bottom_shape' ('v' / 'u' / 'flat'), 'group_category',
+        'tip_length' (mm, makes it a tip rack), 'quirks' ([]),
+        'format' ('irregular'), 'namespace' ('custom_beta')
+
+    Returns
+    -------
+    definition : dict
+    """
+    rows, columns = spec['grid']
+    pitch_x, pitch_y = spec['pitch']
+    offset_x, offset_y, offset_z = spec['offset']
+    well = spec['well']
+
+    ordering = [[f"{chr(65 + row)}{column + 1}" for row in range(rows)]
+                for column in range(columns)]
+
+    wells = {}
+    for column, names in enumerate(ordering):
+        for row, name in enumerate(names):
+            wells[name] = {'depth': well['depth'],
+                           'totalLiquidVolume': well['volume'],
+                           'shape': well['shape']}
+            if well['shape'] == 'circular':
+                wells[name]['diameter'] = well['diameter']
+            else:
+                wells[name]['xDimension'] = well['size'][0]
+                wells[name]['yDimension'] = well['size'][1]
+            wells[name]['x'] = number(offset_x + column * pitch_x)
+            wells[name]['y'] = number(offset_y - row * pitch_y)
+            wells[name]['z'] = offset_z
+
+    brand = {'brand': spec['brand'], 'brandId': spec.get('brand_id', [])}
+    if 'links' in spec:
+        brand['links'] = spec['links']
+
+    group_metadata = {}
+    if spec.get('bottom_shape'):
+        group_metadata['wellBottomShape'] = spec['bottom_shape']
+    if spec.get('group_category'):
+        group_metadata['displayCategory'] = spec['group_category']
+
+    parameters = {'format': spec.get('format', 'irregular'),
+                  'quirks': spec.get('quirks', []),
+                  'isTiprack': bool(spec.get('tip_length'))}
+    if spec.get('tip_length'):
+        parameters['tipLength'] = spec['tip_length']
+    parameters['isMagneticModuleCompatible'] = False
+    parameters['loadName'] = spec['load_name']
+
+    return {
+        'ordering': ordering,
+        'brand': brand,
+        'metadata': {'displayName': spec['display_name'],
+                     'displayCategory': spec['display_category'],
+                     'displayVolumeUnits': spec.get('volume_units', 'µL'),
+                     'tags': []},
+        'dimensions': {'xDimension': spec['dimensions'][0],
+                       'yDimension': spec['dimensions'][1],
+                       'zDimension': spec['dimensions'][2]},
+        'wells': wells,
+        'groups': [{'metadata': group_metadata,
+                    'wells': [name for names in ordering for name in names]}],
+        'parameters': parameters,
+        'namespace': spec.get('namespace', 'custom_beta'),
+        'version': 1,
+        'schemaVersion': 2,
+        'cornerOffsetFromSlot': {'x': 0, 'y': 0, 'z': 0}}
+
+def extracting_spec(definition, path):
+    """
+    Makes the spec of an existing definition with a regular grid of equal
+    wells, so that generating_definition gives the same definition.
+
+    Raises
+    ------
+    Exception
+        If the wells are not in 1 regular grid
+    """
+    ordering = definition['ordering']
+    wells = definition['wells']
+    first = wells[ordering[0][0]]
+    rows, columns = len(ordering[0]), len(ordering)
+
+    well = {'depth': first['depth'],
+            'volume': first['totalLiquidVolume'],
+            'shape': first['shape']}
+    if first['shape'] == 'circular':
+        well['diameter'] = first['diameter']
+    else:
+        well['size'] = [first['xDimension'], first['yDimension']]
+
+    pitch_x = number(wells[ordering[1][0]]['x'] - first['x']) if (
+        columns > 1) else 0
+    pitch_y = number(first['y'] - wells[ordering[0][1]]['y']) if (
+        rows > 1) else 0
+
+    group = definition['groups'][0]['metadata'] if (
+        len(definition['groups']) == 1) else None
+    spec = {'path': path,
+            'load_name': definition['parameters']['loadName'],
+            'display_name': definition['metadata']['displayName'],
+            'display_category': definition['metadata']['displayCategory'],
+            'volume_units': definition['metadata']['displayVolumeUnits'],
+            'brand': definition['brand']['brand'],
+            'brand_id': definition['brand']['brandId'],
+            'dimensions': [definition['dimensions']['xDimension'],
+                           definition['dimensions']['yDimension'],
+                           definition['dimensions']['zDimension']],
+            'grid': [rows, columns],
+            'pitch': [pitch_x, pitch_y],
+            'offset': [first['x'], first['y'], first['z']],
+            'well': well,
+            'bottom_shape': (group or {}).get('wellBottomShape'),
+            'group_category': (group or {}).get('displayCategory'),
+            'tip_length': definition['parameters'].get('tipLength'),
+            'quirks': definition['parameters'].get('quirks', []),
+            'format': definition['parameters']['format'],
+            'namespace': definition['namespace']}
+    if 'links' in definition['brand']:
+        spec['links'] = definition['brand']['links']
+
+    if group is None or generating_definition(spec) != definition:
+        raise Exception(f"{path} is not a regular grid of equal wells")
+
+    #### Leave out what is the default
+    defaults = {'volume_units': 'µL', 'bottom_shape': None,
+                'group_category': None, 'tip_length': None, 'quirks': [],
+                'format': 'irregular', 'namespace': 'custom_beta'}
+    return {key: value for key, value in spec.items()
+            if key not in defaults or value != defaults[key]}
+
+def test_protocol(definition, template, pipette_name = False):
+    """
+    Returns the text of a test protocol: the template with this definition
+    (and pipette) in it.
+    """
+    definition_json = json.dumps(definition, ensure_ascii = False,
+                                 separators = (',', ':'))
+    text = DEFINITION_LINE.sub(
+        lambda match: match.group(1) + definition_json + match.group(2),
+        template)
+    if pipette_name:
+        text = PIPETTE_LINE.sub(f"PIPETTE_NAME = '{pipette_name}'", text)
+    return text
+
+def writing_file(path, text):
+    """
+    Writes a file if its content changes, returns True if it was written.
+    """
+    if os.path.isfile(path):
+        with open(path, encoding = 'utf-8') as old_file:
+            if old_file.read() == text:
+                return False
+    with open(path, 'w', encoding = 'utf-8') as new_file:
+        new_file.write(text)
+    return True
+
+def writing_labware(spec, labware_folder = 'labware'):
+    """
+    Generates the definition json, the test protocol and the stored geometry
+    of 1 spec. The json is only written if the definition changes, so
+    hand-formatted files stay as they are.
+
+    Returns
+    -------
+    written : list
+        Paths of the files that were written
+    """
+    from data.user_storage.mollab_modules import LabwareGeometry as LG
+
+    definition = generating_definition(spec)
+    path = os.path.join(labware_folder, spec.get(
+        'path', os.path.join(spec['load_name'], f"{spec['load_name']}.json")))
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok = True)
+    written = []
+
+    #### Definition
+    old_definition = None
+    if os.path.isfile(path):
+        with open(path, encoding = 'utf-8') as old_file:
+            old_definition = json.load(old_file)
+    if old_definition != definition:
+        writing_file(path, json.dumps(definition, indent = 4,
+                                      ensure_ascii = False))
+        written.append(path)
+
+    #### Test protocol, an existing one keeps its own text around the
+    #### definition
+    test_path = os.path.join(folder, f"test_{spec['load_name']}.py")
+    if os.path.isfile(test_path):
+        template_path = test_path
+    elif spec.get('tip_length'):
+        template_path = os.path.join(labware_folder, TEST_TEMPLATES['tiprack'])
+    else:
+        template_path = os.path.join(labware_folder, TEST_TEMPLATES['labware'])
+    with open(template_path, encoding = 'utf-8') as template_file:
+        template = template_file.read()
+    if writing_file(test_path, test_protocol(definition, template,
+                                             spec.get('test_pipette'))):
+        written.append(test_path)
+
+    #### Geometry
+    LG.storing_geometry(path, definition)
+
+    return written
+
+def reading_specs(labware_folder = 'labware'):
+    """
+    Returns the specs of labware_specs.json in the labware folder.
+    """
+    with open(os.path.join(labware_folder, SPEC_FILE),
+              encoding = 'utf-8') as spec_file:
+        return json.load(spec_file)
+
+def writing_specs(specs, labware_folder = 'labware'):
+    """
+    Writes the specs to labware_specs.json in the labware folder, with 1 line
+    per field of a spec.
+    """
+    text = "[\n" + ",\n".join(
+        "    {\n" + ",\n".join(
+            f"        {json.dumps(key)}: "
+            f"{json.dumps(value, ensure_ascii = False)}"
+            for key, value in spec.items()) + "\n    }"
+        for spec in specs) + "\n]\n"
+    writing_file(os.path.join(labware_folder, SPEC_FILE), text)
+
+def generating_labware(load_names = False, labware_folder = 'labware'):
+    """
+    Generates all labware of labware_specs.json, or only these load names.
+
+    Raises
+    ------
+    Exception
+        If a load name has no spec
+
+    Returns
+    -------
+    written : list
+        Paths of the files that were written
+    """
+    specs = reading_specs(labware_folder)
+    if load_names:
+        unknown = set(load_names) - {spec['load_name'] for spec in specs}
+        if unknown:
+            raise Exception(f"There is no spec of {sorted(unknown)} in "
+                            f"{SPEC_FILE}")
+        specs = [spec for spec in specs if spec['load_name'] in load_names]
+
+    written = []
+    for spec in specs:
+        written += writing_labware(spec, labware_folder)
+    return written
+
+if __name__ == '__main__':
+    import sys
+    for path in generating_labware(sys.argv[1:]):
+        print(f"written: {path}")
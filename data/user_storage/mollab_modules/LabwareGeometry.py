@@ -0,0 +1,167 @@
+"""
+version: Jan_2024
+Module with the well geometry of the custom labware as numpy arrays, for
+calculations over many wells at once (distances, heights). Every labware
+definition is compiled once into a table with a row per well:
+    x, y, z, depth, diameter (in mm, relative to the front-left corner,
+                              z is the height of the well bottom)
+in the order of labware.wells(), and a list with the well names. The table is
+stored as a small .npy file next to the definition (<definition>.geometry.npy)
+and opened with memory mapping, so it is only read again when the definition
+is newer than the stored table.
+
+Example:
+    from data.user_storage.mollab_modules import LabwareGeometry as LG
+    LG.building_geometry()                  # all definitions in labware/
+    geometry = LG.labware_geometry('pcrstrips_96_wellplate_200ul')
+    geometry.distances(['A1', 'H12'], ['A1', 'B1'])
+"""
+import os
+import numpy as np
+
+#### Columns of the geometry table
+GEOMETRY_COLUMNS = ['x', 'y', 'z', 'depth', 'diameter']
+#### 1 record per well: the well name and its row of the geometry table
+GEOMETRY_DTYPE = np.dtype([('well', 'U4'),
+                           ('geometry', np.float32, len(GEOMETRY_COLUMNS))])
+GEOMETRY_SUFFIX = '.geometry.npy'
+
+class LabwareGeometry:
+    """
+    Well geometry of 1 labware definition.
+
+    Parameters
+    ----------
+    records : numpy array
+        Array with GEOMETRY_DTYPE, 1 record per well
+    """
+    __slots__ = ('table', 'wells', 'index')
+
+    def __init__(self, records):
+        self.table = records['geometry']
+        self.wells = [str(well) for well in records['well']]
+        self.index = {well: i for i, well in enumerate(self.wells)}
+
+    def rows(self, well_names):
+        """
+        Returns the rows of the table of these wells, as an array.
+        """
+        return np.array([self.index[name] for name in well_names], dtype = int)
+
+    def column(self, name):
+        """
+        Returns 1 column of the table (see GEOMETRY_COLUMNS) for all wells.
+        """
+        return self.table[:, GEOMETRY_COLUMNS.index(name)]
+
+    def tops(self, well_names = False):
+        """
+        Returns the height in mm of the well tops above the labware bottom.
+        """
+        if well_names:
+            table = self.table[self.rows(well_names)]
+        else:
+            table = self.table
+        return table[:, 2] + table[:, 3]
+
+    def distances(self, from_wells, to_wells):
+        """
+        Returns a (len(from_wells), len(to_wells)) array with the distances
+        in mm (x, y) between the wells.
+        """
+        a = self.table[self.rows(from_wells), :2]
+        b = self.table[self.rows(to_wells), :2]
+        return np.hypot(a[:, None, 0] - b[None, :, 0],
+                        a[:, None, 1] - b[None, :, 1])
+
+def compiling_geometry(definition):
+    """
+    Compiles the wells of a labware definition into GEOMETRY_DTYPE records,
+    in the order of labware.wells() (column by column). Rectangular wells get
+    their smallest side as diameter.
+    """
+    names = [name for column in definition['ordering'] for name in column]
+    records = np.zeros(len(names), dtype = GEOMETRY_DTYPE)
+    for i, name in enumerate(names):
+        well = definition['wells'][name]
+        if 'diameter' in well:
+            diameter = well['diameter']
+        else:
+            diameter = min(well['xDimension'], well['yDimension'])
+        records[i] = (name, (well['x'], well['y'], well['z'],
+                             well['depth'], diameter))
+    return records
+
+def geometry_path(definition_path):
+    """
+    Returns the path of the stored geometry of a labware definition file.
+    """
+    return os.path.splitext(definition_path)[0] + GEOMETRY_SUFFIX
+
+def storing_geometry(definition_path, definition):
+    """
+    Compiles a labware definition and stores it next to the definition file.
+    Returns the records, also if the folder is not writable.
+    """
+    records = compiling_geometry(definition)
+    try:
+        np.save(geometry_path(definition_path), records)
+    except OSError:
+        pass
+    return records
+
+#### Geometry per (labware folder, load name) for the whole python process
+GEOMETRIES = {}
+
+def labware_geometry(load_name, labware_folder = 'labware'):
+    """
+    Returns the LabwareGeometry of a custom labware. The stored geometry is
+    memory mapped, it is compiled again if the definition is newer.
+    """
+    from data.user_storage.mollab_modules import LabWare_v2 as LW
+
+    registry = LW.labware_registry(labware_folder)
+    if registry.paths is None or load_name not in registry.paths:
+        registry.indexing()
+    if load_name not in registry.paths:
+        raise Exception(f"There is no labware definition of {load_name} "
+                        f"in {labware_folder}")
+    definition_path = registry.paths[load_name]
+    path = geometry_path(definition_path)
+    mtime = os.path.getmtime(definition_path)
+
+    key = (labware_folder, load_name)
+    if key in GEOMETRIES and GEOMETRIES[key][0] == mtime:
+        return GEOMETRIES[key][1]
+
+    if os.path.isfile(path) and os.path.getmtime(path) >= mtime:
+        records = np.load(path, mmap_mode = 'r')
+    else:
+        records = storing_geometry(definition_path, 
+                                   registry.get(load_name))
+    GEOMETRIES[key] = (mtime, LabwareGeometry(records))
+
+    return GEOMETRIES[key][1]
+
+def building_geometry(labware_folder = 'labware'):
+    """
+    Build step: compiles every labware definition in the folder that has no
+    stored geometry yet, or an older one.
+
+    Returns
+    -------
+    built : list
+        The load names that were compiled
+    """
+    from data.user_storage.mollab_modules import LabWare_v2 as LW
+
+    registry = LW.labware_registry(labware_folder)
+    registry.indexing()
+    built = []
+    for load_name, definition_path in registry.paths.items():
+        path = geometry_path(definition_path)
+        if (not os.path.isfile(path) or
+            os.path.getmtime(path) < os.path.getmtime(definition_path)):
+            storing_geometry(definition_path, registry.get(load_name))
+            built.append(load_name)
+    return built
@@ -0,0 +1,172 @@
+"""
+version: Jan_2024
+Module to read the labware offsets (labware_offset.csv) and set them on the
+loaded labware, without pandas. The csv is read with the csv module once per
+python process, and read again only when the file has changed. Every robot
+can have its own offsets in labware_offset_<robot>.csv, e.g.
+labware_offset_EVE.csv, otherwise labware_offset.csv is used.
+
+The csv has a row per labware name and is separated by ';':
+    labware;x_offset;y_offset;z_offset
+    filtertips_20;0;0;0.5
+
+Example, at the end of loading the labware:
+    from data.user_storage.mollab_modules import LabwareOffsets as LO
+    LO.applying_offsets(protocol, 'EVE')
+"""
+import csv
+import os
+
+#### Folders that are searched for the offset files, in this order: next to
+#### the mollab_modules on the robot, and the labware folder of the repository
+OFFSET_FOLDERS = [os.path.dirname(os.path.abspath(__file__)),
+                  os.path.join('labware', 'labware_offsets')]
+OFFSET_FILE = 'labware_offset.csv'
+
+#### Name in the offset file per tip_type / tube_type of LabWare_v2
+OFFSET_NAMES = {'opentrons_20uL': 'filtertips_20',
+                'opentrons_200uL': 'filtertips_200',
+                'skirted_plate_96': 'plate_96',
+                'plate_96_NIOZholder': 'plate_plateholder',
+                'PCR_strips': 'pcr_strips',
+                '1.5mL_tubes': '1.5mL_tubes',
+                '5mL_screwcap_tubes': '5mL_screw_cap',
+                '15mL_tubes': '15mL_tubes',
+                '50mL_tubes': '50mL_tubes'}
+
+#### Offsets that are already read: path -> (modification time, offsets)
+OFFSET_CACHE = {}
+
+def offset_path(robot = False, offset_folder = False):
+    """
+    Returns the path of the offset file of a robot, or of the general offset
+    file if the robot has none. Returns None if there is no offset file.
+    """
+    folders = [offset_folder] if offset_folder else OFFSET_FOLDERS
+    file_names = [OFFSET_FILE]
+    if robot:
+        file_names.insert(0, f"labware_offset_{robot}.csv")
+    for file_name in file_names:
+        for folder in folders:
+            path = os.path.join(folder, file_name)
+            if os.path.isfile(path):
+                return path
+    return None
+
+def reading_offsets(path):
+    """
+    Returns the offsets of an offset file: per labware name an (x, y, z)
+    tuple in mm. Decimal commas (e.g. 0,5 from Excel) are read as well.
+    """
+    mtime = os.path.getmtime(path)
+    if path in OFFSET_CACHE and OFFSET_CACHE[path][0] == mtime:
+        return OFFSET_CACHE[path][1]
+
+    offsets = {}
+    with open(path, newline = '', encoding = 'utf-8-sig') as offset_file:
+        for row in csv.DictReader(offset_file, delimiter = ';'):
+            if not row.get('labware'):
+                continue
+            offsets[row['labware'].strip()] = tuple(
+                float((row[axis] or '0').replace(',', '.'))
+                for axis in ['x_offset', 'y_offset', 'z_offset'])
+    OFFSET_CACHE[path] = (mtime, offsets)
+
+    return offsets
+
+def labware_offsets(robot = False, offset_folder = False):
+    """
+    Returns the offsets of a robot, see reading_offsets. Empty if there is
+    no offset file.
+    """
+    path = offset_path(robot, offset_folder)
+    if path is None:
+        return {}
+    return reading_offsets(path)
+
+def offset_name(labware):
+    """
+    Returns the name of a loaded labware in the offset file, from its load
+    name via the tip_types and tube_types of LabWare_v2.
+    """
+    from data.user_storage.mollab_modules import LabWare_v2 as LW
+
+    for labware_type, (load_name, custom) in {**LW.TIP_TYPES,
+                                              **LW.TUBE_TYPES}.items():
+        if load_name == labware.load_name:
+            return OFFSET_NAMES.get(labware_type, labware_type)
+    return labware.load_name
+
+def setting_offsets(labwares, 
+                    robot = False, 
+                    offset_folder = False,
+                    skip_missing = False):
+    """
+    Sets the offsets of the robot on a list of loaded labware.
+
+    Parameters
+    ----------
+    labwares : list or dict
+        Loaded labware, or a dict with the name in the offset file per
+        loaded labware (like the labwares dict of the offset snippets)
+    robot : Boolean False or string
+        Optional, default False. Name of the robot, e.g. 'EVE'
+    offset_folder : Boolean False or string
+        Optional, default False. Folder with the offset files, default
+        OFFSET_FOLDERS
+    skip_missing : Boolean True or False
+        Optional, default False. If True, labware without offsets in the 
+        offset file is returned and left unchanged, otherwise that raises
+
+    Returns
+    -------
+    missing : list
+        Labware without offsets in the offset file, these are not changed
+
+    Raises
+    ------
+    Exception
+        If there is no offset file, or if labware has no offsets in it and 
+        skip_missing is False
+    """
+    of_robot = f" of robot {robot}" if robot else ""
+    if offset_path(robot, offset_folder) is None:
+        raise Exception(f"There is no offset file{of_robot}, the labware "
+                        f"offsets cannot be set")
+    offsets = labware_offsets(robot, offset_folder)
+    if not isinstance(labwares, dict):
+        labwares = {labware: offset_name(labware) for labware in labwares}
+
+    missing = [labware for labware, name in labwares.items()
+               if name not in offsets]
+    if missing and not skip_missing:
+        raise Exception(f"There are no offsets in the offset file"
+                        f"{of_robot} for "
+                        f"{', '.join(labwares[labware] for labware in missing)}"
+                        f", add them to the offset file")
+
+    for labware, name in labwares.items():
+        if labware in missing:
+            continue
+        x, y, z = offsets[name]
+        labware.set_offset(x = x, y = y, z = z)
+
+    return missing
+
+def applying_offsets(protocol, 
+                     robot = False, 
+                     offset_folder = False,
+                     skip_missing = False):
+    """
+    Sets the offsets of the robot on all labware that is loaded in the
+    protocol, in 1 call. See setting_offsets. With skip_missing, the labware
+    without offsets is commented in the protocol.
+    """
+    missing = setting_offsets(list(protocol.loaded_labwares.values()),
+                              robot,
+                              offset_folder,
+                              skip_missing)
+    for labware in missing:
+        protocol.comment(f"No offsets for {labware.name}, its offsets are "
+                         f"not changed")
+    return missing
@@ -0,0 +1,259 @@
+"""
+version: Jan_2024
+Module to record pipetting steps as a plan before they are performed.
+The Pipetting_Modules record every pipetting action in a Plan, a list of
+Operation records. The executing_plan function replays a plan on the robot.
+Because a plan only contains deck slots, well indexes, volumes and heights,
+it can also be counted, optimized or timed without a robot. Labware on a 
+module or adapter is recorded with the deck slot of that module or adapter.
+"""
+from collections import namedtuple
+
+#### A single pipetting step
+Operation = namedtuple('Operation', ['action',   # e.g. 'aspirate'
+                                     'pipette',  # mount, 'left' / 'right'
+                                     'slot',     # deck slot of the labware
+                                     'well',     # index in labware.wells()
+                                     'volume',   # µL
+                                     'height',   # mm above the well bottom
+                                     'argument'])# mix repetitions, push_out
+                                                 # or comment/pause message
+
+class Plan:
+    """
+    List of Operations, in the order in which they have to be performed.
+    """
+    def __init__(self):
+        self.operations = []
+        self._pipettes = {}
+
+    def __len__(self):
+        return len(self.operations)
+
+    def __iter__(self):
+        return iter(self.operations)
+
+    def add(self, action, pipette = None, slot = None, well = None,
+            volume = None, height = None, argument = None):
+        self.operations.append(
+            Operation(action, pipette, slot, well, volume, height, argument))
+
+    def comment(self, message):
+        self.add('comment', argument = message)
+
+    def pause(self, message):
+        self.add('pause', argument = message)
+
+    def count(self, action, pipette = None):
+        """
+        Number of operations of a certain action, e.g. 'pick_up_tip',
+        optionally only for 1 pipette (mount).
+        """
+        return sum(1 for operation in self.operations
+                   if operation.action == action
+                   and (pipette is None or operation.pipette == pipette))
+
+    def pipette(self, pipette):
+        """
+        Returns the PlanPipette that records the steps of this pipette in
+        this plan. False (pipette not loaded) stays False.
+        """
+        if not pipette:
+            return pipette
+        if isinstance(pipette, PlanPipette):
+            pipette = pipette.pipette
+        if pipette.mount not in self._pipettes:
+            self._pipettes[pipette.mount] = PlanPipette(pipette, self)
+        return self._pipettes[pipette.mount]
+
+class PlanPipette:
+    """
+    Stands in for a loaded pipette and records its actions in a Plan instead
+    of performing them. Has the same methods as an opentrons pipette, as far
+    as they are used by the Pipetting_Modules.
+    """
+    def __init__(self, pipette, plan):
+        self.pipette = pipette
+        self.plan = plan
+        self.mount = pipette.mount
+        self.max_volume = pipette.max_volume
+        self.tip_racks = pipette.tip_racks
+        self.channels = getattr(pipette, 'channels', 1)
+        self.has_tip = False
+        self._well_indexes = {}
+
+    def _locate(self, location):
+        """
+        Converts a well or a location (well.bottom() / well.top()) into a
+        deck slot, a well index and a height above the well bottom.
+        """
+        if location is None:
+            return None, None, None
+
+        #### A location, e.g. well.bottom(2) or well.top(-5)
+        if hasattr(location, 'point'):
+            well = location.labware.as_well()
+            height = location.point.z - well.bottom().point.z
+        #### A well, pipetting happens at the default height
+        else:
+            well = location
+            height = None
+
+        #### Well indexes are stored per labware, to look them up only once
+        labware = well.parent
+        if id(labware) not in self._well_indexes:
+            self._well_indexes[id(labware)] = {
+                labware_well.well_name: i
+                for i, labware_well in enumerate(labware.wells())}
+        index = self._well_indexes[id(labware)][well.well_name]
+
+        return deck_slot(labware), index, height
+
+    def _add(self, action, location = None, volume = None, argument = None):
+        slot, well, height = self._locate(location)
+        self.plan.add(action, self.mount, slot, well, volume, height,
+                      argument)
+
+    def pick_up_tip(self):
+        if self.has_tip:
+            raise Exception(f"The {self.mount} pipette already has a tip")
+        self.has_tip = True
+        self._add('pick_up_tip')
+
+    def drop_tip(self):
+        if not self.has_tip:
+            raise Exception(f"The {self.mount} pipette has no tip to drop")
+        self.has_tip = False
+        self._add('drop_tip')
+
+    def aspirate(self, volume, location):
+        self._add('aspirate', location, volume)
+
+    def dispense(self, volume, location, push_out = None):
+        self._add('dispense', location, volume, push_out)
+
+    def air_gap(self, volume):
+        self._add('air_gap', volume = volume)
+
+    def mix(self, repetitions, volume, location):
+        self._add('mix', location, volume, repetitions)
+
+    def blow_out(self, location = None):
+        self._add('blow_out', location)
+
+#==============================================================================
+
+def deck_slot(labware):
+    """
+    Returns the deck slot of a labware, also if it is on a module or an 
+    adapter: their parents are followed until the deck slot.
+    """
+    parent = labware.parent
+    while not isinstance(parent, str):
+        parent = parent.parent
+    return parent
+
+def slot_labware(protocol, slot):
+    """
+    Returns the labware that is pipetted from in a deck slot: the labware on
+    top of the modules and adapters in that slot.
+    """
+    labware = protocol.deck[slot]
+    while True:
+        #### A module, with its labware or adapter on top
+        if hasattr(labware, 'labware') and not hasattr(labware, 'wells'):
+            labware = labware.labware
+        #### An adapter, with a labware on top
+        elif getattr(labware, 'child', None) is not None:
+            labware = labware.child
+        else:
+            return labware
+
+def recording_plan(plan, p20, p300):
+    """
+    Start recording pipetting steps. Used at the start of every function in
+    the Pipetting_Modules.
+
+    Parameters
+    ----------
+    plan : Boolean False or Plan
+        If False, a new plan is made that should be executed at the end of
+        the function. If a Plan is given, the steps are added to that plan
+        and the caller executes it.
+    p20 : labware definition
+    p300 : labware definition
+
+    Returns
+    -------
+    plan : Plan
+    p20 : PlanPipette (or False if the p20 is not loaded)
+    p300 : PlanPipette (or False if the p300 is not loaded)
+    execute : boolean
+        True if the function should execute the plan when finished
+    """
+    execute = not isinstance(plan, Plan)
+    if execute:
+        plan = Plan()
+
+    return plan, plan.pipette(p20), plan.pipette(p300), execute
+
+def executing_plan(plan, protocol):
+    """
+    Performs all operations of a plan on the robot (or in the simulator).
+
+    Parameters
+    ----------
+    plan : Plan
+    protocol : def run(protocol: protocol_api.ProtocolContext):
+
+    Returns
+    -------
+    None.
+    """
+    pipettes = protocol.loaded_instruments
+    slot_wells = {}
+
+    for operation in plan:
+        action = operation.action
+
+        #### Comments and pauses
+        if action == 'comment':
+            protocol.comment(operation.argument)
+            continue
+        if action == 'pause':
+            protocol.pause(operation.argument)
+            continue
+
+        #### Find the location of the operation
+        pipette = pipettes[operation.pipette]
+        if operation.slot is None:
+            location = None
+        else:
+            if operation.slot not in slot_wells:
+                slot_wells[operation.slot] = slot_labware(
+                    protocol, operation.slot).wells()
+            location = slot_wells[operation.slot][operation.well]
+            if operation.height is not None:
+                location = location.bottom(operation.height)
+
+        #### Perform the operation
+        if action == 'pick_up_tip':
+            pipette.pick_up_tip()
+        elif action == 'drop_tip':
+            pipette.drop_tip()
+        elif action == 'aspirate':
+            pipette.aspirate(operation.volume, location)
+        elif action == 'dispense':
+            if operation.argument is None:
+                pipette.dispense(operation.volume, location)
+            else:
+                pipette.dispense(operation.volume, location,
+                                 push_out = operation.argument)
+        elif action == 'air_gap':
+            pipette.air_gap(operation.volume)
+        elif action == 'mix':
+            pipette.mix(operation.argument, operation.volume, location)
+        elif action == 'blow_out':
+            pipette.blow_out(location)
+
+    return
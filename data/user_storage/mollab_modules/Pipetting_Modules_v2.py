@@ -1,6 +1,402 @@
 """
 version: Jan_2024
 """
+def tip_capacity(pipette):
+    """
+    Parameters
+    ----------
+    pipette : labware definition
+        A loaded pipette, with its tip racks
+
+    Returns
+    -------
+    capacity : float
+        Maximum volume in µL that fits in the tips of this pipette. This is 
+        the smallest of the pipette and the tip volume, e.g. a p300 with 
+        200 µL filter tips can hold 200 µL.
+    """
+    capacity = pipette.max_volume
+    if pipette.tip_racks:
+        capacity = min(capacity, pipette.tip_racks[0].wells()[0].max_volume)
+    
+    return capacity
+
+#### Largest volume in µL per aspiration for the (p20, p300), leaving room in
+#### the tip for the airgap and the extra volume of reverse pipetting
+MAX_VOLUMES = {'aliquoting': (19, 195),
+               'transferring': (15, 190),
+               'pooling': (19, 190)}
+#### Smallest volume in µL that the (p20, p300) pipette pipettes accurately
+#### enough. The p300 takes over at the largest volume that the p20 
+#### transfers in 1 pass (15 µL), like the thresholds the modules had before.
+#### Volumes below the minimum of the p20 are still pipetted with the p20.
+MIN_VOLUMES = (1, 15)
+
+def selecting_pipette(volume, action, p20, p300, well = False):
+    """
+    Decides which pipette to use for a volume and in how many passes (tip
+    fillings) it is pipetted. A volume that fits in 1 pass of the p20 is 
+    pipetted with the p20, because it is more accurate. Larger volumes are
+    pipetted with the p300, in equal passes if they do not fit in 1 tip. 
+    Only if the p300 is not loaded, the p20 pipettes them in multiple 
+    passes. Every pass is at least the minimum volume of the pipette, only a
+    volume below the minimum of the p20 is pipetted with the p20 in 1 pass,
+    as precise as it gets. Volumes of 0 µL are not pipetted, skip them 
+    before selecting a pipette.
+
+    Parameters
+    ----------
+    volume : float
+        volume in µL that has to be pipetted
+    action : string
+        'aliquoting' / 'transferring' / 'pooling', see MAX_VOLUMES
+    p20 : labware definition
+    p300 : labware definition
+    well : Boolean False or well
+        Optional, default False. The well that the volume is pipetted from or
+        to, only used in the error messages
+
+    Raises
+    ------
+    Exception
+        If the volume is 0 µL or if there is no loaded pipette that can 
+        pipette this volume
+
+    Returns
+    -------
+    pipette : labware definition
+        The pipette to use
+    passes : int
+        In how many passes the volume is pipetted, volume / passes per pass
+    """
+    #### Import math module to allow rounding up
+    import math
+    
+    if well:
+        location = f" for {well}"
+    else:
+        location = ""
+    if volume <= 0:
+        raise Exception(f"There is nothing to pipette{location}, the volume "
+                        f"is {volume} µL")
+    
+    options = []
+    for pipette, max_volume, min_volume in zip([p20, p300],
+                                               MAX_VOLUMES[action],
+                                               MIN_VOLUMES):
+        if not pipette:
+            continue
+        passes = max(1, math.ceil(volume / max_volume))
+        if volume / passes >= min_volume:
+            options.append((passes, pipette))
+    
+    #### Below its minimum volume the p20 is still the best option
+    if volume < MIN_VOLUMES[0]:
+        if not p20:
+            raise Exception(f"There is no pipette loaded to pipette {volume} "
+                            f"µL{location}, volumes below {MIN_VOLUMES[0]} "
+                            f"µL are pipetted with the p20")
+        options = [(1, p20)]
+    
+    if not options:
+        raise Exception(f"There is no pipette loaded to pipette {volume} "
+                        f"µL{location}")
+    
+    #### The p20 (first) if it needs 1 pass, otherwise the p300
+    passes, pipette = options[0]
+    if passes > 1 and len(options) > 1:
+        passes, pipette = options[1]
+    
+    return pipette, passes
+
+def transfer_settings(pipette, p20, transfer_volume):
+    """
+    Parameters
+    ----------
+    pipette : labware definition
+        The pipette that performs the transfer
+    p20 : labware definition
+    transfer_volume : float
+        volume in µL that is transferred
+
+    Returns
+    -------
+    push_out_volume : float
+        µL of air pushed out after dispensing
+    airgap_volume : float
+        µL of air taken up after aspirating, if an airgap is desired
+    mix_volume : float
+        µL used for mixing after dispensing, if mixing is desired
+    """
+    if pipette == p20:
+        push_out_volume = 2
+        airgap_volume = 1
+        mix_volume = 5
+    else:
+        push_out_volume = 5
+        airgap_volume = 10
+        if transfer_volume <= 50:
+            mix_volume = transfer_volume
+        else:
+            mix_volume = 50
+    
+    return push_out_volume, airgap_volume, mix_volume
+
+def is_full_column(wells):
+    """
+    Returns True if the wells are exactly 1 column (A to H) of 1 labware, in
+    that order, so that a multichannel pipette can pipette them at once.
+    """
+    if len(wells) != 8:
+        return False
+    column = wells[0].well_name[1:]
+    return all(well.parent is wells[0].parent and
+               well.well_name == f"{row}{column}"
+               for row, well in zip('ABCDEFGH', wells))
+
+def selecting_single_channel(volume, action, p20, p300, well = False):
+    """
+    Like selecting_pipette, for a volume that is not pipetted as part of a 
+    full column (e.g. from or into a tube): only the single channel 
+    pipettes are used, a multichannel pipette is left out.
+
+    Raises
+    ------
+    Exception
+        If there is no single channel pipette loaded that can pipette this
+        volume
+    """
+    if p20 and p20.channels != 1:
+        p20 = False
+    if p300 and p300.channels != 1:
+        p300 = False
+    if not p20 and not p300:
+        raise Exception("This cannot be pipetted with a multichannel "
+                        "pipette, load a single channel pipette on the other "
+                        "mount")
+    ## A volume of 0 µL raises its own error
+    if volume <= 0:
+        return selecting_pipette(volume, action, p20, p300, well)
+    try:
+        return selecting_pipette(volume, action, p20, p300, well)
+    except Exception as error:
+        raise Exception(f"{error}. There is no single channel pipette for "
+                        f"this volume, load a single channel pipette for "
+                        f"this volume on the other mount")
+
+def grouping_columns(source_wells,
+                     destination_wells,
+                     volumes,
+                     p20,
+                     p300,
+                     action):
+    """
+    Decides per transfer which pipette performs it, see selecting_pipette. If
+    that is a multichannel pipette (p20_multi_gen2 / p300_multi_gen2), 8 
+    transfers that go from a full column to a full column with the same 
+    volume are combined into 1 column transfer. Transfers that are not part of
+    a full column are done by the single channel pipette on the other mount,
+    see selecting_single_channel. Transfers of 0 µL are skipped.
+    
+    Parameters
+    ----------
+    source_wells : list
+        List of tube(s)/well(s) to get reagent from
+    destination_wells : list
+        List of tube(s)/well(s) to transfer reagent to
+    volumes : list
+        volume in µL per transfer
+    p20 : labware definition
+    p300 : labware definition
+    action : string
+        'aliquoting' / 'transferring' / 'pooling', see MAX_VOLUMES
+
+    Returns
+    -------
+    transfers : list
+        List with a tuple (source_well, destination_well, volume, pipette,
+        passes) per transfer. For a column transfer the wells are the A wells
+        of the columns.
+    """
+    #### Nothing is pipetted for a volume of 0 µL
+    kept = [i for i, volume in enumerate(volumes) if volume > 0]
+    source_wells = [source_wells[i] for i in kept]
+    destination_wells = [destination_wells[i] for i in kept]
+    volumes = [volumes[i] for i in kept]
+    
+    transfers = []
+    i = 0
+    while i < len(source_wells):
+        volume = volumes[i]
+        pipette, passes = selecting_pipette(volume, action, p20, p300, 
+                                            destination_wells[i])
+        
+        if (pipette.channels == 8 and
+            is_full_column(source_wells[i:i + 8]) and
+            is_full_column(destination_wells[i:i + 8]) and
+            len(set(volumes[i:i + 8])) == 1):
+            transfers.append((source_wells[i], destination_wells[i], volume,
+                              pipette, passes))
+            i += 8
+        else:
+            pipette, passes = selecting_single_channel(volume, action, 
+                                                       p20, p300,
+                                                       destination_wells[i])
+            transfers.append((source_wells[i], destination_wells[i], volume,
+                              pipette, passes))
+            i += 1
+    
+    return transfers
+
+def consolidating_samples(transfers,
+                          capacity,
+                          airgap_volume,
+                          samples_per_tip,
+                          pool_tracker = False):
+    """
+    Combines samples that go to the same pool into groups that are aspirated
+    one after the other in 1 tip, separated by airgaps, and dispensed at once.
+    Samples that need more than 1 pass stay on their own.
+
+    Parameters
+    ----------
+    transfers : list
+        List with a tuple (source_well, pool, volume, passes) per sample
+    capacity : float
+        µL that fits in 1 tip, samples + airgaps
+    airgap_volume : float
+        µL of air taken up after every sample
+    samples_per_tip : int
+        Maximum number of samples that is aspirated in 1 tip
+    pool_tracker : Boolean False or VolumeTracker
+        Optional, default False. The VolumeTracking.VolumeTracker of the pool
+        tube(s). A group is dispensed in 1 tube, so a new group is started 
+        where the tracker continues with the next tube (after max_volume).
+        If False, the pool of the transfers is used.
+
+    Returns
+    -------
+    groups : list
+        List with a list of transfers per tip
+    """
+    #### The pool tube of every sample: like the tracker, continue with the 
+    #### next tube when max_volume is pooled in a tube
+    tube_numbers = [transfer[1] for transfer in transfers]
+    if pool_tracker:
+        tube_numbers = []
+        tube_number = 0
+        tube_volume = pool_tracker.added_volume
+        for well, pool, volume, passes in transfers:
+            if (pool_tracker.max_volume and tube_volume > 0 and 
+                tube_volume + volume > pool_tracker.max_volume):
+                tube_number += 1
+                tube_volume = 0
+            tube_volume += volume
+            tube_numbers.append(tube_number)
+    
+    groups = []
+    group = []
+    group_volume = 0
+    for transfer, tube_number in zip(transfers, tube_numbers):
+        well, pool, volume, passes = transfer
+        ### Samples that need multiple passes are pooled on their own
+        if passes > 1:
+            groups.append([transfer])
+            continue
+        ### Start a new tip if the sample does not fit in the current one, or
+        ### goes to the next pool tube
+        if group and (len(group) == samples_per_tip or 
+                      group_tube != tube_number or
+                      group_volume + volume + airgap_volume > capacity):
+            groups.append(group)
+            group = []
+            group_volume = 0
+        group.append(transfer)
+        group_volume += volume + airgap_volume
+        group_tube = tube_number
+    if group:
+        groups.append(group)
+    
+    return groups
+
+#### When a tip may be used again for the next transfer:
+#### 'always_new'          - a new tip for every transfer
+#### 'per_source'          - 1 tip for all transfers from the same source
+#### 'per_source_until_n'  - 1 tip for at most n transfers from the same 
+####                         source
+#### A tip that is used again only dispenses at the top of the destination, 
+#### so it never touches the liquid in the destination.
+TIP_POLICIES = ['always_new', 'per_source', 'per_source_until_n']
+
+def grouping_sources(transfers,
+                     tip_policy,
+                     max_tip_uses):
+    """
+    Groups transfers that are performed with the same tip, see TIP_POLICIES.
+    Transfers from the same source with the same pipette share a tip, also
+    if other transfers are in between (e.g. sources A, B, A, B). The groups
+    are in the order in which their sources first appear, within a group the
+    transfers (destinations) keep their original order.
+
+    Parameters
+    ----------
+    transfers : list
+        List with a tuple per transfer, the first item is the source well and
+        the fourth item the pipette, see grouping_columns
+    tip_policy : string
+        'always_new' / 'per_source' / 'per_source_until_n'
+    max_tip_uses : int
+        Maximum number of transfers per tip for 'per_source_until_n'
+
+    Returns
+    -------
+    groups : list
+        List with a list of transfers per tip
+    """
+    if tip_policy not in TIP_POLICIES:
+        raise Exception(f"Unknown tip_policy {tip_policy}, choose from "
+                        f"{TIP_POLICIES}")
+    if tip_policy == 'always_new':
+        return [[transfer] for transfer in transfers]
+    
+    groups = []
+    open_groups = {}
+    for transfer in transfers:
+        key = (transfer[0], transfer[3])
+        group = open_groups.get(key)
+        ### Start a new tip for a new source or if the tip is used up
+        if group is None or (tip_policy == 'per_source_until_n' and
+                             len(group) == max_tip_uses):
+            group = []
+            groups.append(group)
+            open_groups[key] = group
+        group.append(transfer)
+    
+    return groups
+
+def counting_tips(sources, tip_policy, max_tip_uses):
+    """
+    Number of tips needed for transfers from these sources with this tip
+    policy, see grouping_sources.
+
+    Parameters
+    ----------
+    sources : list
+        The source well of every transfer that is done with 1 pipette
+    tip_policy : string
+        'always_new' / 'per_source' / 'per_source_until_n'
+    max_tip_uses : int
+        Maximum number of transfers per tip for 'per_source_until_n'
+
+    Returns
+    -------
+    tips : int
+    """
+    return len(grouping_sources([(source, None, None, None) 
+                                 for source in sources],
+                                tip_policy,
+                                max_tip_uses))
+
 def aliquoting_reagent(reagent_source,
                        reagent_tube_type, 
                        reagent_startvolume,
@@ -11,7 +407,9 @@ def aliquoting_reagent(reagent_source,
                        tip_change,
                        action_at_bottom,
                        pause,
-                       protocol):
+                       protocol,
+                       multi_dispense = False,
+                       plan = False):
     """
     A protocol for aliquoting reagent (mastermix, dilution buffer, etc)
     Parameters
@@ -20,8 +418,9 @@ def aliquoting_reagent(reagent_source,
         List of tube(s)/well(s) filled with reagent
     reagent_tube_type : brand / size
         'tube_1.5mL' / 'tube_5mL' / 'tube_15mL' / 'tube_50mL'
-    reagent_startvolume : int
-        exact volume in µL that is present in the reagent tube(s)
+    reagent_startvolume : int or list
+        exact volume in µL that is present in the reagent tube(s), or a list
+        with the volume per tube
     aliquot_volume : float
         volume in µL that you want aliquoted
     destination_wells : list
@@ -36,6 +435,17 @@ def aliquoting_reagent(reagent_source,
         Do you want the robot to pause after aliquoting the reagent?
         Useful if you want to keep stock tubes closed as much as possible.
     protocol : def run(protocol: protocol_api.ProtocolContext):
+    multi_dispense : boolean True or False
+        Optional, default False. If True the tip is filled up to its usable
+        capacity once and the reagent is dispensed in as many destination 
+        wells as fit, instead of going back to the source for every well.
+        The extra (reverse pipetting) volume is only taken once per
+        aspiration.
+    plan : Boolean False or Plan
+        Optional, default False. If a PipettingPlan.Plan is given, the 
+        pipetting steps are only added to that plan and you perform them 
+        with PipettingPlan.executing_plan. If False, the steps are performed
+        when this function is finished.
 
     Raises
     ------
@@ -49,37 +459,73 @@ def aliquoting_reagent(reagent_source,
     None.
 
     """   
+    #### Record the pipetting steps in a plan
+    from data.user_storage.mollab_modules import PipettingPlan as PP
+    plan, p20, p300, execute = PP.recording_plan(plan, p20, p300)
+    
     #### If a list of volumes is provided, 
     if isinstance(aliquot_volume, list):
         raise Exception("Use the aliquoting_varying_volumes module instead of the "
                         "aliquoting_reagentt module")
+    
+    #### Nothing is aliquoted for a volume of 0 µL
+    if aliquot_volume <= 0:
+        plan.comment("The aliquot volume is 0 µL, nothing is aliquoted")
+        if execute:
+            PP.executing_plan(plan, protocol)
+        return
         
+    #### Keep track of the volume in the reagent tube(s)
     from data.user_storage.mollab_modules import VolumeTracking as VT
+    reagent = VT.VolumeTracker(reagent_source, 
+                               reagent_tube_type, 
+                               reagent_startvolume,
+                               action_at_bottom,
+                               comment = plan.comment)
     
-    #### Variables for volume tracking and aliquoting        
-    counter = 0
-    source = reagent_source[counter]          
-    
-    #### Determine start_height (at the start, current_height = start_height)
-    start_height = current_height = VT.cal_start_height(reagent_tube_type, 
-                                                        reagent_startvolume)
-    #### Determine which pipette to use
-    if aliquot_volume > 19:
-        pipette = p300
+    #### Determine which pipette to use, always a single channel pipette
+    pipette, passes = selecting_single_channel(aliquot_volume, 'aliquoting', 
+                                               p20, p300)
+    if pipette == p20:
+        gap = 1
+        push_out_volume = 2
+    else:
         gap = 5
         push_out_volume = 5
+    
+    #### Aliquots that do not fit in 1 tip are dispensed in multiple passes
+    if passes > 1:
+        aliquot_volume = aliquot_volume / passes
+        destination_wells = [well for well in destination_wells 
+                             for i in range(passes)]
+        tip_change = tip_change * passes
+    
+    #### Determine how many wells are served per aspiration
+    if multi_dispense:
+        ## The tip must hold the aliquots, the extra volume and the airgap
+        wells_per_aspiration = int((tip_capacity(pipette) - 2 * gap) 
+                                   // aliquot_volume)
+        wells_per_aspiration = max(1, min(wells_per_aspiration, tip_change))
     else:
-        pipette = p20
-        gap = 1
-        push_out_volume = 2
+        wells_per_aspiration = 1
     
-    ## Aspirate a little more for reverse pipetting
-    aspiration_vol = aliquot_volume + gap
+    #### Group destination wells per aspiration
+    ## An aspiration never continues over a tip change
+    aspirations = []
+    for i in range(0, len(destination_wells), tip_change):
+        tip_wells = destination_wells[i:i + tip_change]
+        for j in range(0, len(tip_wells), wells_per_aspiration):
+            aspirations.append((i + j, tip_wells[j:j + wells_per_aspiration]))
     
     #### Aliquot reagent in all destination wells
-    ### Loop through destination wells
-    for i, well in enumerate(destination_wells):
-        # aliquot in the correct wells, for each well do the following:  
+    ### Loop through aspirations
+    for i, wells in aspirations:
+        # aliquot in the correct wells, for each aspiration do the following:  
+        
+        ## Volume taken from the source with this aspiration
+        aspirated_volume = aliquot_volume * len(wells)
+        ## Aspirate a little more for reverse pipetting
+        aspiration_vol = aspirated_volume + gap
         
         ## If we are at the first well, start by picking up a tip
         if i == 0: 
@@ -89,69 +535,37 @@ def aliquoting_reagent(reagent_source,
               pipette.drop_tip()
               pipette.pick_up_tip()
         
-        ## Call volume_tracking function
-        current_height, pip_height, bottom_reached = VT.volume_tracking(
-            reagent_tube_type, 
-            aliquot_volume, 
-            current_height, 
-            'emptying')
-              # obtain current_height, pip_height and whether bottom_reached
-        
-        ## What to do when the bottom of the tube is reached        
-        if bottom_reached:
-            
-            ## Continue with next tube, reset volume_tracking
-            if action_at_bottom == 'next_tube':
-                                           
-                current_height = start_height
-                current_height, pip_height, bottom_reached = (
-                    VT.volume_tracking(
-                        reagent_tube_type, 
-                        aliquot_volume, 
-                        current_height, 
-                        'emptying'))
-                counter = counter + 1
-                source = reagent_source[counter]
-                aspiration_location = source.bottom(current_height)
-                protocol.comment(
-                "Continue with tube " + str(counter + 1) + " of reagent")
-            
-            ## Keep pipetting from the bottom
-            elif action_at_bottom == 'continue_at_bottom':
-                aspiration_location = source.bottom()
-                protocol.comment("You've reached the bottom of the tube!")   
-            
-            ## Raise an error
-            elif action_at_bottom == 'raise_error':
-                raise Exception(
-                    "There is not enough reagent to run this protocol")
-        
-        ## What to do when the bottom of the tube is not yet reached    
-        else:
-            aspiration_location = source.bottom(pip_height)
+        ## Location just below the liquid surface in the reagent tube
+        aspiration_location = reagent.next_aspiration_location(
+            aspirated_volume)
         
         ## The actual aliquoting by reverse pipetting
-        # Aspirate specified volume + extra from the source tube
+        # Aspirate specified volume(s) + extra from the source tube
         pipette.aspirate(aspiration_vol, aspiration_location)
         
-        # Sets boundries for when pipetting on the well bottom or when 2 mm above the well bottom
-        if aliquot_volume <= 5:
-            dispense_location = well
-        else:
-            dispense_location = well.bottom(2)
-        # Dispense specified volume in destination well
-        pipette.dispense(aliquot_volume, dispense_location)
+        for well in wells:
+            # Sets boundries for when pipetting on the well bottom or when 2 mm above the well bottom
+            if aliquot_volume <= 5:
+                dispense_location = well
+            else:
+                dispense_location = well.bottom(2)
+            # Dispense specified volume in destination well
+            pipette.dispense(aliquot_volume, dispense_location)
         # introduce an airgap to avoid dripping
         pipette.air_gap(gap)
         # Dispense the remaining air + reagent back into the source tube
-        pipette.dispense(gap*2, source.top(-5), push_out=push_out_volume) # Blow-out
+        pipette.dispense(gap*2, reagent.tube.top(-5), push_out=push_out_volume) # Blow-out
         
     ## When finished, drop tip
     pipette.drop_tip()
     
     ## If desired, pause after aliquoting
     if pause:
-        protocol.pause("Aliquoting of reagent is finished")
+        plan.pause("Aliquoting of reagent is finished")
+        
+    #### Perform the recorded pipetting steps
+    if execute:
+        PP.executing_plan(plan, protocol)
         
     return
         
@@ -164,7 +578,8 @@ def aliquoting_varying_volumes(reagent_source,
                                p300,
                                action_at_bottom,
                                pause,
-                               protocol):
+                               protocol,
+                               plan = False):
     """
     A protocol for aliquoting reagent (mastermix, dilution buffer, etc) in
     varying volumes, from 1 source to multiple destination wells.
@@ -174,22 +589,26 @@ def aliquoting_varying_volumes(reagent_source,
         List of tube(s)/well(s) filled with reagent
     reagent_tube_type : string
         'tube_1.5mL' / 'tube_5mL' / 'tube_15mL' / 'tube_50mL'
-    reagent_startvolume : int
-        exact volume in µL that is present in the reagent tube(s)
+    reagent_startvolume : int or list
+        exact volume in µL that is present in the reagent tube(s), or a list
+        with the volume per tube
     aliquot_volumes : list
-        volumes in µL that you want aliquoted
+        volumes in µL that you want aliquoted, wells with 0 µL are skipped
     destination_wells : list
         List of tube(s)/well(s) to be filled with reagent
     p20 : labware definition
     p300 : labware definition
-    tip_change : int
-        After how many aliquots do you want to change the tip?
     action_at_bottom : string
         'next_tube' / 'continue_at_bottom' / 'raise_error'
     pause : boolean True or False
         Do you want the robot to pause after aliquoting the reagent?
         Useful if you want to keep stock tubes closed as much as possible.
     protocol : def run(protocol: protocol_api.ProtocolContext):
+    plan : Boolean False or Plan
+        Optional, default False. If a PipettingPlan.Plan is given, the 
+        pipetting steps are only added to that plan and you perform them 
+        with PipettingPlan.executing_plan. If False, the steps are performed
+        when this function is finished.
 
     Raises
     ------
@@ -203,114 +622,93 @@ def aliquoting_varying_volumes(reagent_source,
     None.
 
     """   
-    protocol.comment("newest version of module")
-    #### Import volume tracking module
-    from data.user_storage.mollab_modules import VolumeTracking as VT
-    
-    #### Determine start_height (at the start, current_height = start_height)
-    start_height = current_height = VT.cal_start_height(reagent_tube_type, 
-                                                        reagent_startvolume)
+    #### Record the pipetting steps in a plan
+    from data.user_storage.mollab_modules import PipettingPlan as PP
+    plan, p20, p300, execute = PP.recording_plan(plan, p20, p300)
     
     #### If only 1 volume is provided, 
     if not isinstance(aliquot_volumes, list):
         raise Exception("Use the aliquoting_reagent module instead of the "
                         "aliquoting_varying_volumes module")
 
-    #### Variables for volume tracking and when to change tubes     
-    counter = 0
-    source = reagent_source[counter]
+    #### Keep track of the volume in the reagent tube(s)
+    from data.user_storage.mollab_modules import VolumeTracking as VT
+    reagent = VT.VolumeTracker(reagent_source, 
+                               reagent_tube_type, 
+                               reagent_startvolume,
+                               action_at_bottom,
+                               comment = plan.comment)
+    
+    #### Nothing is aliquoted in wells with a volume of 0 µL
+    wells_volumes = [(well, aliquot_volume) for well, aliquot_volume 
+                     in zip(destination_wells, aliquot_volumes) 
+                     if aliquot_volume > 0]
+    
+    #### Determine per volume which single channel pipette to use and in how
+    #### many passes
+    selections = [selecting_single_channel(aliquot_volume, 'aliquoting', 
+                                           p20, p300, well)
+                  for well, aliquot_volume in wells_volumes]
     
     #### Looping through pipettes:
     for pipette in [p20,p300]:
-        #### to keep track of tip use, to determine when to change tip
-        tip_counter = 0
+        #### to keep track of the volume aliquoted with the tip, the tip is 
+        #### changed when it has aliquoted the volume that fits in the tip
+        tip_volume = 0
+        if pipette == p20:
+            gap = 1
+            push_out_volume = 1
+        else:
+            gap = 5
+            push_out_volume = 5
+        
+        ### Aliquots for this pipette, large volumes in multiple passes
+        aliquots = [(well, aliquot_volume / passes)
+                    for (well, aliquot_volume), (selected_pipette, passes)
+                    in zip(wells_volumes, selections)
+                    if selected_pipette == pipette
+                    for i in range(passes)]
         
         ### Loop through list of volumes and destinations
-        for well, aliquot_volume in zip(destination_wells, 
-                                        aliquot_volumes):
-            if pipette  == p20:
-                min_volume = 0
-                max_volume = 19
-                gap = 1
-                push_out_volume = 1
-            elif pipette == p300:
-                min_volume = 19
-                max_volume = 195
-                gap = 5
-                push_out_volume = 5
-                
-            if min_volume < aliquot_volume <= max_volume:
-                
-                    ## If we are at the first well, start by picking up a tip
-                    if tip_counter == 0:
-                        pipette.pick_up_tip()
-                    ## Change tips after x number of aliquots
-                    elif tip_counter % 16 == 0:
-                        pipette.drop_tip()
-                        pipette.pick_up_tip()
-                    
-                    #### Call volume_tracking function
-                    current_height, pip_height, bottom_reached = (
-                        VT.volume_tracking(
-                            reagent_tube_type,
-                            aliquot_volume, 
-                            current_height, 
-                            'emptying'))
-                    
-                    ### What to do when the bottom of the tube is reached        
-                    if bottom_reached:
-                        # Continue with next tube, reset volume_tracking
-                        if action_at_bottom == 'next_tube':                                          
-                            current_height = start_height
-                            current_height, pip_height, bottom_reached = (
-                                VT.volume_tracking(
-                                    reagent_tube_type, 
-                                    aliquot_volume, 
-                                    current_height, 
-                                    'emptying'))
-                            counter = counter + 1
-                            source = reagent_source[counter]
-                            aspiration_location = source.bottom(current_height)
-                            protocol.comment(f"Continue with tube "
-                                             f"{str(counter + 1)} of reagent")
-                    
-                        # Keep pipetting from the bottom
-                        elif action_at_bottom == 'continue_at_bottom':
-                            aspiration_location = source.bottom()
-                            protocol.comment("You've reached the bottom "
-                                             "of the tube!")   
-                        
-                        # Raise an error
-                        elif action_at_bottom == 'raise_error':
-                            raise Exception("There is not enough reagent to run "
-                                            "this protocol")
+        for well, aliquot_volume in aliquots:
+        
+            ## If we are at the first well, start by picking up a tip
+            if not pipette.has_tip:
+                pipette.pick_up_tip()
+            ## Change tips when the tip capacity has been aliquoted
+            elif tip_volume + aliquot_volume > tip_capacity(pipette):
+                pipette.drop_tip()
+                pipette.pick_up_tip()
+                tip_volume = 0
             
-                    ### What to do when the bottom of the tube is not yet reached    
-                    else:
-                        aspiration_location = source.bottom(pip_height)
+            ## Location just below the liquid surface in the reagent tube
+            aspiration_location = reagent.next_aspiration_location(
+                aliquot_volume)
+    
+            ## The actual aliquoting by reverse pipetting
+            # Aspirate specified volume + extra from the source tube
+            pipette.aspirate(aliquot_volume + gap, aspiration_location)
+            # Dispense specified volume in destination well
+            pipette.dispense(aliquot_volume, well.bottom(2))
+            # introduce an airgap to avoid dripping
+            pipette.air_gap(gap)
+            # Dispense the remaining air + reagent back into the source tube
+            pipette.dispense(gap * 2, reagent.tube.top(-5), push_out=push_out_volume) # Blow-out
             
-                    ## The actual aliquoting by reverse pipetting
-                    # Aspirate specified volume + extra from the source tube
-                    pipette.aspirate(aliquot_volume + gap, aspiration_location)
-                    # Dispense specified volume in destination well
-                    pipette.dispense(aliquot_volume, well.bottom(2))
-                    # introduce an airgap to avoid dripping
-                    pipette.air_gap(gap)
-                    # Dispense the remaining air + reagent back into the source tube
-                    pipette.dispense(gap * 2, source.top(-5), push_out=push_out_volume) # Blow-out
-                    
-                    # Add 1 use to the tip_counter
-                    tip_counter += 1
-                
-        ## When finished with pipette, drop tip and reset counter
-        try:
-            pipette.drop_tip()    
-        except:
-            continue
+            # Add the aliquot to the volume of this tip
+            tip_volume += aliquot_volume
+        
+        ## When finished with pipette, drop tip
+        if pipette and pipette.has_tip:
+            pipette.drop_tip()
             
     ## If desired, pause after aliquoting
     if pause:
-        protocol.pause("Aliquoting of reagent is finished")
+        plan.pause("Aliquoting of reagent is finished")
+        
+    #### Perform the recorded pipetting steps
+    if execute:
+        PP.executing_plan(plan, protocol)
         
     return
 
@@ -321,7 +719,10 @@ def transferring_reagents(source_wells,
                           mix,
                           p20,
                           p300,
-                          protocol):
+                          protocol,
+                          tip_policy = 'always_new',
+                          max_tip_uses = 8,
+                          plan = False):
     """
     Parameters
     ----------
@@ -336,64 +737,99 @@ def transferring_reagents(source_wells,
     mix : Boolean True or False
         Do you want to mix (pipette up and down) after dispensing
     p20 : labware definition
+        Can also be a p20_multi_gen2, full columns are then transferred at once
     p300 : labware definition
+        Can also be a p300_multi_gen2, full columns are then transferred at once
     protocol : def run(protocol: protocol_api.ProtocolContext):
+    tip_policy : string
+        Optional, default 'always_new'. 'per_source' uses 1 tip for all
+        transfers from the same source, 'per_source_until_n' for at most 
+        max_tip_uses of them. The transfers are then performed per source,
+        see grouping_sources. A tip that is used again dispenses at 
+        the top of the destination, without touching its liquid. Tips are 
+        never used again after mixing in the destination.
+    max_tip_uses : int
+        Optional, default 8. Maximum number of transfers per tip for 
+        'per_source_until_n'
+    plan : Boolean False or Plan
+        Optional, default False. If a PipettingPlan.Plan is given, the 
+        pipetting steps are only added to that plan and you perform them 
+        with PipettingPlan.executing_plan. If False, the steps are performed
+        when this function is finished.
 
     Returns
     -------
     None.
 
     """
+    #### Record the pipetting steps in a plan
+    from data.user_storage.mollab_modules import PipettingPlan as PP
+    plan, p20, p300, execute = PP.recording_plan(plan, p20, p300)
+    
     #### If a list of volumes is provided, 
     if isinstance(transfer_volume, list):
         raise Exception("Use the transferring_variable_volumes module instead of the "
                         "transferring_reagent module")
     
-    #### Determine which pipette to use:
-    if transfer_volume <= 15:
-        pipette = p20
-        push_out_volume = 2
-    else:
-        pipette = p300
-        push_out_volume = 5
+    #### Determine which pipette to use, full columns go to a multichannel
+    transfers = grouping_columns(source_wells, 
+                                 destination_wells,
+                                 [transfer_volume] * len(source_wells),
+                                 p20,
+                                 p300,
+                                 'transferring')
     
-    #### Calculate airgap and mix volumes
-    if airgap:
-        if pipette == p20:
-            airgap_volume = 1
-        else:
-            airgap_volume = 10
-    if mix:
-        if pipette == p20:
-            mix_volume = 5
-        else:
-            if transfer_volume <= 50:
-                mix_volume = transfer_volume
-            else:
-                mix_volume = 50
+    #### Determine which transfers share a tip
+    if mix and tip_policy != 'always_new':
+        plan.comment("Mixing contaminates the tip, a new tip is used for "
+                     "every transfer")
+        tip_policy = 'always_new'
+    tip_groups = grouping_sources(transfers, tip_policy, max_tip_uses)
+    
+    #### A tip that is used again stays above the liquid in the destination
+    reusing_tips = tip_policy != 'always_new'
     
     #### The actual transfer
-    for source_well, destination_well in zip(source_wells, destination_wells):
+    for tip_group in tip_groups:
         ## Pick up a pipette_tip
+        pipette = tip_group[0][3]
         pipette.pick_up_tip()
-        ## Aspirate specified volume from the source_well
-        pipette.aspirate(transfer_volume, source_well)
-        ## If desired, include an airgap
-        if airgap:
-            pipette.air_gap(airgap_volume)
-            dispense_volume = transfer_volume + airgap_volume
-        else:
-            dispense_volume = transfer_volume
-        ## Dispense in the destination_well
-        pipette.dispense(dispense_volume, destination_well, push_out=push_out_volume)
-        ## If desired, mix
-        if mix:
-            pipette.mix(3, mix_volume, destination_well)
-        ## blow out
-        pipette.blow_out()
+        for (source_well, destination_well, transfer_volume, pipette,
+             passes) in tip_group:
+            ## Volumes that do not fit in 1 tip are transferred in multiple passes
+            pass_volume = transfer_volume / passes
+            ## Calculate push_out, airgap and mix volumes
+            push_out_volume, airgap_volume, mix_volume = transfer_settings(
+                pipette, p20, pass_volume)
+            for i in range(passes):
+                ## Aspirate specified volume from the source_well
+                pipette.aspirate(pass_volume, source_well)
+                ## If desired, include an airgap
+                if airgap:
+                    pipette.air_gap(airgap_volume)
+                    dispense_volume = pass_volume + airgap_volume
+                else:
+                    dispense_volume = pass_volume
+                ## Dispense in the destination_well, at the top if the tip is
+                ## used again
+                if reusing_tips:
+                    pipette.dispense(dispense_volume, destination_well.top(), 
+                                     push_out=push_out_volume)
+                else:
+                    pipette.dispense(dispense_volume, destination_well, 
+                                     push_out=push_out_volume)
+            ## If desired, mix
+            if mix:
+                pipette.mix(3, mix_volume, destination_well)
+            ## blow out
+            pipette.blow_out()
         ## drop tip
         pipette.drop_tip()
         
+    #### Perform the recorded pipetting steps
+    if execute:
+        PP.executing_plan(plan, protocol)
+        
     return
 
 def transferring_reagents_different_height(source_wells,
@@ -404,7 +840,8 @@ def transferring_reagents_different_height(source_wells,
                                            mix,
                                            p20,
                                            p300,
-                                           protocol):
+                                           protocol,
+                                           plan = False):
     """
     Parameters
     ----------
@@ -421,54 +858,51 @@ def transferring_reagents_different_height(source_wells,
     p20 : labware definition
     p300 : labware definition
     protocol : def run(protocol: protocol_api.ProtocolContext):
+    plan : Boolean False or Plan
+        Optional, default False. If a PipettingPlan.Plan is given, the 
+        pipetting steps are only added to that plan and you perform them 
+        with PipettingPlan.executing_plan. If False, the steps are performed
+        when this function is finished.
 
     Returns
     -------
     None.
 
     """
+    #### Record the pipetting steps in a plan
+    from data.user_storage.mollab_modules import PipettingPlan as PP
+    plan, p20, p300, execute = PP.recording_plan(plan, p20, p300)
+    
     #### If a list of volumes is provided, 
     if isinstance(transfer_volume, list):
         raise Exception("Use the transferring_variable_volumes module instead of the "
                         "transferring_reagent module")
     
-    #### Determine which pipette to use:
-    if transfer_volume <= 15:
-        pipette = p20
-        push_out_volume = 2
-    else:
-        pipette = p300
-        push_out_volume = 5
+    #### Determine which single channel pipette to use and in how many 
+    #### passes
+    pipette, passes = selecting_single_channel(transfer_volume, 
+                                               'transferring', p20, p300)
+    pass_volume = transfer_volume / passes
     
-    #### Calculate airgap and mix volumes
-    if airgap:
-        if pipette == p20:
-            airgap_volume = 1
-        else:
-            airgap_volume = 10
-    if mix:
-        if pipette == p20:
-            mix_volume = 5
-        else:
-            if transfer_volume <= 50:
-                mix_volume = transfer_volume
-            else:
-                mix_volume = 50
+    #### Calculate push_out, airgap and mix volumes
+    push_out_volume, airgap_volume, mix_volume = transfer_settings(
+        pipette, p20, pass_volume)
     
     #### The actual transfer
     for source_well, destination_well in zip(source_wells, destination_wells):
         ## Pick up a pipette_tip
         pipette.pick_up_tip()
-        ## Aspirate specified volume from the source_well
-        pipette.aspirate(transfer_volume, source_well.bottom(pipette_height))
-        ## If desired, include an airgap
-        if airgap:
-            pipette.air_gap(airgap_volume)
-            dispense_volume = transfer_volume + airgap_volume
-        else:
-            dispense_volume = transfer_volume
-        ## Dispense in the destination_well
-        pipette.dispense(dispense_volume, destination_well, push_out=push_out_volume)
+        for i in range(passes):
+            ## Aspirate specified volume from the source_well
+            pipette.aspirate(pass_volume, source_well.bottom(pipette_height))
+            ## If desired, include an airgap
+            if airgap:
+                pipette.air_gap(airgap_volume)
+                dispense_volume = pass_volume + airgap_volume
+            else:
+                dispense_volume = pass_volume
+            ## Dispense in the destination_well
+            pipette.dispense(dispense_volume, destination_well, push_out=push_out_volume)
         ## If desired, mix
         if mix:
             pipette.mix(3, mix_volume, destination_well)
@@ -477,6 +911,10 @@ def transferring_reagents_different_height(source_wells,
         ## drop tip
         pipette.drop_tip()
         
+    #### Perform the recorded pipetting steps
+    if execute:
+        PP.executing_plan(plan, protocol)
+        
     return
     
 def transferring_varying_volumes(source_wells,
@@ -486,7 +924,9 @@ def transferring_varying_volumes(source_wells,
                                  mix,
                                  p20,
                                  p300,
-                                 protocol):
+                                 protocol,
+                                 optimize_order = False,
+                                 plan = False):
     """
     Parameters
     ----------
@@ -506,58 +946,78 @@ def transferring_varying_volumes(source_wells,
     mix : Boolean True or False
         Do you want to mix (pipette up and down) after dispensing
     p20 : labware definition
+        Can also be a p20_multi_gen2, full columns with equal volumes are 
+        then transferred at once
     p300 : labware definition
+        Can also be a p300_multi_gen2, full columns with equal volumes are 
+        then transferred at once
     protocol : def run(protocol: protocol_api.ProtocolContext)
+    optimize_order : Boolean True or False
+        Optional, default False. If True, the transfers are performed per 
+        pipette in the order that saves most gantry travel. Only use this if
+        the order of the transfers does not matter.
+    plan : Boolean False or Plan
+        Optional, default False. If a PipettingPlan.Plan is given, the 
+        pipetting steps are only added to that plan and you perform them 
+        with PipettingPlan.executing_plan. If False, the steps are performed
+        when this function is finished.
 
     Returns
     -------
     None.
 
     """
+    #### Record the pipetting steps in a plan
+    from data.user_storage.mollab_modules import PipettingPlan as PP
+    plan, p20, p300, execute = PP.recording_plan(plan, p20, p300)
     
     #### If only 1 volume is provided, 
     if not isinstance(transfer_volumes, list):
         raise Exception("Use the transferring_reagent module instead of the "
                         "transferring_varying_volumes module")
     
+    #### Determine which pipette to use, full columns go to a multichannel
+    transfers = grouping_columns(source_wells, 
+                                 destination_wells,
+                                 transfer_volumes,
+                                 p20,
+                                 p300,
+                                 'transferring')
+    
+    #### If desired, reorder the transfers per pipette to reduce travel
+    if optimize_order:
+        from data.user_storage.mollab_modules import TransferOrdering as TO
+        p20_transfers, p20_saved = TO.ordering_transfers(
+            [transfer for transfer in transfers if transfer[3] == p20],
+            p20, plan)
+        p300_transfers, p300_saved = TO.ordering_transfers(
+            [transfer for transfer in transfers if transfer[3] == p300],
+            p300, plan)
+        transfers = p20_transfers + p300_transfers
+        plan.comment(f"Optimized transfer order saves "
+                     f"{round(p20_saved + p300_saved)} mm of gantry travel")
+    
     #### Loop through list of volumes, sources and destinations
-    for i, (source_well, destination_well, transfer_volume) in enumerate(
-            zip(source_wells, destination_wells, transfer_volumes)):
-        #### Determine which pipette to use:
-        if transfer_volume <= 15:
-            pipette = p20
-            push_out_volume = 2
-        else:
-            pipette = p300
-            push_out_volume = 5
-        
-        #### Calculate airgap and mix volumes
-        if pipette == p20:
-            airgap_volume = 1
-        else:
-            airgap_volume = 10
-        
-        if pipette == p20:
-            mix_volume = 5
-        else:
-            if transfer_volume <= 50:
-                mix_volume = transfer_volume
-            else:
-                mix_volume = 50
-       
-        #### The actual transfer
+    for (source_well, destination_well, transfer_volume, pipette,
+         passes) in transfers:
+        ## Volumes that do not fit in 1 tip are transferred in multiple passes
+        pass_volume = transfer_volume / passes
+        ## Calculate push_out, airgap and mix volumes
+        push_out_volume, airgap_volume, mix_volume = transfer_settings(
+            pipette, p20, pass_volume)
         ## Pick up a pipette_tip
         pipette.pick_up_tip()
-        ## Aspirate specified volume from the source_well
-        pipette.aspirate(transfer_volume, source_well)
-        ## If desired, include an airgap
-        if airgap:
-            pipette.air_gap(airgap_volume)
-            dispense_volume = transfer_volume + airgap_volume
-        else:
-            dispense_volume = transfer_volume
-        ## Dispense in the destination_well
-        pipette.dispense(dispense_volume, destination_well, push_out=push_out_volume)
+        for i in range(passes):
+            ## Aspirate specified volume from the source_well
+            pipette.aspirate(pass_volume, source_well)
+            ## If desired, include an airgap
+            if airgap:
+                pipette.air_gap(airgap_volume)
+                dispense_volume = pass_volume + airgap_volume
+            else:
+                dispense_volume = pass_volume
+            ## Dispense in the destination_well
+            pipette.dispense(dispense_volume, destination_well, push_out=push_out_volume)
         ## If desired, mix
         if mix:
             pipette.mix(3, mix_volume, destination_well)
@@ -567,6 +1027,10 @@ def transferring_varying_volumes(source_wells,
         ## drop tip
         pipette.drop_tip()
             
+    #### Perform the recorded pipetting steps
+    if execute:
+        PP.executing_plan(plan, protocol)
+        
     return
 
 def transferring_reagents_no_bubbles(source_wells,
@@ -575,7 +1039,8 @@ def transferring_reagents_no_bubbles(source_wells,
                                      mix,
                                      p20,
                                      p300,
-                                     protocol):
+                                     protocol,
+                                     plan = False):
     """
     Parameters
     ----------
@@ -590,24 +1055,33 @@ def transferring_reagents_no_bubbles(source_wells,
     p20 : labware definition
     p300 : labware definition
     protocol : def run(protocol: protocol_api.ProtocolContext):
+    plan : Boolean False or Plan
+        Optional, default False. If a PipettingPlan.Plan is given, the 
+        pipetting steps are only added to that plan and you perform them 
+        with PipettingPlan.executing_plan. If False, the steps are performed
+        when this function is finished.
 
     Returns
     -------
     None.
 
     """
+    #### Record the pipetting steps in a plan
+    from data.user_storage.mollab_modules import PipettingPlan as PP
+    plan, p20, p300, execute = PP.recording_plan(plan, p20, p300)
+    
     #### If a list of volumes is provided, 
     if isinstance(transfer_volume, list):
         raise Exception("Use the transferring_variable_volumes module instead of the "
                         "transferring_reagent module")
     
-    #### Determine which pipette to use:
-    if transfer_volume <= 15:
-        pipette = p20
-    else:
-        pipette = p300
+    #### Determine which single channel pipette to use and in how many 
+    #### passes
+    pipette, passes = selecting_single_channel(transfer_volume, 
+                                               'transferring', p20, p300)
+    pass_volume = transfer_volume / passes
     
-    #### Calculate airgap and mix volumes
+    #### Calculate mix volumes
     if mix:
         if pipette == p20:
             if mix == True:
@@ -615,8 +1089,8 @@ def transferring_reagents_no_bubbles(source_wells,
             else:
                 mix_volume = mix
         else:
-            if transfer_volume <= 50:
-                mix_volume = transfer_volume
+            if pass_volume <= 50:
+                mix_volume = pass_volume
             else:
                 mix_volume = 50
     
@@ -624,18 +1098,21 @@ def transferring_reagents_no_bubbles(source_wells,
     for source_well, destination_well in zip(source_wells, destination_wells):
         ## Pick up a pipette_tip
         pipette.pick_up_tip()
-        ## Aspirate specified volume from the source_well
-        pipette.aspirate(transfer_volume, source_well)
-        ## If desired, include an airgap
-        dispense_volume = transfer_volume
-        ## Dispense in the destination_well
-        pipette.dispense(dispense_volume, destination_well)
+        for i in range(passes):
+            ## Aspirate specified volume from the source_well
+            pipette.aspirate(pass_volume, source_well)
+            ## Dispense in the destination_well
+            pipette.dispense(pass_volume, destination_well)
         ## If desired, mix
         if mix:
             pipette.mix(3, mix_volume, destination_well)
         ## drop tip
         pipette.drop_tip()
         
+    #### Perform the recorded pipetting steps
+    if execute:
+        PP.executing_plan(plan, protocol)
+        
     return
 
         
@@ -649,14 +1126,20 @@ def pooling_varying_volumes(source_wells,
                             mix,
                             p20,
                             p300,
-                            protocol):
+                            protocol,
+                            optimize_order = False,
+                            consolidate = False,
+                            samples_per_tip = 6,
+                            consolidate_capacity = False,
+                            consolidate_airgap = 5,
+                            plan = False):
     """
     Parameters
     ----------
     source_wells : list
         List of tube(s)/well(s) to get pool from
     pool_volumes : list
-        volumes in µL that you want to pool
+        volumes in µL that you want to pool, wells with 0 µL are skipped
     pool_tube : list
         List of tube(s)/well(s) to pool in
     pool_tube_type : string
@@ -672,95 +1155,168 @@ def pooling_varying_volumes(source_wells,
     p20 : labware definition
     p300 : labware definition
     protocol : def run(protocol: protocol_api.ProtocolContext)
+    optimize_order : Boolean True or False
+        Optional, default False. If True, the samples are pooled per 
+        pipette in the order that saves most gantry travel. Only use this if
+        the order of pooling does not matter.
+    consolidate : Boolean True or False
+        Optional, default False. If True, the p300 aspirates several samples
+        in 1 tip, separated by airgaps, and dispenses them at once in the 
+        pool tube. This saves tips and time, but the tip touches multiple 
+        samples, so only use it if (small) carry-over is no problem.
+    samples_per_tip : int
+        Optional, default 6. Maximum number of samples in 1 tip when 
+        consolidating
+    consolidate_capacity : Boolean False or float
+        Optional, default False. µL of samples + airgaps that fit in 1 tip 
+        when consolidating, at most the pooling maximum of the p300. If 
+        False, the pooling maximum of the p300 is used.
+    consolidate_airgap : float
+        Optional, default 5. µL of air between the samples in 1 tip
+    plan : Boolean False or Plan
+        Optional, default False. If a PipettingPlan.Plan is given, the 
+        pipetting steps are only added to that plan and you perform them 
+        with PipettingPlan.executing_plan. If False, the steps are performed
+        when this function is finished.
 
     Returns
     -------
     None.
 
     """
-    #### Import volume tracking module
-    from data.user_storage.mollab_modules import VolumeTracking as VT
+    #### Record the pipetting steps in a plan
+    from data.user_storage.mollab_modules import PipettingPlan as PP
+    plan, p20, p300, execute = PP.recording_plan(plan, p20, p300)
     
-    #### Determine start_height (at the start, current_height = start_height)
-    start_height = current_height = VT.cal_start_height(pool_tube_type, 
-                                                        start_volume)
-    
-    #### Variables for volume tracking and aliquoting        
-    pooled_volume = 0
-    counter = 0
-    pool = pool_tube[counter]
+    #### Keep track of the volume in the pool tube(s), a next tube is used 
+    #### when pool_volume_per_tube is pooled in a tube
+    from data.user_storage.mollab_modules import VolumeTracking as VT
+    pool_tracker = VT.VolumeTracker(pool_tube,
+                                    pool_tube_type,
+                                    start_volume,
+                                    max_volume = pool_volume_per_tube,
+                                    comment = plan.comment)
+    pool = pool_tube[0]
     
     #### If only 1 volume is provided, 
     if not isinstance(pool_volumes, list):
         raise Exception("This protocol only works with a list of volumes.")
+    
+    #### The consolidated samples + airgaps should fit in the p300 tip
+    if consolidate_capacity and consolidate_capacity > MAX_VOLUMES['pooling'][1]:
+        raise Exception(f"consolidate_capacity can be at most "
+                        f"{MAX_VOLUMES['pooling'][1]} µL, the pooling maximum "
+                        f"of the p300")
              
+    #### Nothing is pooled from wells with a volume of 0 µL
+    wells_volumes = [(well, pool_volume) for well, pool_volume 
+                     in zip(source_wells, pool_volumes) if pool_volume > 0]
+    
+    #### Determine per sample which single channel pipette to use and in how
+    #### many passes
+    selections = [selecting_single_channel(pool_volume, 'pooling', p20, p300,
+                                           well)
+                  for well, pool_volume in wells_volumes]
+    
     #### First small volumes, then large volumes
     for pipette in [p20,p300]:
+        if not pipette:
+            continue
         ### Set airgap size, depending on pipette size
         if pipette  == p20:
-            min_volume = 0
-            max_volume = 19
             gap = 1
             push_out_volume = 2
                 
         elif pipette == p300:
-            min_volume = 19
-            max_volume = 190
             gap = 5
             push_out_volume = 5
                 
+        ### Determine which wells to pool with which pipette
+        pipette_transfers = [(well, pool, pool_volume, passes) 
+                             for (well, pool_volume), (selected, passes)
+                             in zip(wells_volumes, selections)
+                             if selected == pipette]
+        
+        ### If desired, reorder the samples to reduce travel
+        if optimize_order:
+            from data.user_storage.mollab_modules import TransferOrdering as TO
+            pipette_transfers, saved = TO.ordering_transfers(
+                pipette_transfers, pipette, plan)
+            if pipette_transfers:
+                plan.comment(f"Optimized pooling order saves {round(saved)} "
+                             f"mm of gantry travel")
+        
+        ### If desired, combine samples of the p300 in 1 tip
+        if consolidate and pipette == p300:
+            if consolidate_capacity:
+                capacity = consolidate_capacity
+            else:
+                capacity = MAX_VOLUMES['pooling'][1]
+            groups = consolidating_samples(pipette_transfers, 
+                                           capacity, 
+                                           consolidate_airgap, 
+                                           samples_per_tip,
+                                           pool_tracker)
+        else:
+            groups = [[transfer] for transfer in pipette_transfers]
+        
         ### Loop through list of volumes and destinations
-        for well, pool_volume in zip(source_wells, pool_volumes):
-            ## Aspirate a little more for reverse pipetting
+        for group in groups:
+            well, pool, pool_volume, passes = group[0]
+            ## Volume that is dispensed at once in the pool tube
+            if len(group) > 1:
+                pool_volume = sum(transfer[2] for transfer in group)
+            ## Volumes that do not fit in 1 tip are pooled in multiple passes
+            pass_volume = pool_volume / passes
+
+            #### Location just below the liquid surface in the pool tube
+            dispense_location = pool_tracker.next_dispense_location(
+                pool_volume)
+            pool = pool_tracker.tube
+
+            #### The actual pipetting                
+            # Pick up a tip
+            pipette.pick_up_tip()
             
-            ## Determine which wells to fill with which pipette
-            if min_volume < pool_volume <= max_volume:
-
-                #### Call volume_tracking function
-                current_height, pip_height, bottom_reached = (
-                    VT.volume_tracking(pool_tube_type,
-                                       pool_volume, 
-                                       current_height,
-                                       'filling'))
-                pooled_volume += pool_volume
-                
-                # ### If necesarry, continue with next tube
-                # if bottom_reached or pooled_volume > pool_volume_per_tube:
-                #     # Continue with next tube, reset volume_tracking
-                #     current_height = start_height
-                #     current_height, pip_height, bottom_reached = (
-                #         VT.volume_tracking(pool_tube_type,
-                #                             pool_volume, 
-                #                             current_height,
-                #                             'filling'))
-                #     pooled_volume = 0
-                #     counter += 1
-                #     pool = pool_tube[counter]
-
-                #### The actual pipetting                
-                # Pick up a tip
-                pipette.pick_up_tip()
-                
-                # Take up the specified volume per sample       
-                pipette.aspirate(pool_volume, well)
-                # Take an air gap, to prevent cross_contamination
-                if airgap:
-                    pipette.air_gap(gap)
-                    dispense_volume = pool_volume + gap
-                else:
-                    dispense_volume = pool_volume
+            # Consolidate: take up all samples, then dispense them at once
+            if len(group) > 1:
+                for well, destination, sample_volume, passes in group:
+                    pipette.aspirate(sample_volume, well)
+                    pipette.air_gap(consolidate_airgap)
+                dispense_volume = pool_volume + consolidate_airgap * len(group)
+                pipette.dispense(dispense_volume, dispense_location, push_out=push_out_volume)
+            
+            # Pool 1 sample, in 1 or more passes
+            else:
+                for i in range(passes):
+                    # Take up the specified volume per sample       
+                    pipette.aspirate(pass_volume, well)
+                    # Take an air gap, to prevent cross_contamination
+                    if airgap:
+                        pipette.air_gap(gap)
+                        dispense_volume = pass_volume + gap
+                    else:
+                        dispense_volume = pass_volume
                     
-                # Dispense in the pool_tube
-                pipette.dispense(dispense_volume, pool.bottom(pip_height), push_out=push_out_volume)
-                # Mix by pipetting up and down 3x
-                if pool_tube_type == 'tube_1.5mL':
-                    mix_height = 1
-                else:
-                    mix_height = 5
-                pipette.mix(3, pool_volume, pool.bottom(pip_height + mix_height))
-                # Blow out
-                pipette.blow_out()
-                              
-                # drop tip
-                pipette.drop_tip()
-                
\ No newline at end of file
+                    # Dispense in the pool_tube
+                    pipette.dispense(dispense_volume, dispense_location, push_out=push_out_volume)
+            # Mix by pipetting up and down 3x
+            if pool_tube_type == 'tube_1.5mL':
+                mix_height = 1
+            else:
+                mix_height = 5
+            # Mix with at most the volume that fits in the tip
+            max_volume = MAX_VOLUMES['pooling'][1 if pipette == p300 else 0]
+            mix_volume = min(pass_volume, max_volume)
+            pipette.mix(3, mix_volume, pool.bottom(pool_tracker.pip_height + mix_height))
+            # Blow out
+            pipette.blow_out()
+                          
+            # drop tip
+            pipette.drop_tip()
+
+    #### Perform the recorded pipetting steps
+    if execute:
+        PP.executing_plan(plan, protocol)
+        
+    return
@@ -0,0 +1,778 @@
+"""
+version: Jan_2024
+Module to generate the protocols of the pool_template_protocols for many
+projects at once, instead of filling in the placeholders by hand. A project
+is a results file of EquimolarPooling (or a TapeStation export, that is
+calculated first), its NIOZ number is taken from the file name. Per project
+are generated, in Generated_protocols/<NIOZ number>/:
+    <NIOZ>_sample_dilution.py     per plate with diluted samples (_<plate>
+                                  if there is more than 1 plate)
+    <NIOZ>_equimolar_pooling.py   per pooling run (_<run> if there is more
+                                  than 1 run), the multiple plates template
+                                  for a run with more than 1 plate
+    <NIOZ>_run_sheet.csv          per run the protocol, plates, tips, the
+                                  starting tip of the p20 and p300, tip 
+                                  racks and tubes. A protocol that is the
+                                  same as another generated protocol is not
+                                  written, the run sheet has the other one
+The plates are split in as few pooling runs as possible: a run has room for
+MAX_POOLING_PLATES plates, TIP_RACK_SLOTS tip racks (the tips are counted
+from a dry run of the pooling, see DryRun, from the default starting tips of
+the template, see starting_tips) and the pool tubes of 
+LabWare_v2.which_tube_type, that have to hold the pool with their dead 
+volume (see LabWare_v2.packing_tubes). A plate is never split over runs.
+Every protocol is checked with compile() before it is written, the projects
+are generated in parallel.
+
+The index (generation_index.json in Generated_protocols) has per generated
+file the hash of what it is generated from: the template, the volumes and the
+file name. A protocol whose hash is in the index and whose file did not
+change is not generated again, a protocol that is the same as another
+generated protocol is not written twice. The protocols that were written
+have to be uploaded again to their robot (the Protocol_database folder of
+the templates, e.g. MO).
+
+From the root of the repository:
+    python -m data.user_storage.mollab_modules.ProtocolGenerator NIOZ396_results.csv NIOZ397_results.csv
+    python -m data.user_storage.mollab_modules.ProtocolGenerator export.csv --nioz NIOZ398
+"""
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+TEMPLATE_FOLDER = os.path.join('Protocol_database', 'MO',
+                               'pool_template_protocols')
+OUTPUT_FOLDER = os.path.join('Protocol_database', 'MO', 'Generated_protocols')
+INDEX_FILE = 'generation_index.json'
+#### Template per protocol
+TEMPLATES = {'sample_dilution': 'Sample_dilution_protocol_template.py',
+             'equimolar_pooling': 'Equimolar_pooling_protocol_template.py',
+             'equimolar_pooling_multiple_plates':
+                 'Equimolar_pooling_with_multiple_plates.py'}
+#### Source plates that fit on the deck of the multiple plates template
+MAX_POOLING_PLATES = 6
+#### Fraction of extra dilution water in the tubes, like in the template
+DILUTION_WATER_EXTRA = 0.2
+#### Slots of the templates for tip racks (7, 8, 10, 11), for the p20 and the
+#### p300 tips together
+TIP_RACK_SLOTS = 4
+RUN_SHEET_COLUMNS = ['run', 'protocol', 'plates', 'samples', 'p20_tips',
+                     'p300_tips', 'p20_starting_tip', 'p300_starting_tip',
+                     'p20_tip_racks', 'p300_tip_racks', 'tubes', 
+                     'tube_volumes', 'PB_buffer']
+PLACEHOLDER = re.compile(r'<(\w+)>')
+#### The starting tip parameters of a template, with their choices
+STARTING_TIP_PARAMETER = re.compile(
+    r'variable_name="starting_tip_(p20|p300)_(row|column)"(.*?)'
+    r'default=(.+?)\)', re.DOTALL)
+CHOICE = re.compile(r'\{"display_name": "([^"]+)", "value": ([^}]+?)\}')
+NIOZ_NUMBER = re.compile(r'NIOZ\d+', re.IGNORECASE)
+
+def formatting_volumes(volumes):
+    """
+    Returns a list of volumes as python text, whole volumes without '.0'.
+    """
+    return '[' + ', '.join(str(int(volume)) if volume == int(volume) else
+                           str(round(volume, 2))
+                           for volume in volumes) + ']'
+
+def rendering(template, values):
+    """
+    Fills in the placeholders (<name>) of a template.
+
+    Raises
+    ------
+    Exception
+        If a placeholder of the template has no value
+    """
+    missing = set(PLACEHOLDER.findall(template)) - set(values)
+    if missing:
+        raise Exception(f"There is no value for {sorted(missing)}")
+    return PLACEHOLDER.sub(lambda match: values[match.group(1)], template)
+
+def nioz_number(path):
+    """
+    Returns the NIOZ number in the name of a file or its folder, or None.
+    """
+    match = NIOZ_NUMBER.search(os.path.basename(path)) or NIOZ_NUMBER.search(
+        os.path.basename(os.path.dirname(os.path.abspath(path))))
+    if match is None:
+        return None
+    return match.group(0).upper()
+
+def reading_project(path, optimize = False):
+    """
+    Returns the results of a project: a results file of EquimolarPooling is
+    read, a TapeStation export is calculated. With optimize (see
+    EquimolarPooling.pooling_results) a results file is calculated again
+    with optimizing_equimolar. The second value is True if the results were
+    calculated.
+    """
+    from data.user_storage.mollab_modules import EquimolarPooling as EP
+
+    with open(path, encoding = 'utf-8-sig', errors = 'replace') as project_file:
+        header = project_file.readline()
+    if 'µL_pooled' in header and not optimize:
+        return EP.reading_results(path), False
+    return EP.pooling_results([path], optimize), True
+
+def reading_templates(template_folder = TEMPLATE_FOLDER):
+    """
+    Returns the text of every template of TEMPLATES, by its key.
+    """
+    templates = {}
+    for template, file_name in TEMPLATES.items():
+        with open(os.path.join(template_folder, file_name),
+                  encoding = 'utf-8') as template_file:
+            templates[template] = template_file.read()
+    return templates
+
+def starting_tips(template):
+    """
+    Returns the default starting tips of the p20 and the p300 in the 
+    parameters of a template, e.g. ('H12', 'H12'). The display name of the
+    default choice is used, because some values are not the row or column
+    (e.g. 'this_is_not_false' for row F).
+
+    Raises
+    ------
+    Exception
+        If the template has no default starting tip for the p20 and the p300
+    """
+    parts = {}
+    for pipette, part, choices, default in STARTING_TIP_PARAMETER.findall(
+            template):
+        names = {value.strip(): name for name, value in CHOICE.findall(choices)}
+        default = default.strip()
+        parts[pipette, part] = names.get(default, default.strip('"'))
+    try:
+        return tuple(parts[pipette, 'row'] + parts[pipette, 'column']
+                     for pipette in ['p20', 'p300'])
+    except KeyError:
+        raise Exception("The template has no default starting tip for the "
+                        "p20 and the p300")
+
+def pooling_template(plates):
+    """
+    Returns the template (key of TEMPLATES) of a pooling run of these plates.
+    """
+    if len(plates) > 1:
+        return 'equimolar_pooling_multiple_plates'
+    return 'equimolar_pooling'
+
+def counting_run(steps, run, tips):
+    """
+    Adds the tips and tip racks (from the starting tips of the p20 and the
+    p300, see starting_tips) that the steps of a run use to the run, see 
+    DryRun.counting_plan_tips.
+    """
+    from data.user_storage.mollab_modules import DryRun as DR
+    from data.user_storage.mollab_modules import LabWare_v2 as LW
+
+    run['p20_starting_tip'], run['p300_starting_tip'] = tips
+    run['p20_tips'], run['p300_tips'] = DR.counting_plan_tips(steps)
+    run['p20_tip_racks'] = LW.number_of_tipracks(run['p20_starting_tip'],
+                                                 run['p20_tips'])[0]
+    run['p300_tip_racks'] = LW.number_of_tipracks(run['p300_starting_tip'],
+                                                   run['p300_tips'])[0]
+    return run
+
+def pooling_run(plates, volumes, tips):
+    """
+    Returns what a pooling run of these plates needs, from a dry run of the
+    pooling of the template.
+
+    Parameters
+    ----------
+    plates : list
+        Numbers (from 0) of the plates in the run
+    volumes : list
+        The template_volumes of EquimolarPooling, of all plates
+    tips : tuple
+        The starting tips of the p20 and the p300 in the template, see 
+        starting_tips
+
+    Returns
+    -------
+    run : dict
+        'plates', 'samples', tips, starting tips and tip racks per pipette,
+        'tube_type' and 'tubes' of the pool, 'packed_tubes' (the tubes that
+        hold the pool with their dead volume) and 'PB_buffer' in µL
+    """
+    from data.user_storage.mollab_modules import DryRun as DR
+    from data.user_storage.mollab_modules import EquimolarPooling as EP
+    from data.user_storage.mollab_modules import LabWare_v2 as LW
+    from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
+
+    pool_volumes = [volume for plate in plates
+                    for volume in volumes[plate]['DNA_volumes']]
+    PB_volume = sum(pool_volumes) * EP.PB_BUFFER_RATIO
+    total_cleanup_volume = sum(pool_volumes) + PB_volume
+    tube_type, number_of_tubes, max_volume = LW.which_tube_type(
+        total_volume = total_cleanup_volume, tube_type = False)
+    ## Like the template, only the samples are pooled per tube, the PB 
+    ## buffer is in the tubes from the start. The samples are 1 part of the 
+    ## clean-up volume, the PB buffer PB_BUFFER_RATIO parts.
+    pool_volume_per_tube = (total_cleanup_volume / number_of_tubes / 
+                            (1 + EP.PB_BUFFER_RATIO))
+
+    run = {'plates': plates,
+           'samples': len(pool_volumes),
+           'tube_type': tube_type,
+           'tubes': number_of_tubes,
+           'packed_tubes': len(LW.packing_tubes(total_cleanup_volume,
+                                                [tube_type])[0]),
+           'tube_volumes': [],
+           'PB_buffer': round(PB_volume, 2)}
+    return counting_run([(PM.pooling_varying_volumes, {
+        'source_wells': DR.dry_run_wells(len(pool_volumes)),
+        'pool_volumes': pool_volumes,
+        'pool_tube': DR.dry_run_wells(number_of_tubes),
+        'pool_tube_type': tube_type,
+        'start_volume': PB_volume,
+        'pool_volume_per_tube': pool_volume_per_tube,
+        'airgap': True,
+        'mix': True})], run, tips)
+
+def dilution_run(plate, volumes, tips):
+    """
+    Returns what the dilution run of a plate needs, like pooling_run. The
+    water tubes are chosen with LabWare_v2.packing_tubes like in the 
+    template: 1 tube type, with the dead volume of every tube and 
+    DILUTION_WATER_EXTRA.
+    """
+    from data.user_storage.mollab_modules import DryRun as DR
+    from data.user_storage.mollab_modules import LabWare_v2 as LW
+    from data.user_storage.mollab_modules import Pipetting_Modules_v2 as PM
+
+    sample_volumes = volumes[plate]['Sample_volumes']
+    tube_types, fill_volumes = LW.packing_tubes(
+        sum(volumes[plate]['Water_volumes']), mixing_types = False,
+        extra = DILUTION_WATER_EXTRA)
+    ## The tubes are only counted, so the dry run does not stop at the 
+    ## bottom of a tube.
+    water_volumes = volumes[plate]['Water_volumes']
+
+    run = {'plates': [plate],
+           'samples': len(sample_volumes),
+           'tube_type': tube_types[0],
+           'tubes': len(tube_types),
+           'tube_volumes': fill_volumes,
+           'PB_buffer': ''}
+    return counting_run([
+        (PM.aliquoting_varying_volumes, {
+            'reagent_source': DR.dry_run_wells(len(tube_types)),
+            'reagent_tube_type': tube_types[0],
+            'reagent_startvolume': fill_volumes,
+            'aliquot_volumes': water_volumes,
+            'destination_wells': DR.dry_run_wells(len(water_volumes)),
+            'action_at_bottom': 'continue_at_bottom',
+            'pause': False}),
+        (PM.transferring_varying_volumes, {
+            'source_wells': DR.dry_run_wells(len(sample_volumes)),
+            'destination_wells': DR.dry_run_wells(len(sample_volumes)),
+            'transfer_volumes': sample_volumes,
+            'airgap': True,
+            'mix': True})], run, tips)
+
+def fitting(run, pooling = True):
+    """
+    Checks if a run fits on the deck of its template: the tip racks in the
+    TIP_RACK_SLOTS, and for pooling the plates in MAX_POOLING_PLATES and the
+    pool in the tubes that the template loads (LabWare_v2.which_tube_type
+    does not take the dead volume and the max_fill_height of the tubes 
+    into account, LabWare_v2.packing_tubes does).
+    """
+    if run['p20_tip_racks'] + run['p300_tip_racks'] > TIP_RACK_SLOTS:
+        return False
+    if pooling:
+        return (len(run['plates']) <= MAX_POOLING_PLATES and
+                run['packed_tubes'] <= run['tubes'])
+    return True
+
+def splitting_runs(volumes, templates):
+    """
+    Splits the pooling of the plates in as few runs as possible. Plates are
+    not split and stay in their order, every run gets as many plates as fit
+    (see fitting), which gives the fewest runs. templates has the text of 
+    the templates, see reading_templates.
+
+    Raises
+    ------
+    Exception
+        If 1 plate does not fit in a run
+
+    Returns
+    -------
+    runs : list
+        The pooling_run of every run
+    """
+    runs = []
+    run = None
+    for plate in range(len(volumes)):
+        if run is not None:
+            plates = run['plates'] + [plate]
+            candidate = pooling_run(plates, volumes, starting_tips(
+                templates[pooling_template(plates)]))
+            if fitting(candidate):
+                run = candidate
+                continue
+            runs.append(run)
+        run = pooling_run([plate], volumes, starting_tips(
+            templates[pooling_template([plate])]))
+        if not fitting(run):
+            raise Exception(f"The pooling of plate {plate + 1} does not fit "
+                            f"in 1 run")
+    if run is not None:
+        runs.append(run)
+    return runs
+
+def project_protocols(results, nioz, templates):
+    """
+    Returns the protocols of a project: a dilution run per plate with
+    diluted samples and the pooling runs of splitting_runs. templates has
+    the text of the templates, see reading_templates.
+
+    Raises
+    ------
+    Exception
+        If the dilution of 1 plate does not fit in 1 run
+
+    Returns
+    -------
+    protocols : list
+        Per protocol a (file name, template, values of the placeholders)
+        tuple
+    run_sheet : list
+        Per protocol a row with RUN_SHEET_COLUMNS, in the order of the runs
+    """
+    from data.user_storage.mollab_modules import EquimolarPooling as EP
+
+    volumes = EP.template_volumes(results)
+    protocols = []
+    runs = []
+
+    for plate, plate_volumes in enumerate(volumes):
+        if not any(plate_volumes['Water_volumes']):
+            continue
+        run = dilution_run(plate, volumes, starting_tips(
+            templates['sample_dilution']))
+        if not fitting(run, pooling = False):
+            raise Exception(f"The dilution of plate {plate + 1} does not "
+                            f"fit in 1 run")
+        suffix = f"_{plate + 1}" if len(volumes) > 1 else ''
+        protocols.append((
+            f"{nioz}_sample_dilution{suffix}.py", 'sample_dilution',
+            {'NIOZ_NUMBER': nioz,
+             'Sample_volumes': formatting_volumes(
+                 plate_volumes['Sample_volumes']),
+             'Water_volumes': formatting_volumes(
+                 plate_volumes['Water_volumes'])}))
+        runs.append(run)
+
+    pooling_runs = splitting_runs(volumes, templates)
+    for number, run in enumerate(pooling_runs):
+        suffix = f"_{number + 1}" if len(pooling_runs) > 1 else ''
+        protocols.append((
+            f"{nioz}_equimolar_pooling{suffix}.py",
+            pooling_template(run['plates']),
+            {'NIOZ_NUMBER': nioz,
+             'DNA_volumes': '[' + ', '.join(
+                 formatting_volumes(volumes[plate]['DNA_volumes'])
+                 for plate in run['plates']) + ']'}))
+        runs.append(run)
+
+    run_sheet = []
+    for number, ((file_name, template, values), run) in enumerate(
+            zip(protocols, runs)):
+        run_sheet.append({
+            'run': number + 1,
+            'protocol': file_name,
+            'plates': ' '.join(str(plate + 1) for plate in run['plates']),
+            'samples': run['samples'],
+            'p20_tips': run['p20_tips'],
+            'p300_tips': run['p300_tips'],
+            'p20_starting_tip': run['p20_starting_tip'],
+            'p300_starting_tip': run['p300_starting_tip'],
+            'p20_tip_racks': run['p20_tip_racks'],
+            'p300_tip_racks': run['p300_tip_racks'],
+            'tubes': f"{run['tubes']} x {run['tube_type']}",
+            'tube_volumes': ' '.join(str(volume)
+                                     for volume in run['tube_volumes']),
+            'PB_buffer': run['PB_buffer']})
+    return protocols, run_sheet
+
+def run_sheet_text(run_sheet):
+    """
+    Returns the run sheet as csv text.
+    """
+    import csv
+    import io
+
+    text = io.StringIO()
+    writer = csv.DictWriter(text, RUN_SHEET_COLUMNS, lineterminator = '\n')
+    writer.writeheader()
+    writer.writerows(run_sheet)
+    return text.getvalue()
+
+def text_hash(text):
+    """
+    Returns the sha256 of a text.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def file_hash(path):
+    """
+    Returns the text_hash of a file, None if it does not exist.
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding = 'utf-8', errors = 'replace') as hashed_file:
+        return text_hash(hashed_file.read())
+
+def generation_key(*parts):
+    """
+    Returns the key of a generated file in the index: the sha256 of
+    everything it is generated from (template, data and parameters).
+    """
+    return text_hash(json.dumps(parts, sort_keys = True, ensure_ascii = False))
+
+def robot_name(template_folder):
+    """
+    Returns the robot of a template folder: the folder of the robot in the
+    Protocol_database (Protocol_database/MO/.. -> 'MO'), or None.
+    """
+    parts = os.path.normpath(os.path.abspath(template_folder)).split(os.sep)
+    if 'Protocol_database' in parts[:-1]:
+        return parts[parts.index('Protocol_database') + 1]
+    return None
+
+def reading_index(output_folder = OUTPUT_FOLDER):
+    """
+    Returns the index of the generated files in the output folder, empty if
+    there is none.
+    """
+    path = os.path.join(output_folder, INDEX_FILE)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding = 'utf-8') as index_file:
+        return json.load(index_file)
+
+def writing_index(index, output_folder = OUTPUT_FOLDER):
+    """
+    Writes the index of the generated files to the output folder.
+    """
+    from data.user_storage.mollab_modules import LabwareGenerator as LG
+
+    LG.writing_file(os.path.join(output_folder, INDEX_FILE),
+                    json.dumps(index, indent = 1, sort_keys = True,
+                               ensure_ascii = False) + '\n')
+
+def up_to_date(entry, output_folder = OUTPUT_FOLDER):
+    """
+    Checks if the file of an index entry (or the file it is a duplicate of)
+    still has the content that was generated.
+    """
+    path = entry.get('duplicate_of', entry['path'])
+    return file_hash(os.path.join(output_folder, path)) == entry['output']
+
+def generating_project(path,
+                       nioz = False,
+                       output_folder = OUTPUT_FOLDER,
+                       template_folder = TEMPLATE_FOLDER,
+                       index = False,
+                       optimize = False):
+    """
+    Generates all protocols of 1 project into output_folder/<NIOZ number>/.
+    A TapeStation export also gets its results file there, and every
+    project gets a run sheet (<NIOZ>_run_sheet.csv). Files whose key
+    (see generation_key) is in the index and that did not change are
+    skipped, a protocol that is identical to another generated protocol is
+    not written again. With optimize the volumes are calculated with
+    EquimolarPooling.optimizing_equimolar, see generating_protocols.
+
+    Raises
+    ------
+    Exception
+        If there is no NIOZ number, or a generated protocol is no valid
+        python
+
+    Returns
+    -------
+    report : dict
+        'written': paths of the files that were written, 'skipped': paths
+        of the files that were up to date, 'duplicates': per protocol that
+        was not written the path of the identical protocol, 'removed':
+        paths of generated files that the project does not have anymore
+        (added by generating_protocols) or that are now the same as another
+        protocol, 'index': the
+        index entries of this project, 'steps': the pooling_steps of
+        EquimolarPooling
+    """
+    from data.user_storage.mollab_modules import EquimolarPooling as EP
+    from data.user_storage.mollab_modules import LabwareGenerator as LG
+
+    nioz = nioz or nioz_number(path)
+    if not nioz:
+        raise Exception(f"There is no NIOZ number in {path}, give it with "
+                        f"--nioz")
+    index = index or {}
+    robot = robot_name(template_folder)
+    results, calculated = reading_project(path, optimize)
+    os.makedirs(os.path.join(output_folder, nioz), exist_ok = True)
+    report = {'written': [], 'skipped': [], 'duplicates': {}, 'removed': [],
+              'index': {}, 'steps': EP.pooling_steps(results)}
+
+    #### Generated files that can be reused: content -> path
+    outputs = {entry['output']: entry['path'] for entry in index.values()
+               if 'duplicate_of' not in entry and
+               up_to_date(entry, output_folder)}
+
+    if calculated:
+        with open(path, encoding = 'utf-8', errors = 'replace') as export_file:
+            key = generation_key('results', text_hash(export_file.read()),
+                                 optimize)
+        file_name = f"{nioz}/{nioz}_equimolar_pooling_results.csv"
+        results_path = os.path.join(output_folder, file_name)
+        if key in index and up_to_date(index[key], output_folder):
+            report['skipped'].append(results_path)
+        else:
+            EP.writing_results(results, results_path)
+            report['written'].append(results_path)
+        report['index'][key] = {'path': file_name,
+                                'output': file_hash(results_path),
+                                'project': nioz,
+                                'robot': None}
+
+    templates = reading_templates(template_folder)
+    protocols, run_sheet = project_protocols(results, nioz, templates)
+
+    #### Per protocol that is not written, the protocol it is the same as
+    originals = {}
+    for file_name, template, values in protocols:
+        key = generation_key(TEMPLATES[template],
+                             text_hash(templates[template]),
+                             file_name,
+                             values)
+        protocol_name = file_name
+        file_name = f"{nioz}/{file_name}"
+        protocol_path = os.path.join(output_folder, file_name)
+
+        #### Nothing changed
+        if key in index and up_to_date(index[key], output_folder):
+            report['index'][key] = index[key]
+            if 'duplicate_of' in index[key]:
+                report['duplicates'][protocol_path] = os.path.join(
+                    output_folder, index[key]['duplicate_of'])
+                originals[protocol_name] = index[key]['duplicate_of']
+            else:
+                report['skipped'].append(protocol_path)
+            continue
+
+        text = rendering(templates[template], values)
+        try:
+            compile(text, protocol_path, 'exec')
+        except SyntaxError as error:
+            raise Exception(f"{protocol_path} is not valid python: {error}")
+        entry = {'path': file_name,
+                 'output': text_hash(text),
+                 'project': nioz,
+                 'robot': robot}
+
+        #### The same protocol is already generated under another name
+        original = outputs.get(entry['output'])
+        if original is not None and original != file_name:
+            entry['duplicate_of'] = original
+            report['duplicates'][protocol_path] = os.path.join(output_folder,
+                                                               original)
+            originals[protocol_name] = original
+            ## An older generated version of this protocol is not valid 
+            ## anymore, unless it was changed by hand
+            if os.path.isfile(protocol_path) and any(
+                    old['path'] == file_name and 'duplicate_of' not in old
+                    and up_to_date(old, output_folder)
+                    for old in index.values()):
+                os.remove(protocol_path)
+                report['removed'].append(protocol_path)
+        else:
+            if LG.writing_file(protocol_path, text):
+                report['written'].append(protocol_path)
+            else:
+                report['skipped'].append(protocol_path)
+            outputs[entry['output']] = file_name
+        report['index'][key] = entry
+
+    #### Run sheet, a protocol that is not written points to the protocol it
+    #### is the same as (with its project folder if that is another project)
+    for row in run_sheet:
+        original = originals.get(row['protocol'])
+        if original is not None:
+            project, original_name = original.split('/', 1)
+            row['protocol'] = original_name if project == nioz else original
+    text = run_sheet_text(run_sheet)
+    file_name = f"{nioz}/{nioz}_run_sheet.csv"
+    run_sheet_path = os.path.join(output_folder, file_name)
+    if LG.writing_file(run_sheet_path, text):
+        report['written'].append(run_sheet_path)
+    else:
+        report['skipped'].append(run_sheet_path)
+    report['index'][generation_key('run_sheet', text_hash(text))] = {
+        'path': file_name,
+        'output': text_hash(text),
+        'project': nioz,
+        'robot': None}
+
+    return report
+
+def generating_protocols(paths,
+                         nioz = False,
+                         output_folder = OUTPUT_FOLDER,
+                         template_folder = TEMPLATE_FOLDER,
+                         processes = False,
+                         optimize = False):
+    """
+    Generates the protocols of many projects, in parallel processes, and
+    updates the index of the output folder.
+
+    Parameters
+    ----------
+    paths : list
+        Results files (or TapeStation exports), 1 per project
+    nioz : Boolean False or string
+        Optional, default False. NIOZ number if there is only 1 project and
+        its file name has none
+    processes : Boolean False or int
+        Optional, default False. Number of processes, default the number of
+        cpus
+    optimize : Boolean False, True or dict
+        Optional, default False. Calculate the pool volumes with
+        EquimolarPooling.optimizing_equimolar, a dict has its tolerance
+        and/or min_volume
+
+    Returns
+    -------
+    reports : dict
+        Per path the report of generating_project, or the Exception of that
+        project
+    """
+    if nioz and len(paths) > 1:
+        raise Exception("A NIOZ number can only be given for 1 project")
+    index = reading_index(output_folder)
+
+    reports = {}
+    if len(paths) == 1:
+        try:
+            reports[paths[0]] = generating_project(paths[0], nioz,
+                                                   output_folder,
+                                                   template_folder, index,
+                                                   optimize)
+        except Exception as error:
+            reports[paths[0]] = error
+    else:
+        with ProcessPoolExecutor(processes or None) as executor:
+            futures = {path: executor.submit(generating_project, path, False,
+                                             output_folder, template_folder,
+                                             index, optimize)
+                       for path in paths}
+            for path, future in futures.items():
+                try:
+                    reports[path] = future.result()
+                except Exception as error:
+                    reports[path] = error
+
+    #### The entries of the projects that were generated are replaced, files
+    #### that a project does not have anymore are removed if they were not
+    #### changed by hand
+    for report in reports.values():
+        if isinstance(report, Exception):
+            continue
+        projects = {entry['project'] for entry in report['index'].values()}
+        paths = {entry['path'] for entry in report['index'].values()}
+        for key, entry in list(index.items()):
+            if entry['project'] not in projects:
+                continue
+            del index[key]
+            if (entry['path'] not in paths and 'duplicate_of' not in entry
+                    and up_to_date(entry, output_folder)):
+                os.remove(os.path.join(output_folder, entry['path']))
+                report['removed'].append(os.path.join(output_folder,
+                                                      entry['path']))
+        index.update(report['index'])
+    writing_index(index, output_folder)
+
+    return reports
+
+def reuploading(reports, output_folder = OUTPUT_FOLDER):
+    """
+    Returns the protocols that were written per robot: these have to be
+    uploaded to that robot again.
+    """
+    robots = {}
+    for report in reports.values():
+        if isinstance(report, Exception):
+            continue
+        for entry in report['index'].values():
+            path = os.path.join(output_folder, entry['path'])
+            if entry['robot'] and path in report['written']:
+                robots.setdefault(entry['robot'], []).append(path)
+    return robots
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description = 'Generates the pooling protocols of projects')
+    parser.add_argument('paths', nargs = '+',
+                        help = 'results files or TapeStation exports')
+    parser.add_argument('--nioz', default = False,
+                        help = 'NIOZ number, if there is 1 project')
+    parser.add_argument('--output', default = OUTPUT_FOLDER)
+    parser.add_argument('--templates', default = TEMPLATE_FOLDER)
+    parser.add_argument('--processes', type = int, default = False)
+    parser.add_argument('--optimize', action = 'store_true',
+                        help = 'choose the pool volumes with the fewest '
+                               'pipetting steps')
+    parser.add_argument('--tolerance', type = float, default = False,
+                        help = 'with --optimize, how much the ng of a '
+                               'sample may differ from the target (0.1)')
+    parser.add_argument('--min-volume', type = float, default = False,
+                        help = 'with --optimize, smallest µL that is pooled '
+                               'without diluting (5)')
+    arguments = parser.parse_args()
+    optimize = False
+    if arguments.optimize:
+        optimize = {name: value for name, value in
+                    [('tolerance', arguments.tolerance),
+                     ('min_volume', arguments.min_volume)]
+                    if value is not False} or True
+
+    reports = generating_protocols(arguments.paths,
+                                   arguments.nioz,
+                                   arguments.output,
+                                   arguments.templates,
+                                   arguments.processes,
+                                   optimize)
+    failed = False
+    for path, report in reports.items():
+        if isinstance(report, Exception):
+            failed = True
+            print(f"{path}: {report}")
+            continue
+        for protocol_path in report['written']:
+            print(f"written: {protocol_path}")
+        for protocol_path, original in report['duplicates'].items():
+            print(f"same as {original}: {protocol_path}")
+        for protocol_path in report['removed']:
+            print(f"removed: {protocol_path}")
+        print(f"{path}: {report['steps']['dilution_runs']} dilution runs, "
+              f"{report['steps']['pipetting_steps']} pipetting steps, "
+              f"{report['steps']['tips']} tips")
+        if report['skipped']:
+            print(f"{path}: {len(report['skipped'])} files up to date")
+    for robot, protocol_paths in reuploading(reports,
+                                             arguments.output).items():
+        print(f"upload again to {robot}: {', '.join(protocol_paths)}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,358 @@
+"""
+version: Jan_2024
+Module to estimate how long a protocol takes, without running it on a robot.
+The protocol is run in the opentrons simulator (pip install opentrons, works
+on any computer) with a TimingProtocol in between. That keeps track of where
+the pipettes move and adds up the time of every step with a simple motion
+model: gantry speeds, Z travel over the labware, pipette flow rates and fixed
+times for handling tips. Acceleration is not taken into account, so the
+estimate is a little optimistic for many short moves.
+
+Example, run from the root of this repository:
+    from data.user_storage.mollab_modules import RunTimeEstimation as RT
+    times = RT.estimating_protocol('Protocol_database/EVE/qPCR/qPCR_V4.5.py',
+                                   {'number_of_samples': 30})
+    print(RT.reporting_run_time(times))
+"""
+import sys
+
+#### Maximum speed of the gantry axes in mm/s, the same as the max_speeds in
+#### the labware test scripts. Z is the left mount, A the right mount.
+MAX_SPEEDS = {'X': 600, 'Y': 400, 'Z': 125, 'A': 125}
+#### mm above the highest labware that the pipette travels between labware
+CLEARANCE = 10
+#### Fixed times in seconds
+TIP_PICK_UP = 3.0
+TIP_DROP = 2.5
+BLOW_OUT = 1.0
+TOUCH_TIP = 2.0
+#### Height in mm of the fixed trash of the OT-2
+TRASH_HEIGHT = 82
+#### mm above the well bottom of aspirating and dispensing in a well
+WELL_BOTTOM_CLEARANCE = 1
+#### Phases of a run, in the order in which they are reported
+PHASES = ['aliquoting', 'transfers', 'mixing', 'tip handling', 'pauses']
+
+def slot_of(point):
+    """
+    Returns the deck slot that a point is in, or None if it is off the deck.
+    """
+    from data.user_storage.mollab_modules import TransferOrdering as TO
+    for slot, (x, y) in TO.DECK_SLOTS.items():
+        if (x <= point.x <= x + TO.SLOT_SIZE[0] and
+            y <= point.y <= y + TO.SLOT_SIZE[1]):
+            return slot
+    return None
+
+def calling_phase():
+    """
+    Returns the phase of a pipetting step: 'aliquoting' if it is performed
+    by one of the aliquoting functions of the Pipetting_Modules, otherwise
+    'transfers'.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if ('mollab_modules' in code.co_filename and
+            not code.co_filename.endswith(('RunTimeEstimation.py',
+                                           'PipettingPlan.py'))):
+            if code.co_name.startswith('aliquoting'):
+                return 'aliquoting'
+            return 'transfers'
+        frame = frame.f_back
+    return 'transfers'
+
+class ParameterCollector:
+    """
+    Stands in for protocol_api.Parameters when add_parameters of a protocol
+    is called, and keeps the default value of every parameter.
+    """
+    def __init__(self):
+        self.defaults = {}
+
+    def _add(self, variable_name = None, default = None, **kwargs):
+        self.defaults[variable_name] = default
+
+    add_bool = add_int = add_float = add_str = _add
+
+class TimingProtocol:
+    """
+    Stands in for the ProtocolContext while a protocol is simulated.
+    Everything is passed on to the simulated ProtocolContext, but loaded
+    pipettes are TimingPipettes and delays and pauses are timed.
+    """
+    def __init__(self, protocol, params, manual_pause_time = 0):
+        self.protocol = protocol
+        self.params = params
+        self.manual_pause_time = manual_pause_time
+        self.times = {phase: 0 for phase in PHASES}
+        self.manual_pauses = 0
+        self.pipettes = {}
+
+    def __getattr__(self, name):
+        return getattr(self.protocol, name)
+
+    def adding(self, phase, seconds):
+        self.times[phase] += seconds
+
+    def travel_height(self):
+        """
+        Height in mm at which the pipettes travel between labware.
+        """
+        heights = [labware.highest_z
+                   for labware in self.protocol.loaded_labwares.values()]
+        return max(heights, default = 0) + CLEARANCE
+
+    def load_instrument(self, instrument_name, mount, *args, **kwargs):
+        pipette = self.protocol.load_instrument(instrument_name, mount,
+                                                *args, **kwargs)
+        self.pipettes[pipette.mount] = TimingPipette(pipette, self)
+        return self.pipettes[pipette.mount]
+
+    @property
+    def loaded_instruments(self):
+        return dict(self.pipettes)
+
+    def delay(self, seconds = 0, minutes = 0, msg = None):
+        self.adding('pauses', minutes * 60 + seconds)
+        return self.protocol.delay(seconds = seconds, minutes = minutes,
+                                   msg = msg)
+
+    def pause(self, msg = None):
+        self.manual_pauses += 1
+        self.adding('pauses', self.manual_pause_time)
+        return self.protocol.pause(msg)
+
+class TimingPipette:
+    """
+    Stands in for a loaded pipette while a protocol is simulated. Every step
+    is passed on to the simulated pipette and its time is added to the
+    TimingProtocol.
+    """
+    def __init__(self, pipette, timing):
+        object.__setattr__(self, 'pipette', pipette)
+        object.__setattr__(self, 'timing', timing)
+        object.__setattr__(self, 'position', None)
+        if pipette.mount == 'left':
+            object.__setattr__(self, 'z_speed', MAX_SPEEDS['Z'])
+        else:
+            object.__setattr__(self, 'z_speed', MAX_SPEEDS['A'])
+
+    def __getattr__(self, name):
+        return getattr(self.pipette, name)
+
+    def __setattr__(self, name, value):
+        # e.g. pipette.starting_tip = tip_rack.well('A1')
+        setattr(self.pipette, name, value)
+
+    def _moving(self, point, phase):
+        """
+        Adds the time to move from the current position to a point: up to a
+        safe height, over the deck and down again.
+        """
+        start = self.position
+        object.__setattr__(self, 'position', point)
+        if start is None:
+            return
+        ### Within the same slot, the pipette stays at the current height
+        if slot_of(start) == slot_of(point):
+            travel_z = max(start.z, point.z)
+        else:
+            travel_z = max(self.timing.travel_height(), start.z, point.z)
+        z_time = ((travel_z - start.z) + (travel_z - point.z)) / self.z_speed
+        xy_time = max(abs(point.x - start.x) / MAX_SPEEDS['X'],
+                      abs(point.y - start.y) / MAX_SPEEDS['Y'])
+        self.timing.adding(phase, z_time + xy_time)
+
+    def _locating(self, location, phase):
+        """
+        Moves to a well or a location (well.bottom() / well.top()).
+        """
+        if location is None:
+            return
+        if hasattr(location, 'point'):
+            point = location.point
+        else:
+            point = location.bottom(WELL_BOTTOM_CLEARANCE).point
+        self._moving(point, phase)
+
+    def _trash(self):
+        """
+        Location above the trash, also for a TrashBin without wells.
+        """
+        trash = self.pipette.trash_container
+        if hasattr(trash, 'wells'):
+            return trash.wells()[0].top()
+        from opentrons.types import Location, Point
+        from data.user_storage.mollab_modules import TransferOrdering as TO
+        return Location(Point(TO.TRASH[0], TO.TRASH[1], TRASH_HEIGHT), None)
+
+    def _plunger(self, volume, flow_rate, phase):
+        if volume:
+            self.timing.adding(phase, volume / flow_rate)
+
+    def pick_up_tip(self, location = None, *args, **kwargs):
+        self.pipette.pick_up_tip(location, *args, **kwargs)
+        if location is None:
+            location = self.pipette._last_tip_picked_up_from
+        if not hasattr(location, 'point'):
+            location = location.top()
+        self._locating(location, 'tip handling')
+        self.timing.adding('tip handling', TIP_PICK_UP)
+        return self
+
+    def drop_tip(self, location = None, *args, **kwargs):
+        self.pipette.drop_tip(location, *args, **kwargs)
+        if location is None:
+            location = self._trash()
+        self._locating(location, 'tip handling')
+        self.timing.adding('tip handling', TIP_DROP)
+        return self
+
+    def return_tip(self, *args, **kwargs):
+        location = self.pipette._last_tip_picked_up_from
+        self.pipette.return_tip(*args, **kwargs)
+        self._moving(location.top().point, 'tip handling')
+        self.timing.adding('tip handling', TIP_DROP)
+        return self
+
+    def aspirate(self, volume = None, location = None, rate = 1.0,
+                 *args, **kwargs):
+        phase = calling_phase()
+        self._locating(location, phase)
+        self.pipette.aspirate(volume, location, rate, *args, **kwargs)
+        self._plunger(volume, self.pipette.flow_rate.aspirate * rate, phase)
+        return self
+
+    def dispense(self, volume = None, location = None, rate = 1.0,
+                 *args, **kwargs):
+        phase = calling_phase()
+        if volume is None:
+            volume = self.pipette.current_volume
+        self._locating(location, phase)
+        self.pipette.dispense(volume, location, rate, *args, **kwargs)
+        self._plunger(volume, self.pipette.flow_rate.dispense * rate, phase)
+        return self
+
+    def air_gap(self, volume = None, height = None):
+        phase = calling_phase()
+        self.pipette.air_gap(volume, height)
+        self._plunger(volume, self.pipette.flow_rate.aspirate, phase)
+        return self
+
+    def mix(self, repetitions = 1, volume = None, location = None,
+            rate = 1.0):
+        self._locating(location, 'mixing')
+        self.pipette.mix(repetitions, volume, location, rate)
+        if volume is None:
+            volume = self.pipette.max_volume
+        self.timing.adding('mixing', repetitions * (
+            volume / (self.pipette.flow_rate.aspirate * rate) +
+            volume / (self.pipette.flow_rate.dispense * rate)))
+        return self
+
+    def blow_out(self, location = None):
+        phase = calling_phase()
+        self._locating(location, phase)
+        self.pipette.blow_out(location)
+        self.timing.adding(phase, BLOW_OUT)
+        return self
+
+    def touch_tip(self, *args, **kwargs):
+        self.pipette.touch_tip(*args, **kwargs)
+        self.timing.adding(calling_phase(), TOUCH_TIP)
+        return self
+
+    def move_to(self, location, *args, **kwargs):
+        self._locating(location, calling_phase())
+        self.pipette.move_to(location, *args, **kwargs)
+        return self
+
+#==============================================================================
+
+def reading_labware(labware_folder = 'labware'):
+    """
+    Reads all custom labware definitions, so the simulator can load them.
+
+    Parameters
+    ----------
+    labware_folder : string
+        Optional, default 'labware'. Folder with the labware definitions
+
+    Returns
+    -------
+    extra_labware : dict
+        Labware definition per load name
+    """
+    from data.user_storage.mollab_modules import LabWare_v2 as LW
+
+    return LW.labware_registry(labware_folder).all_definitions()
+
+def estimating_protocol(protocol_file,
+                        parameters = False,
+                        manual_pause_time = 0,
+                        labware_folder = 'labware'):
+    """
+    Simulates a protocol and estimates how long it takes on the robot.
+
+    Parameters
+    ----------
+    protocol_file : string
+        Path to the protocol, e.g. 'Protocol_database/EVE/qPCR/qPCR_V4.5.py'
+    parameters : Boolean False or dict
+        Optional, default False. Values for the parameters of the protocol
+        (add_parameters) per variable_name, other parameters are default.
+    manual_pause_time : float
+        Optional, default 0. Seconds that every protocol.pause() is expected
+        to take before someone resumes the run
+    labware_folder : string
+        Optional, default 'labware'. Folder with the custom labware
+
+    Raises
+    ------
+    Exception
+        If a parameter is given that the protocol does not have
+
+    Returns
+    -------
+    times : dict
+        Estimated seconds per phase, see PHASES
+    """
+    import importlib.util
+    import types
+    from opentrons import simulate
+
+    #### Load the protocol file as a module
+    spec = importlib.util.spec_from_file_location('estimated_protocol',
+                                                  protocol_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    #### Collect the default parameters and replace the given ones
+    collector = ParameterCollector()
+    if hasattr(module, 'add_parameters'):
+        module.add_parameters(collector)
+    for name, value in (parameters or {}).items():
+        if name not in collector.defaults:
+            raise Exception(f"{protocol_file} has no parameter {name}")
+        collector.defaults[name] = value
+    params = types.SimpleNamespace(**collector.defaults)
+
+    #### Simulate the protocol while timing every step
+    api_level = getattr(module, 'requirements', {}).get('apiLevel', '2.18')
+    protocol = simulate.get_protocol_api(
+        api_level, extra_labware = reading_labware(labware_folder))
+    timing = TimingProtocol(protocol, params, manual_pause_time)
+    module.run(timing)
+
+    return timing.times
+
+def reporting_run_time(times):
+    """
+    Returns a text with the estimated time per phase and the total time.
+    """
+    lines = [f"{phase:<14}{round(times[phase] / 60, 1):>8} min"
+             for phase in PHASES]
+    lines.append(f"{'total':<14}{round(sum(times.values()) / 60, 1):>8} min")
+
+    return "\n".join(lines)
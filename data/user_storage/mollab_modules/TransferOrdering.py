@@ -0,0 +1,175 @@
+"""
+version: Jan_2024
+Module to reorder independent transfers (e.g. samples that are pooled) so that
+the gantry travels less. Every transfer is: pick up the next tip, aspirate
+from the source, dispense in the destination and drop the tip in the trash.
+Tips are picked up in a fixed order, so the order of the transfers decides
+which source well is visited after which tip. The well positions of custom
+labware come from the stored geometry of LabwareGeometry.
+"""
+import math
+
+#### Front-left corner of every deck slot of the OT-2 in mm, from the deck
+#### definition. Slot 12 holds the fixed trash.
+DECK_SLOTS = {'1': (0.0, 0.0),    '2': (132.5, 0.0),   '3': (265.0, 0.0),
+              '4': (0.0, 90.5),   '5': (132.5, 90.5),  '6': (265.0, 90.5),
+              '7': (0.0, 181.0),  '8': (132.5, 181.0), '9': (265.0, 181.0),
+              '10': (0.0, 271.5), '11': (132.5, 271.5),'12': (265.0, 271.5)}
+SLOT_SIZE = (127.76, 85.48)
+TRASH = (DECK_SLOTS['12'][0] + SLOT_SIZE[0] / 2,
+         DECK_SLOTS['12'][1] + SLOT_SIZE[1] / 2)
+
+def slot_position(slot):
+    """
+    Returns the (x, y) of the centre of a deck slot in mm.
+    """
+    x, y = DECK_SLOTS[str(slot)]
+    return x + SLOT_SIZE[0] / 2, y + SLOT_SIZE[1] / 2
+
+def well_position(well):
+    """
+    Returns the (x, y) of a well on the deck in mm.
+    """
+    point = well.top().point
+    return point.x, point.y
+
+def well_positions(wells):
+    """
+    Returns the (x, y) of every well on the deck in mm. For custom labware
+    only the first well of the labware is located on the deck, the other 
+    wells are placed relative to it with the stored geometry (see 
+    LabwareGeometry.labware_geometry). Wells of other labware are located 1
+    by 1, see well_position.
+    """
+    from data.user_storage.mollab_modules import LabwareGeometry as LG
+
+    #### Wells per labware
+    labwares = {}
+    for i, well in enumerate(wells):
+        labwares.setdefault(id(well.parent), (well.parent, []))[1].append(i)
+
+    positions = [None] * len(wells)
+    for labware, indexes in labwares.values():
+        geometry = None
+        if not labware.uri.startswith('opentrons/'):
+            try:
+                geometry = LG.labware_geometry(labware.load_name)
+            except Exception:
+                geometry = None
+        if geometry is None:
+            for i in indexes:
+                positions[i] = well_position(wells[i])
+            continue
+        ## The first well of the table is the first well of the labware
+        first_x, first_y = well_position(labware.wells()[0])
+        table = geometry.table[geometry.rows([wells[i].well_name 
+                                              for i in indexes]), :2]
+        for i, (x, y) in zip(indexes, table - geometry.table[0, :2]):
+            positions[i] = (first_x + float(x), first_y + float(y))
+
+    return positions
+
+def distance(a, b):
+    """
+    Straight line distance in mm between 2 (x, y) positions.
+    """
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+def tip_positions(pipette, plan):
+    """
+    Returns the (x, y) of the tips this pipette will pick up next, in the
+    order in which it picks them up. Tips already picked up in the plan are
+    skipped.
+    """
+    #### All tips of all tip racks, starting at the starting tip
+    tips = [tip for rack in pipette.tip_racks for tip in rack.wells()]
+    starting_tip = getattr(getattr(pipette, 'pipette', pipette),
+                           'starting_tip', None)
+    if starting_tip in tips:
+        tips = tips[tips.index(starting_tip):]
+    #### A multichannel pipette picks up a full column of tips at once
+    if pipette.channels == 8:
+        tips = [tip for tip in tips if tip.well_name.startswith('A')]
+    tips = tips[plan.count('pick_up_tip', pipette.mount):]
+
+    return well_positions(tips)
+
+def route_length(order, tips, sources, destinations):
+    """
+    Gantry travel in mm for performing the transfers in this order:
+    trash -> tip -> source -> destination -> trash, for every transfer.
+    """
+    length = 0
+    for k, i in enumerate(order):
+        tip = tips[k % len(tips)]
+        length += (distance(TRASH, tip) + distance(tip, sources[i]) +
+                   distance(sources[i], destinations[i]) +
+                   distance(destinations[i], TRASH))
+
+    return length
+
+def ordering_transfers(transfers, pipette, plan):
+    """
+    Reorders transfers that can be performed in any order, so that every tip
+    is used for a source well close by. Starts with nearest neighbour (the
+    closest source to every next tip) and improves that by swapping pairs of
+    transfers (2-opt) until no swap shortens the route.
+
+    Parameters
+    ----------
+    transfers : list
+        List with a tuple per transfer, the first item is the source well and
+        the second item the destination well, e.g. (source, destination, µL)
+    pipette : labware definition
+        The pipette that performs all these transfers
+    plan : Plan
+        The plan the transfers are recorded in, to know which tips are used
+
+    Returns
+    -------
+    transfers : list
+        The same transfers in the new order
+    saved : float
+        Predicted gantry travel in mm that is saved with the new order
+    """
+    if len(transfers) < 2 or not pipette:
+        return transfers, 0
+
+    #### Positions of the tips, sources and destinations
+    tips = tip_positions(pipette, plan)
+    if not tips:
+        return transfers, 0
+    sources = well_positions([transfer[0] for transfer in transfers])
+    destinations = well_positions([transfer[1] for transfer in transfers])
+
+    def cost(k, i):
+        # Travel that depends on the order: from tip k to source i
+        return distance(tips[k % len(tips)], sources[i])
+
+    #### Nearest neighbour: every next tip goes to the closest source left
+    remaining = list(range(len(transfers)))
+    order = []
+    for k in range(len(transfers)):
+        nearest = min(remaining, key = lambda i: cost(k, i))
+        remaining.remove(nearest)
+        order.append(nearest)
+
+    #### 2-opt: swap 2 transfers if that shortens the route
+    improved = True
+    while improved:
+        improved = False
+        for a in range(len(order) - 1):
+            for b in range(a + 1, len(order)):
+                delta = (cost(a, order[b]) + cost(b, order[a]) -
+                         cost(a, order[a]) - cost(b, order[b]))
+                if delta < -1e-6:
+                    order[a], order[b] = order[b], order[a]
+                    improved = True
+
+    #### Predicted travel saved
+    saved = (route_length(range(len(transfers)), tips, sources, destinations)
+             - route_length(order, tips, sources, destinations))
+    if saved <= 0:
+        return transfers, 0
+
+    return [transfers[i] for i in order], saved
@@ -1,77 +1,145 @@
 """
 version: Jan_2024
+Module to calculate the liquid height in a tube from the volume in it. The
+tubes are modelled as a conical tip (a frustum) with a slightly conical body
+on top. A table with the height at every volume is made once per tube type
+when this module is imported, and heights are interpolated from that table.
 """
+import numpy as np
 
-def cal_start_height(tube_type, start_volume):
-    """
-    Module to calculate the liquid height in a tube at the start of the run
-    Parameters
-    ----------
-    tube_type : brand / size
-        '1.5mL_tubes' / '5mL_screwcap_tubes' / '5mL_snapcap_tubes' / '15mL_tubes' / '50mL_tubes'
-    start_vol : int
-        exact volume in µL that is present in the reagent tube(s) at the start
-
-    Returns
-    -------
-    start_height : float
-        height in mm from the bottom of the tube
-
-    """
-    #### Import math module to allow using π in calculations
-    import math 
-    
-    #### Defining tube_type dimensions, based on labware blueprints
-    tube_dimensions = {
+#### Tube dimensions in mm, from labware/available_labware_dimensions.txt 
+#### (copied, because on the robot only data/user_storage is available)
+#### diameter_top : inner diameter at the top of the tube
+#### diameter_top2 : inner diameter where the conical tip starts
+#### diameter_tip : inner diameter at the bottom of the conical tip
+#### height_tube : inner height of the entire tube
+#### height_conical_tip : height of the conical tip
+#### max_fill_height : highest liquid level that is safe to pipette in
+TUBE_DIMENSIONS = {
     '1.5mL_tubes': {
-        'diameter_top': 8.7,
+        'diameter_top': 9.85,
+        'diameter_top2': 8.7,
         'diameter_tip': 3.6,
-        'height_conical_tip': 17.8},
+        'height_tube': 37.8,
+        'height_conical_tip': 17.8,
+        'max_fill_height': 35},
     '5mL_screwcap_tubes': {
         'diameter_top': 13,
+        'diameter_top2': 13,
         'diameter_tip': 3.3,
-        'height_conical_tip': 66.1 - 43.6 - 1.3},
+        'height_tube': 64.8,
+        'height_conical_tip': 66.1 - 43.6 - 1.3,
+        'max_fill_height': 60},
     '5mL_snapcap_tubes': {
-        'diameter_top': 13.3,
+        'diameter_top': 14.8,
+        'diameter_top2': 13.3,
         'diameter_tip': 3.3,
-        'height_conical_tip': 55.4 - 2.2 - 34.12},
+        'height_tube': 55.4,
+        'height_conical_tip': 19.08,
+        'max_fill_height': 50},
     '15mL_tubes': {
         'diameter_top': 15.16,
+        'diameter_top2': 13.35,
         'diameter_tip': 2.16,
-        'height_conical_tip': 22.1},
+        'height_tube': 118.1,
+        'height_conical_tip': 22.1,
+        'max_fill_height': 100},
     '50mL_tubes': {
         'diameter_top': 27.48,
+        'diameter_top2': 25.65,
         'diameter_tip': 4.7,
-        'height_conical_tip': 15.3}} 
+        'height_tube': 113.3,
+        'height_conical_tip': 15.3,
+        'max_fill_height': 100}}
+
+#### mm that the pipette tip is below the liquid surface when aspirating
+IMMERSION_DEPTH = 3
+#### Lowest height in mm above the bottom at which the pipette aspirates
+MIN_PIPETTING_HEIGHT = 2
+#### Height step in mm of the height tables
+TABLE_STEP = 0.05
+
+def frustum_volume(height, radius_bottom, radius_top):
+    """
+    Volume in µL (mm³) of a frustum v = (1/3)*π*h*(r²+r*R+R²)
+    """
+    return (1/3) * np.pi * height * (radius_bottom**2 + 
+                                     radius_bottom * radius_top + 
+                                     radius_top**2)
+
+def making_height_table(dimensions):
+    """
+    Makes a table with the volume in µL at every height in the tube.
+
+    Parameters
+    ----------
+    dimensions : dict
+        Dimensions of 1 tube type, see TUBE_DIMENSIONS
+
+    Returns
+    -------
+    heights : numpy array
+        heights in mm from the bottom of the tube, in steps of TABLE_STEP
+    volumes : numpy array
+        volume in µL below every height
+    """
+    radius_top = dimensions['diameter_top'] / 2
+    radius_top2 = dimensions['diameter_top2'] / 2
+    radius_tip = dimensions['diameter_tip'] / 2
+    height_tip = dimensions['height_conical_tip']
+    height_body = dimensions['height_tube'] - height_tip
     
-    #### Calculate radiuses (diameter / 2)
-    radius_top = tube_dimensions[tube_type]['diameter_top']/ 2
-    radius_tip = tube_dimensions[tube_type]['diameter_tip']/ 2
+    heights = np.arange(0, dimensions['height_tube'] + TABLE_STEP, TABLE_STEP)
     
-    #### Calculate the volume of the conical tip v = (1/3)*π*h*(r²+r*R+R²)
-    vol_conical_tip = ((1/3)*math.pi*tube_dimensions[tube_type]['diameter_tip']*
-                       ((radius_tip**2) + (radius_tip*radius_top) +
-                        (radius_top**2)))
-
-    #### Calculating start height
-    cylinder_vol = start_volume - vol_conical_tip
-    start_height = (tube_dimensions[tube_type]['diameter_tip'] +
-                    (cylinder_vol / (math.pi*((radius_top)**2))))
-        # start_height = height_conical_tip + height_cylindrical_part
+    #### Conical tip: the radius grows from radius_tip to radius_top2
+    tip_heights = np.minimum(heights, height_tip)
+    radius = radius_tip + (radius_top2 - radius_tip) * tip_heights / height_tip
+    volumes = frustum_volume(tip_heights, radius_tip, radius)
     
-    #### Some tweaks
-    if tube_type == '50mL_tubes':
-        start_height = start_height + 1.7
-    elif tube_type == '15mL_tubes':
-        start_height = start_height + 12.5
-    elif tube_type == '5mL_screwcap_tubes':
-        start_height = start_height + 4
-    elif tube_type == '5mL_snapcap_tubes':
-        start_height = start_height + 4    
-    elif tube_type == '1.5mL_tubes':
-        start_height = start_height + 7  
+    #### Body: the radius grows from radius_top2 to radius_top
+    body_heights = np.maximum(heights - height_tip, 0)
+    radius = radius_top2 + (radius_top - radius_top2) * body_heights / height_body
+    volumes = volumes + frustum_volume(body_heights, radius_top2, radius)
     
-    return start_height  
+    return heights, volumes
+
+#### The height tables of all tube types, made once
+HEIGHT_TABLES = {tube_type: making_height_table(dimensions)
+                 for tube_type, dimensions in TUBE_DIMENSIONS.items()}
+
+def volume_to_height(tube_type, volumes):
+    """
+    Height in mm of the liquid surface above the bottom of the tube, for 1
+    volume or for a list/array of volumes at once.
+    """
+    heights, table_volumes = HEIGHT_TABLES[tube_type]
+    return np.interp(volumes, table_volumes, heights)
+
+def height_to_volume(tube_type, heights):
+    """
+    Volume in µL in the tube when the liquid surface is at this height, for
+    1 height or for a list/array of heights at once.
+    """
+    table_heights, volumes = HEIGHT_TABLES[tube_type]
+    return np.interp(heights, table_heights, volumes)
+
+def cal_start_height(tube_type, start_volume):
+    """
+    Module to calculate the liquid height in a tube at the start of the run
+    Parameters
+    ----------
+    tube_type : brand / size
+        '1.5mL_tubes' / '5mL_screwcap_tubes' / '5mL_snapcap_tubes' / '15mL_tubes' / '50mL_tubes'
+    start_vol : int
+        exact volume in µL that is present in the reagent tube(s) at the start
+
+    Returns
+    -------
+    start_height : float
+        height in mm from the bottom of the tube
+
+    """
+    return float(volume_to_height(tube_type, start_volume))
 
 def volume_tracking(tube_type, dispension_vol, current_height, direction):  
     """
@@ -83,7 +151,7 @@ def volume_tracking(tube_type, dispension_vol, current_height, direction):
     Parameters
     ----------
     tube_type : brand / size
-        'tube_1.5mL' / 'tube_5mL' / 'tube_15mL' / 'tube_50mL'
+        '1.5mL_tubes' / '5mL_screwcap_tubes' / '5mL_snapcap_tubes' / '15mL_tubes' / '50mL_tubes'
     dispension_vol : int
         volume in µL that you want to dispense
     current_height : float
@@ -96,81 +164,218 @@ def volume_tracking(tube_type, dispension_vol, current_height, direction):
     current_height : float
         height in mm of the current volume from the bottom of the tube
     pip_height : float
-        current_height - 5, to make sure the tip is submerged
+        current_height - IMMERSION_DEPTH, to make sure the tip is submerged
+        (when filling at least MIN_PIPETTING_HEIGHT)
     bottom_reached : boolean True or False
         Safety measure, indicates that the bottom of the tube is reached
     """
-    #### Import math module to allow using π in calculations
-    import math
+    current_heights, pip_heights, bottom_reached = tracking_heights(
+        tube_type, 
+        height_to_volume(tube_type, current_height), 
+        [dispension_vol], 
+        direction)
     
-    #### Defining tube_type dimensions, based on labware blueprints
-    tube_dimensions = {
-    '1.5mL_tubes': {
-        'diameter_top': 8.7,
-        'height': 37.8,
-        'max_fill_height': 35},
-    '5mL_screwcap_tubes': {
-        'diameter_top': 13,
-        'height': 64.8,
-        'max_fill_height': 60},
-    '5mL_snapcap_tubes': {
-        'diameter_top': 13.3,
-        'height': 55.4,
-        'max_fill_height': 50},
-    '15mL_tubes': {
-        'diameter_top': 15.16,
-        'height': 118.1,
-        'max_fill_height': 100},
-    '50mL_tubes': {
-        'diameter_top': 27.48,
-        'height': 113.3,
-        'max_fill_height': 100}} 
-
- 
-    #### Calculate delta_height of the specified volume      
-    radius = tube_dimensions[tube_type]['diameter_top'] / 2
-    delta_height =  (dispension_vol/(math.pi*((radius)**2))) #h = v/(π*r²)
-
-    #### Update current_height 
-    if direction == 'emptying': 
-        current_height = current_height - delta_height
-    elif direction == 'filling': 
-        current_height = current_height + delta_height
-        ## The current_height (after aspiration) must be updated before the
-        ## actual aspiration, because during aspiration the liquid will reach 
-        ## that level.
-
-    #### Tweaks
-    if tube_type == '15mL_tubes':
-        height_conical_tip = 22.1   #tube - straight part
-        offset_height = height_conical_tip + 18 
-        ## offset_height = height from where to start using
-        ## current_height - 1 so that the pipette tip stays submerged
-        if current_height < offset_height:
-            current_height = current_height - 1
-    ## Volume tracking when assuming the entire tube is cylindrical doesn't
-    ## work very well with a 15 mL tube. Therefore, we need to adjust some
-    ## values so that we do the volume tracking as good as possible.       
-    ## start_height is already adjusted so that we start a little heigher,
-    ## however at the offset_height the pipette didn't reach the liquid     
-    ## anymore. So we lower the current_height with 1 so that the pipette   
-    ## tip is always submerged and the entire tube is emptied.              
-
-    #### Determine the height at which to pipette
-    pip_height = current_height - 5
-    ## Make sure that the pipette tip is always submerged by       
-    ## setting the current height 5 mm below the reagent surface   
+    return (float(current_heights[0]), float(pip_heights[0]), 
+            bool(bottom_reached[0]))
+
+def tracking_heights(tube_type, start_volume, volumes, direction):
+    """
+    Volume tracking for a whole list of aspirations (or dispenses) at once.
+
+    Parameters
+    ----------
+    tube_type : string
+        '1.5mL_tubes' / '5mL_screwcap_tubes' / '5mL_snapcap_tubes' / '15mL_tubes' / '50mL_tubes'
+    start_volume : float
+        volume in µL in the tube before the first aspiration
+    volumes : list
+        volume in µL of every aspiration (or dispense), in order
+    direction : string
+        is the tube being emptied or filled? 'emptying' / 'filling'
 
+    Returns
+    -------
+    current_heights : numpy array
+        height in mm of the liquid surface after every aspiration
+    pip_heights : numpy array
+        height in mm at which every aspiration (dispense) is done, with the 
+        tip IMMERSION_DEPTH below the liquid surface after aspirating. A 
+        dispense is never done below MIN_PIPETTING_HEIGHT.
+    bottom_reached : numpy array
+        True for the aspirations that would go below MIN_PIPETTING_HEIGHT 
+        (or for dispenses above the max_fill_height)
+    """
+    volumes = np.asarray(volumes, dtype = float)
+    #### The surface after aspirating, the tip has to stay submerged until 
+    #### the aspiration is finished. When filling, the surface after 
+    #### dispensing.
+    if direction == 'emptying':
+        current_volumes = start_volume - np.cumsum(volumes)
+    elif direction == 'filling':
+        current_volumes = start_volume + np.cumsum(volumes)
+    current_heights = volume_to_height(tube_type, current_volumes)
+    pip_heights = current_heights - IMMERSION_DEPTH
+    ## An (almost) empty tube is filled from just above the bottom
+    if direction == 'filling':
+        pip_heights = np.maximum(pip_heights, MIN_PIPETTING_HEIGHT)
+    
     #### Determine whether the pipette is reaching the bottom of the tube
     if direction == 'emptying':
-        bottom_reached = False
-        if pip_height - delta_height <= 2:
-            bottom_reached = True
-        # not thoroughly tested yet for other tubes then tubes_5mL!!!
+        bottom_reached = ((current_volumes < 0) | 
+                          (pip_heights < MIN_PIPETTING_HEIGHT))
     elif direction == 'filling':
-        bottom_reached = False
-        if pip_height + delta_height > tube_dimensions[tube_type]['max_fill_height']:
-            bottom_reached = True
+        bottom_reached = (current_heights > 
+                          TUBE_DIMENSIONS[tube_type]['max_fill_height'])
+    
+    return current_heights, pip_heights, bottom_reached
+
+class VolumeTracker:
+    """
+    Keeps track of the volume and liquid height in a set of tubes with the 
+    same reagent, e.g. the reagent tubes that are aliquoted from or the pool 
+    tubes that are pooled in. Returns the location where the next volume is 
+    aspirated or dispensed, and continues with the next tube when a tube is 
+    empty or full.
+    
+    Parameters
+    ----------
+    tubes : list
+        List of tube(s) with the same reagent, in the order of use
+    tube_type : string or list
+        '1.5mL_tubes' / '5mL_screwcap_tubes' / '5mL_snapcap_tubes' / 
+        '15mL_tubes' / '50mL_tubes', or a list with a tube_type per tube
+    start_volume : float or list
+        exact volume in µL that is present in the tube(s) at the start, or a 
+        list with a volume per tube
+    action_at_bottom : string
+        Optional, default 'next_tube'. What to do when a tube is empty:
+        'next_tube' / 'continue_at_bottom' / 'raise_error'
+    max_volume : Boolean False or float
+        Optional, default False. If filling, the volume in µL that is added
+        to 1 tube before continuing with the next tube
+    comment : Boolean False or function
+        Optional, default False. Function that is called with a message when
+        continuing with the next tube, e.g. protocol.comment
+    """
+    __slots__ = ('tubes', 'tube_types', 'start_volumes', 'counter', 
+                 'volumes', 'heights', 'added_volume', 'pip_height',
+                 'action_at_bottom', 'max_volume', 'comment')
+    
+    def __init__(self, tubes, tube_type, start_volume, 
+                 action_at_bottom = 'next_tube', max_volume = False, 
+                 comment = False):
+        if not isinstance(tube_type, list):
+            tube_type = [tube_type] * len(tubes)
+        if not isinstance(start_volume, list):
+            start_volume = [start_volume] * len(tubes)
+        self.tubes = tubes
+        self.tube_types = tube_type
+        self.start_volumes = start_volume
+        self.volumes = list(start_volume)
+        self.heights = [cal_start_height(tube_type, volume) 
+                        for tube_type, volume in zip(tube_type, start_volume)]
+        self.counter = 0
+        self.added_volume = 0
+        self.pip_height = max(self.heights[0] - IMMERSION_DEPTH,
+                              MIN_PIPETTING_HEIGHT)
+        self.action_at_bottom = action_at_bottom
+        self.max_volume = max_volume
+        self.comment = comment
+        
+    @property
+    def tube(self):
+        """
+        The tube that is used at this moment.
+        """
+        return self.tubes[self.counter]
+    
+    def _tracking(self, volume, direction):
+        """
+        Calculates the height in the current tube after adding or removing
+        the volume, see volume_tracking.
+        """
+        return volume_tracking(self.tube_types[self.counter],
+                               volume,
+                               self.heights[self.counter],
+                               direction)
+    
+    def _updating(self, volume, current_height, pip_height):
+        """
+        Stores the new volume (negative when emptying) and height of the 
+        current tube.
+        """
+        self.heights[self.counter] = current_height
+        self.pip_height = pip_height
+        self.volumes[self.counter] += volume
+        if volume > 0:
+            self.added_volume += volume
+    
+    def _next_tube(self):
+        """
+        Continues with the next tube, returns False if there is none.
+        """
+        if self.counter + 1 == len(self.tubes):
+            return False
+        self.counter += 1
+        self.added_volume = 0
+        self.pip_height = max(self.heights[self.counter] - IMMERSION_DEPTH,
+                              MIN_PIPETTING_HEIGHT)
+        if self.comment:
+            self.comment(f"Continue with tube {self.counter + 1} of reagent")
+        return True
+    
+    def next_aspiration_location(self, volume):
+        """
+        Returns the location to aspirate the volume from, just below the 
+        liquid surface.
+        """
+        current_height, pip_height, bottom_reached = self._tracking(
+            volume, 'emptying')
         
+        #### What to do when the bottom of the tube is reached        
+        while bottom_reached:
+            ### Continue with next tube
+            if self.action_at_bottom == 'next_tube':
+                if not self._next_tube():
+                    raise Exception("There are not enough tubes with reagent "
+                                    "to run this protocol")
+                current_height, pip_height, bottom_reached = self._tracking(
+                    volume, 'emptying')
+            
+            ### Keep pipetting from the bottom
+            elif self.action_at_bottom == 'continue_at_bottom':
+                self._updating(-volume, current_height, pip_height)
+                if self.comment:
+                    self.comment("You've reached the bottom of the tube!")
+                return self.tube.bottom()
+            
+            ### Raise an error
+            else:
+                raise Exception("There is not enough reagent to run this "
+                                "protocol")
+        
+        self._updating(-volume, current_height, pip_height)
+        return self.tube.bottom(pip_height)
     
-    return current_height, pip_height, bottom_reached
\ No newline at end of file
+    def next_dispense_location(self, volume):
+        """
+        Returns the location to dispense the volume in, just below the liquid 
+        surface. Continues with the next tube if the tube is full or if 
+        max_volume is added to it. The last tube is filled until the end, 
+        with a comment when it is filled above its max_fill_height.
+        """
+        if (self.max_volume and self.added_volume > 0 and
+            self.added_volume + volume > self.max_volume):
+            self._next_tube()
+        
+        current_height, pip_height, top_reached = self._tracking(
+            volume, 'filling')
+        if top_reached and self._next_tube():
+            current_height, pip_height, top_reached = self._tracking(
+                volume, 'filling')
+        if top_reached and self.comment:
+            self.comment(f"Tube {self.counter + 1} is filled above its "
+                         f"max_fill_height, there is no next tube")
+        
+        self._updating(volume, current_height, pip_height)
+        return self.tube.bottom(pip_height)
@@ -0,0 +1,123 @@
+"""
+version: Jan_2024
+Module to select wells/tubes from one or more racks by index, without
+building and copying lists of wells. All wells of the racks are numbered in
+a flat index with integer coordinates (rack, column, row). Selections are
+arrays of positions in that index, and the Opentrons wells are only looked
+up when they are asked for. LabWare_v2.tube_locations and 
+LabWare_v2.multiple_tube_locations select their tubes with it, so every 
+protocol on LabWare_v2 uses it, e.g. the pool_template_protocols that 
+ProtocolGenerator fills in.
+"""
+import numpy as np
+
+class WellSelector:
+    """
+    Flat index of the wells of a list of racks.
+
+    Parameters
+    ----------
+    racks : list
+        List with loaded racks/plates, in the order of use
+    specific_columns : Boolean False or list
+        Optional, default False. Only use these columns (by name, e.g.
+        ['1', '6']) of every rack, e.g. for PCR strips
+    order : string
+        Optional, default 'column'. 'column': A1, B1, C1 ... like
+        rack.wells(), or 'row': A1, A2, A3 ... Racks are always used one
+        after the other.
+    """
+    __slots__ = ('racks', 'rack_wells', 'coordinates', 'well_indexes')
+
+    def __init__(self, racks, specific_columns = False, order = 'column'):
+        self.racks = racks
+        self.rack_wells = [None] * len(racks)
+        coordinates = []
+        well_indexes = []
+        for rack_index, rack in enumerate(racks):
+            ### Position of the first well of every column in rack.wells()
+            names = list(rack.columns_by_name())
+            columns = rack.columns()
+            firsts = [0]
+            for column in columns[:-1]:
+                firsts.append(firsts[-1] + len(column))
+            ## Specific columns are used in the given order
+            if specific_columns:
+                column_indexes = [names.index(name)
+                                  for name in specific_columns]
+            else:
+                column_indexes = range(len(columns))
+            for column_index in column_indexes:
+                for row_index in range(len(columns[column_index])):
+                    coordinates.append((rack_index, column_index, row_index))
+                    well_indexes.append(firsts[column_index] + row_index)
+        self.coordinates = np.array(coordinates, dtype = int).reshape(-1, 3)
+        self.well_indexes = np.array(well_indexes, dtype = int)
+
+        #### Row-major: sort on rack and row, the column order stays
+        if order == 'row':
+            sorting = np.lexsort((self.coordinates[:, 2],
+                                  self.coordinates[:, 0]))
+            self.coordinates = self.coordinates[sorting]
+            self.well_indexes = self.well_indexes[sorting]
+
+    def __len__(self):
+        return len(self.well_indexes)
+
+    def selecting(self, number = None, skip_wells = False, start = 0):
+        """
+        Returns the positions in the index of the selected wells.
+
+        Parameters
+        ----------
+        number : None or int
+            Optional, default None (all). How many wells to select
+        skip_wells : Boolean False or list
+            Optional, default False. Positions in the index to skip
+        start : int
+            Optional, default 0. Select from this position on (after
+            skipping)
+
+        Returns
+        -------
+        selection : numpy array
+        """
+        mask = np.ones(len(self), dtype = bool)
+        if skip_wells:
+            mask[list(skip_wells)] = False
+        selection = np.flatnonzero(mask)[start:]
+        if number is not None:
+            selection = selection[:number]
+        return selection
+
+    def allocating(self, amounts, skip_wells = False):
+        """
+        Divides the wells over reagents in 1 pass, every reagent gets the next
+        wells.
+
+        Parameters
+        ----------
+        amounts : list
+            Number of wells per reagent, in order
+        skip_wells : Boolean False or list
+            Optional, default False. Positions in the index to skip
+
+        Returns
+        -------
+        selections : list
+            Positions in the index per reagent
+        """
+        selection = self.selecting(skip_wells = skip_wells)
+        ends = np.cumsum(amounts)
+        starts = ends - np.asarray(amounts, dtype = int)
+        return [selection[start:end] for start, end in zip(starts, ends)]
+
+    def wells(self, selection):
+        """
+        Generator of the Opentrons wells of a selection.
+        """
+        for position in selection:
+            rack_index = self.coordinates[position, 0]
+            if self.rack_wells[rack_index] is None:
+                self.rack_wells[rack_index] = self.racks[rack_index].wells()
+            yield self.rack_wells[rack_index][self.well_indexes[position]]
@@ -1,25 +1,39 @@
 
-### change API version to 2.12!!
+### change API version to 2.18 or higher, for the robot parameter!!
 
 
-import pandas as pd
-  ## For accessing offset .csv file
+from data.user_storage.mollab_modules import LabwareOffsets as LO
+  ## For reading the offset .csv file, without pandas
 
 # OFFSETS======================================================================
 # =============================================================================
-# If not simulated, import the .csv from the robot with robot_specific 
-# labware off_set values
-if not simulate:
-    offsets = pd.read_csv(
-        "data/user_storage/mollab_modules/labware_offset.csv", sep=';'
-        )
-      ## import .csv
-    offsets = offsets.set_index('labware')
-      ## remove index column
+# The .csv with robot_specific labware off_set values is read by LabwareOffsets
+# when the offsets are set: labware_offset_<robot>.csv if the robot has its
+# own file, otherwise labware_offset.csv (next to the mollab_modules). If
+# there is no file or labware is not in it, setting the offsets raises; with
+# skip_missing = True that labware is left unchanged instead
+# =============================================================================
+
+
+# PARAMETERS===================================================================
+# =============================================================================
+def add_parameters(parameters: protocol_api.Parameters):
+    #### Robot, its offsets are read from labware_offset_<robot>.csv
+    parameters.add_str(variable_name="robot",
+                       display_name="robot",
+                       choices=[
+                           {"display_name": "WALL-E", "value": "WALL-E"},
+                           {"display_name": "EVE", "value": "EVE"},
+                           {"display_name": "MO", "value": "MO"},
+                           ],
+                       default="EVE")
 # =============================================================================
 
 
 # in de def
+    robot = protocol.params.robot
+      ## below API version 2.18, without parameters, use the robot name:
+      ## from opentrons import config; robot = config.name()
 
 # LOADING LABWARE AND PIPETTES=================================================
 # =============================================================================
@@ -56,12 +70,8 @@ if not simulate:
 # LABWARE OFFSET===============================================================    
 # =============================================================================
     if not simulate:
-        for labware in labwares:
-            offset_x = offsets.at[labwares[labware],'x_offset']
-            offset_y = offsets.at[labwares[labware],'y_offset']
-            offset_z = offsets.at[labwares[labware],'z_offset']
-            labware.set_offset(
-                x = offset_x, 
-                y = offset_y, 
-                z = offset_z)
+        LO.setting_offsets(labwares, robot)
+    ## Or, without the labwares dict, for all loaded labware at once:
+    ## LO.applying_offsets(protocol, robot)
+    ## The LabWare_v2 loaders do this when the robot is passed to them
 # =============================================================================    
\ No newline at end of file
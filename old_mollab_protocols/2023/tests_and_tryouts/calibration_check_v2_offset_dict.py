@@ -8,7 +8,10 @@
 # =============================================================================
 from opentrons import protocol_api
   ## Import opentrons protocol API v2.
-import pandas as pd
+from opentrons import config
+  ## For the name of the robot
+from data.user_storage.mollab_modules import LabwareOffsets as LO
+  ## For reading the offset .csv file of the robot, without pandas
 
 # =============================================================================
 
@@ -47,12 +50,8 @@ def run(protocol: protocol_api.ProtocolContext):
     of different labware
     """
 # =============================================================================
-    if not protocol.is_simulating:
-        offsets = pd.read_csv(
-            "data/user_storage/mollab_modules/labware_offset.csv", 
-            sep=';'
-            )
-        offsets = offsets.set_index('labware')
+    robot = config.name()
+      ## offsets from labware_offset_<robot name>.csv, or labware_offset.csv
 
 # LOADING LABWARE==============================================================
 # =============================================================================
@@ -117,7 +116,8 @@ def run(protocol: protocol_api.ProtocolContext):
             'opentrons_10_tuberack_falcon_4x50ml_6x15ml_conical', 
             6,                                      
             'large_tubes')
-        labwares[large_tubes] = '15mL_50mLtubes'
+        labwares[large_tubes] = '15mL_tubes' if tubes15mL else '50mL_tubes'
+          ## the offset file has no row for the rack, use the tubes tested
        
         
     ##### Loading pipettes
@@ -137,14 +137,7 @@ def run(protocol: protocol_api.ProtocolContext):
 # LABWARE OFFSET===============================================================    
 # =============================================================================
     if not protocol.is_simulating:    
-        for labware in labwares:
-            offset_x = offsets.at[labwares[labware],'x_offset']
-            offset_y = offsets.at[labwares[labware],'y_offset']
-            offset_z = offsets.at[labwares[labware],'z_offset']
-            labware.set_offset(
-                x = offset_x, 
-                y = offset_y, 
-                z = offset_z)
+        LO.setting_offsets(labwares, robot)
 # =============================================================================
 
 